@@ -0,0 +1,175 @@
+# -*- coding: utf-8 -*-
+"""
+本地动漫名称别名/模糊匹配，search_rss_items 查询 anime_title 时先在进程内解析，不需要再让 Gemini 重试拼写。
+
+  - 折叠: NFKC、统一大小写、繁体/日文新字体 -> 简体、平假名 -> 片假名、の/ノ/的/之 视为同一字、去掉空白和标点
+  - 别名词典: 已提取的 anime_title 按折叠后的形式归并，另可在 config.json 的 anime_aliases 中补充跨语言别名
+    (例如 赛马娘 <-> ウマ娘)
+  - 相似度索引: 折叠后字符 2-gram -> 取值，按查询 gram 的覆盖率 (再以 Dice 系数排序) 打分，
+    别名和子串都没有命中时才使用
+"""
+import unicodedata
+
+# --- 配置 ---
+FUZZY_MATCH_THRESHOLD = 0.6 # 查询的 2-gram 至少有这个比例出现在候选名称中
+MAX_FUZZY_MATCHES = 5
+
+# 默认的跨语言别名，每组中的名称互为别名 (config.json 的 anime_aliases 可追加)
+DEFAULT_ANIME_ALIASES = {
+    "赛马娘": ["ウマ娘", "ウマ娘 プリティーダービー", "Uma Musume"],
+    "前桥魔女": ["前橋ウィッチーズ", "Maebashi Witches"],
+    "孤独摇滚": ["ぼっち・ざ・ろっく", "Bocchi the Rock"],
+    "碧蓝档案": ["ブルーアーカイブ", "Blue Archive"],
+    "偶像大师": ["アイドルマスター", "THE IDOLM@STER", "iDOLM@STER"],
+    "世界计划": ["プロジェクトセカイ", "プロセカ", "Project SEKAI"],
+    "哭泣少女乐队": ["ガールズバンドクライ", "GIRLS BAND CRY"],
+    "机动战士高达": ["機動戦士ガンダム", "Gundam"],
+    "莲之空女学院": ["蓮ノ空女学院", "Hasunosora"],
+    "药屋少女的呢喃": ["薬屋のひとりごと"],
+}
+
+# 繁体字 / 日文新字体 -> 简体字 (动漫标题中常见的字)
+_VARIANT_SOURCE = (
+    "橋蓮鷹講義録錄戦戰機動職業異鑑鑒縁緣結殺紀學園戀愛國劍剣龍竜鬥闘畫場歲歳團団聲樂楽語話說説讀読書傳伝記遊戲戯島廣広東車門間開關関風飛馬魚鳥黃龜亀萬與兒児兩両們來個這時會實寫對將専專長師帥後從従復應応雙變変體氣気電靈霊錬鍊煉術衛衞轉転輪軍銀鐵鉄錢鋼鏡陽陰險険隊雲靜響頭題顏願飯館驚驗験麗點齒歯擊撃歸帰處処絕絶線練紅純紙組細終絲給統綠緑網繪絵續続總総織藥薬蘭藍蟲見視親覺覚觀観計訓設許詩試誰調談論諾謎護讓譲貓貝負貴買賣売質賽贈趙蹟跡軌輕軽輝農運過達違遠適選遺邊辺還鄉郷醫醬釣針鈴鍵鐘閃陣陸隱隠難離頁順須預領頻顧類飄餘騎騷騒驅駆髮髪鬱鳳鶴鹽塩麥齊斉澤沢濱浜櫻桜姫樣様狀獸獣獵猟圓円圖図擴拡攝摂濟済滿満淚涙燒焼犧犠發発縣県碎稻稲穗穂緒繩縄聽聴腦脳艷艶藝芸豐豊贊賛遲遅郵釋釈鉱礦銭鋭陥隣鄰雜雑賴頼顯顕鶏雞默黙齡齢亞亜佛仏假仮價価偽僞劑剤勞労勸勧單単卷巻帶帯彈弾惡悪惱悩戶戸拔抜搖揺敵數斎齋舊曉暁曆暦歷歴權権歡歓殼殻淨浄灣湾燈為爲焰營営獨独獻献產産疊畳盜盗禮禪禅稱称穩穏筆粹経經繼継縦縱繋繫聖脈腸膚臨舖舗莊荘華虜裝装覽覧觸触譯訳證証諸謠謡財貨販貯賀賞賢輩鄭醜銃銘錦鍛鎖鎧鑽閉陳隸隷雛霧靑頂項頑頓頰頬顆顛颯飢飾餅驛駅駐駒騰鮮鯨鳴鴉鴨鵬鷲黨龐"
+)
+_VARIANT_TARGET = (
+    "桥莲鹰讲义录录战战机动职业异鉴鉴缘缘结杀纪学园恋爱国剑剑龙龙斗斗画场岁岁团团声乐乐语话说说读读书传传记游戏戏岛广广东车门间开关关风飞马鱼鸟黄龟龟万与儿儿两两们来个这时会实写对将专专长师帅后从从复应应双变变体气气电灵灵炼炼炼术卫卫转转轮军银铁铁钱钢镜阳阴险险队云静响头题颜愿饭馆惊验验丽点齿齿击击归归处处绝绝线练红纯纸组细终丝给统绿绿网绘绘续续总总织药药兰蓝虫见视亲觉觉观观计训设许诗试谁调谈论诺谜护让让猫贝负贵买卖卖质赛赠赵迹迹轨轻轻辉农运过达违远适选遗边边还乡乡医酱钓针铃键钟闪阵陆隐隐难离页顺须预领频顾类飘余骑骚骚驱驱发发郁凤鹤盐盐麦齐齐泽泽滨滨樱樱姬样样状兽兽猎猎圆圆图图扩扩摄摄济济满满泪泪烧烧牺牺发发县县碎稻稻穗穗绪绳绳听听脑脑艳艳艺艺丰丰赞赞迟迟邮释释矿矿钱锐陷邻邻杂杂赖赖显显鸡鸡默默龄龄亚亚佛佛假假价价伪伪剂剂劳劳劝劝单单卷卷带带弹弹恶恶恼恼户户拔拔摇摇敌数斋斋旧晓晓历历历历权权欢欢壳壳净净湾湾灯为为焰营营独独献献产产叠叠盗盗礼禅禅称称稳稳笔粹经经继继纵纵系系圣脉肠肤临铺铺庄庄华虏装装览览触触译译证证诸谣谣财货贩贮贺赏贤辈郑丑铳铭锦锻锁铠钻闭陈隶隶雏雾青顶项顽顿颊颊颗颠飒饥饰饼驿驿驻驹腾鲜鲸鸣鸦鸭鹏鹫党庞"
+)
+_TRADITIONAL_CHARS = {source for source, target in zip(_VARIANT_SOURCE, _VARIANT_TARGET) if source != target}
+_PARTICLE_VARIANTS = "のノ的"
+_VARIANT_TABLE = str.maketrans(_VARIANT_SOURCE + _PARTICLE_VARIANTS, _VARIANT_TARGET + "之" * len(_PARTICLE_VARIANTS))
+
+# --- 全局变量 ---
+ANIME_TITLE_VALUES = {} # {折叠后的名称: {原始 anime_title}}
+ANIME_TITLE_GRAMS = {} # {2-gram: {折叠后的名称}}
+ANIME_ALIAS_GROUPS = [] # [{折叠后的别名}]，每组互为别名
+ANIME_ALIAS_CANONICAL_NAMES = [] # 与 ANIME_ALIAS_GROUPS 对应的标准名称 (词典中该组第一次出现时的键，即中文名)
+
+
+# --- 折叠 ---
+def fold_anime_title(text):
+    """把名称折叠为用于比较的形式 (见模块说明)。"""
+    if not text:
+        return ''
+    text = unicodedata.normalize('NFKC', text).casefold().translate(_VARIANT_TABLE)
+    folded_chars = []
+    for ch in text:
+        if 'ぁ' <= ch <= 'ゖ': # 平假名 -> 片假名
+            ch = chr(ord(ch) + 0x60)
+        if ch.isalnum() or ch == 'ー':
+            folded_chars.append(ch)
+    return ''.join(folded_chars)
+
+def is_untranslated_title(text):
+    """名称含假名或繁体/日文新字体汉字 (例如 無職転生)，即还不是简体中文名。"""
+    return any('぀' <= ch <= 'ヿ' or ch in _TRADITIONAL_CHARS for ch in text or '')
+
+def _grams(folded):
+    if len(folded) < 2:
+        return {folded} if folded else set()
+    return {folded[i:i + 2] for i in range(len(folded) - 1)}
+
+
+# --- 建立索引 ---
+def load_anime_aliases(extra_aliases=None):
+    """加载默认别名和 config.json 中的 anime_aliases ({名称: [别名, ...]})，同名的组会合并。"""
+    ANIME_ALIAS_GROUPS.clear()
+    ANIME_ALIAS_CANONICAL_NAMES.clear()
+    for aliases in (DEFAULT_ANIME_ALIASES, extra_aliases or {}):
+        for name, alias_list in aliases.items():
+            group = {fold_anime_title(a) for a in [name] + list(alias_list or [])} - {''}
+            for existing_group in ANIME_ALIAS_GROUPS:
+                if existing_group & group:
+                    existing_group |= group
+                    break
+            else:
+                if group:
+                    ANIME_ALIAS_GROUPS.append(group)
+                    ANIME_ALIAS_CANONICAL_NAMES.append(name)
+
+def add_anime_title(anime_title):
+    """新条目的 anime_title 加入别名词典和相似度索引。"""
+    if not isinstance(anime_title, str) or not anime_title:
+        return
+    folded = fold_anime_title(anime_title)
+    if not folded:
+        return
+    if folded not in ANIME_TITLE_VALUES:
+        ANIME_TITLE_VALUES[folded] = set()
+        for gram in _grams(folded):
+            ANIME_TITLE_GRAMS.setdefault(gram, set()).add(folded)
+    ANIME_TITLE_VALUES[folded].add(anime_title)
+
+def build_anime_title_index(anime_titles):
+    ANIME_TITLE_VALUES.clear()
+    ANIME_TITLE_GRAMS.clear()
+    for anime_title in anime_titles:
+        add_anime_title(anime_title)
+
+
+# --- 查询 ---
+def _related(a, b):
+    """折叠后的两个名称互相包含 (较短的一方至少两个字符，避免单字误配)。"""
+    if a == b:
+        return True
+    shorter, longer = (a, b) if len(a) <= len(b) else (b, a)
+    return len(shorter) >= 2 and shorter in longer
+
+def _fuzzy_matches(folded_query):
+    query_grams = _grams(folded_query)
+    candidate_counts = {}
+    for gram in query_grams:
+        for folded in ANIME_TITLE_GRAMS.get(gram, ()):
+            candidate_counts[folded] = candidate_counts.get(folded, 0) + 1
+    scored = []
+    for folded, shared in candidate_counts.items():
+        coverage = shared / len(query_grams)
+        if coverage >= FUZZY_MATCH_THRESHOLD:
+            dice = 2 * shared / (len(query_grams) + len(_grams(folded)))
+            scored.append((coverage, dice, folded))
+    scored.sort(key=lambda item: (-item[0], -item[1], item[2]))
+    return [folded for _, _, folded in scored[:MAX_FUZZY_MATCHES]]
+
+def canonical_anime_title(anime_title):
+    """
+    名称完全由同一别名组中的别名组成时 (例如 前橋ウィッチーズ、碧蓝档案Blue Archive、THE IDOLM@STER 偶像大师)
+    返回该组的标准名称，否则返回 None。
+    """
+    folded = fold_anime_title(anime_title)
+    if not folded:
+        return None
+    for group, canonical_name in zip(ANIME_ALIAS_GROUPS, ANIME_ALIAS_CANONICAL_NAMES):
+        remainder = folded
+        for alias in sorted(group, key=len, reverse=True):
+            remainder = remainder.replace(alias, '')
+        if not remainder:
+            return canonical_name
+    return None
+
+def resolve_anime_titles(query):
+    """
+    返回与查询名称对应的已知 anime_title 原始取值列表:
+    先用别名组和折叠后的互相包含关系匹配，都没有结果时再按 2-gram 相似度模糊匹配。
+    """
+    folded_query = fold_anime_title(query)
+    if not folded_query:
+        return []
+
+    # 查询中包含某个别名时，把这部分替换为同组的其他别名 (例如 偶像大师SideM -> THE IDOLM@STER SideM)；
+    # 查询只是某个别名的一部分时，整组别名都参与匹配
+    search_names = {folded_query}
+    for group in ANIME_ALIAS_GROUPS:
+        for alias in group:
+            if alias in folded_query:
+                search_names.update(folded_query.replace(alias, other) for other in group)
+            elif _related(folded_query, alias):
+                search_names |= group
+
+    matched_folded = [
+        folded for folded in ANIME_TITLE_VALUES
+        if any(_related(name, folded) for name in search_names)
+    ]
+    if not matched_folded:
+        matched_folded = _fuzzy_matches(folded_query)
+
+    return sorted(title for folded in matched_folded for title in ANIME_TITLE_VALUES[folded])
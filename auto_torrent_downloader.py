@@ -1,22 +1,33 @@
 # -*- coding: utf-8 -*-
-import feedparser
 import json
 import os
 from qbittorrent import Client
 import google.generativeai as genai
 import time
+import math
 import re
+import sys
 from json.decoder import JSONDecodeError
-import requests
-from bs4 import BeautifulSoup
-from urllib.parse import urljoin, urlparse, parse_qs 
+from urllib.parse import urlparse, parse_qs 
 import base64
+from dmhy_resolver import resolve_download_links, load_link_resolution_cache, LINK_RESOLUTION_CACHE_FILE, DEFAULT_RESOLVE_CONCURRENCY
+from qb_sync import sync_qb_torrents, is_torrent_in_client, wait_for_torrent
+from seen_journal import load_seen_torrent_set, record_seen_torrent, compact_seen_torrents, SEEN_TORRENTS_FILE, SEEN_TORRENTS_JOURNAL_FILE
+from decision_cache import DECISION_CACHE_FILE, load_decision_cache, DEFAULT_DECISION_CACHE_MAX_ENTRIES, DEFAULT_DECISION_CACHE_TTL_DAYS, save_decision_cache, make_decision_cache_key, has_cached_decision, get_cached_decision, put_cached_decision, get_decision_cache_stats
+from rule_classifier import load_pre_classifier_rules, classify_title, get_pre_classifier_stats
+from feed_fetcher import fetch_feed, fetch_feeds_concurrently, load_feed_http_cache, save_feed_http_cache, commit_feed_http_cache, FEED_HTTP_CACHE_FILE, DEFAULT_FEED_FETCH_CONCURRENCY
+from feed_watermark import load_feed_watermarks, filter_entries_above_watermark, commit_feed_watermark, FEED_WATERMARK_FILE
+from description_compactor import compact_description, load_description_boilerplate, DEFAULT_DESCRIPTION_TOKEN_CAP
+from gemini_quota import estimate_token_count
+from llm_replay import configure_llm_replay, prepare_llm_replay_state, generate_content_with_replay, get_llm_replay_stats, LLMReplayMissError, DEFAULT_LLM_REPLAY_MODE, DEFAULT_LLM_REPLAY_STORE_DIR
+from entry_store import ENTRY_STORE_FILE, LEGACY_ENTRIES_FILE
+from feed_scheduler import init_feed_schedule, wait_for_next_feed, reschedule_feed, wait_for_rate_limit, observe_feed, seed_publish_history_from_analyzed_entries, update_feed_poll_interval, save_feed_poll_schedule, DEFAULT_FEED_POLL_INTERVAL, DEFAULT_HOST_MIN_INTERVAL, DEFAULT_MAX_FEED_POLL_INTERVAL
 
 # --- 配置及文件路径 ---
 CONFIG_FILE = 'config.json'
-SEEN_TORRENTS_FILE = 'seen_torrents.json'
+FEED_POLL_SCHEDULE_FILE = 'feed_poll_schedule.json' # 常驻模式下各 Feed 的轮询间隔和下次轮询时间
 
-# --- 辅助函数：加载/保存配置和已处理的种子 ---
+# --- 辅助函数：加载配置 ---
 def load_config():
     """从 config.json 加载配置，并处理JSON解析错误"""
     if not os.path.exists(CONFIG_FILE):
@@ -32,31 +43,6 @@ def load_config():
             print(f"错误：加载配置文件 '{CONFIG_FILE}' 时发生未知错误: {e}")
             exit()
 
-def load_seen_torrents():
-    """从 seen_torrents.json 加载已处理的种子链接, 并处理空文件或无效JSON"""
-    if not os.path.exists(SEEN_TORRENTS_FILE):
-        return set() # 文件不存在，返回空集合
-
-    try:
-        if os.path.getsize(SEEN_TORRENTS_FILE) == 0:
-             return set()
-             
-        with open(SEEN_TORRENTS_FILE, 'r', encoding='utf-8') as f:
-           data = json.load(f)
-           return set(data) if isinstance(data, list) else set()
-           
-    except JSONDecodeError:
-        print(f"警告: 无法解析文件 '{SEEN_TORRENTS_FILE}' (文件为空或JSON格式错误)。将返回空集合并继续。")
-        return set()
-    except Exception as e:
-         print(f"警告: 读取文件 '{SEEN_TORRENTS_FILE}' 发生错误: {e}。将返回空集合并继续。")
-         return set()
-
-def save_seen_torrents(seen_torrents_set):
-    """将已处理的种子链接保存到 seen_torrents.json"""
-    with open(SEEN_TORRENTS_FILE, 'w', encoding='utf-8') as f:
-        json.dump(list(seen_torrents_set), f, ensure_ascii=False, indent=4)
-
 # --- 辅助函数：更健壮地提取 Infohash ---
 def extract_infohash(link_candidate):
     """
@@ -91,250 +77,506 @@ def extract_infohash(link_candidate):
     return None
 
 # --- AI 决策函数 (Gemini) ---
-def decide_with_gemini(title, description, gemini_config):
-    """
-    使用 Google Gemini 模型决定是否下载、下载路径和标签。
-    """
-    if not gemini_config.get('api_key'):
-        print("错误: Gemini API Key 未配置。无法使用 Gemini 进行决策。")
-        return {"action": "skip"}
-
-    genai.configure(api_key=gemini_config['api_key'])
-    model = genai.GenerativeModel(gemini_config['model_name'])
-
-    prompt = f"""
-你是一个智能的qBittorrent资源筛选助手。你的任务是根据给定的资源标题和描述，判断是否应该下载该资源，并给出推荐的下载路径和标签。
+DECISION_PROMPT_HEADER = """
+你是一个智能的qBittorrent资源筛选助手。你的任务是根据给定的多个资源标题和描述，逐一判断是否应该下载该资源，并给出推荐的下载路径和标签。
 你的目标是专注于筛选动漫音乐资源，特别是高质量、无损格式（如FLAC）的专辑、OST（原声音乐）、VGM（游戏音乐）等。
 
-请输出 JSON 格式的决策结果。JSON 必须包含 'action' 字段，其值可以是 'download' 或 'skip'。
+请输出一个 JSON 数组，数组的每个元素对应一个资源的决策结果，顺序必须与输入资源列表严格一致。
+每个元素必须包含 'index' 字段（即资源编号）和 'action' 字段，'action' 的值可以是 'download' 或 'skip'。
 如果 'action' 是 'download'，则必须额外包含 'path' 和 'tags' 字段。
 - 'path' 应该是 qBittorrent 中存在的绝对路径，例如 '/downloads/Music/FLAC' 或 '/downloads/Music/OST'。
 - 'tags' 是一个字符串列表，例如 ['音乐', '无损', '专辑']。
 - 如果不确定，或者判断为非音乐资源，则 'action' 应该是 'skip'。
 
-请严格遵守 JSON 格式输出，不要包含任何额外文字或解释。
-
-示例输出 (下载):
-{{
-    "action": "download",
-    "path": "/downloads/Music/FLAC",
-    "tags": ["音乐", "无损", "专辑"]
-}}
+请严格遵守 JSON 数组格式输出，不要包含任何额外文字或解释。
+
+示例输出:
+[
+  {{
+      "index": 1,
+      "action": "download",
+      "path": "/downloads/Music/FLAC",
+      "tags": ["音乐", "无损", "专辑"]
+  }},
+  {{
+      "index": 2,
+      "action": "skip"
+  }}
+]
+
+以下是需要判断的资源列表（共 {count} 个）：
+"""
 
-示例输出 (跳过):
-{{
-    "action": "skip"
-}}
+DECISION_PROMPT_VERSION = 2 # 修改决策提示词后请递增，旧的缓存决策随之失效 (2: 描述改为压缩后的文本)
+DEFAULT_DECISION_BATCH_SIZE = 20
+DEFAULT_GEMINI_DECISION_RPM = 10 # Gemini 决策请求每分钟上限
+GEMINI_DECISION_MODEL = None # 决策模型实例，整个运行期间只创建一次
+GEMINI_DECISION_STATS = {"entries": 0, "batches": 0} # 决策缓存未命中、实际发给 Gemini 的条目数和批次数
+
+
+def get_decision_model(gemini_config):
+    """按需创建并复用 Gemini 决策模型。"""
+    global GEMINI_DECISION_MODEL
+    if GEMINI_DECISION_MODEL is None:
+        genai.configure(api_key=gemini_config['api_key'])
+        GEMINI_DECISION_MODEL = genai.GenerativeModel(gemini_config['model_name'])
+    return GEMINI_DECISION_MODEL
+
+def validate_decision(decision, raw_text):
+    """检查单条决策的字段，不合格的按原逻辑降级为 skip。"""
+    if not isinstance(decision, dict) or 'action' not in decision:
+        print(f"警告: Gemini 输出缺少 'action' 字段: {raw_text[:200]}")
+        return {"action": "skip"}
 
-资源标题: {title}
-资源描述: {description if description else '无描述'}
-"""
-    try:
-        response = model.generate_content(
-            prompt,
-            generation_config=genai.GenerationConfig(response_mime_type="application/json")
-        )
-        
-        decision = json.loads(response.text)
-        
-        if 'action' not in decision:
-            print(f"警告: Gemini 输出缺少 'action' 字段: {response.text}")
+    if decision['action'] == 'download':
+        if 'path' not in decision or 'tags' not in decision:
+            print(f"警告: Gemini 'download' 决策缺少 'path' 或 'tags' 字段: {decision}")
             return {"action": "skip"}
-        
-        if decision['action'] == 'download':
-            if 'path' not in decision or 'tags' not in decision:
-                print(f"警告: Gemini 'download' 决策缺少 'path' 或 'tags' 字段: {response.text}")
-                return {"action": "skip"}
-            if not isinstance(decision['tags'], list):
-                print(f"警告: Gemini 'tags' 字段不是列表: {response.text}")
-                decision['tags'] = []
-        
-        return decision
-
-    except Exception as e:
-        print(f"调用 Gemini API 发生错误: {e}")
-        print(f"尝试解析的响应文本: {response.text if 'response' in locals() else '无'}")
+        if not isinstance(decision['tags'], list):
+            print(f"警告: Gemini 'tags' 字段不是列表: {decision}")
+            decision['tags'] = []
+    elif decision['action'] != 'skip':
         return {"action": "skip"}
 
-# --- 主逻辑函数 ---
-def main():
-    config = load_config()
-    seen_torrents = load_seen_torrents()
-    
-    qb_config = config['qbittorrent']
-    gemini_config = config['gemini']
-    default_download_path = config.get('default_download_path', '/downloads/Others')
-    dry_run = config.get('dry_run', False)
+    decision.pop('index', None)
+    return decision
 
-    print(f"脚本以 {'模拟运行模式' if dry_run else '实际运行模式'} 启动。")
+def decide_with_gemini_batch(items, gemini_config, retries=3):
+    """
+    一次请求判断多个资源。items 为 [{"title", "description"}]。
+    先查持久决策缓存，只有未命中的条目才会发给 Gemini。
+    返回与 items 顺序一致的决策列表；整批调用失败时对应位置为 None (本次不做决定，下次运行重试)。
+    """
+    if not items:
+        return []
+
+    decisions = [None] * len(items)
+    cache_keys = [make_decision_cache_key(item['title'], item.get('description'), DECISION_PROMPT_VERSION) for item in items]
+    uncached_positions = []
+    for i, cache_key in enumerate(cache_keys):
+        cached_decision = get_cached_decision(cache_key)
+        if cached_decision is not None:
+            decisions[i] = cached_decision
+        else:
+            uncached_positions.append(i)
+
+    if not uncached_positions:
+        return decisions
 
-    qb = None
-    try:
-        qb = Client(qb_config['url'])
-        qb.login(qb_config['username'], qb_config['password'])
-        print(f"成功连接到 qBittorrent ({qb_config['url']}).")
-    except Exception as e:
-        print(f"连接或登录 qBittorrent 失败: {e}")
-        print("请检查 qBittorrent Web UI 是否开启，以及配置文件中的 URL、用户名和密码是否正确。")
-        exit()
+    if not gemini_config.get('api_key'):
+        print("错误: Gemini API Key 未配置。无法使用 Gemini 进行决策。")
+        for i in uncached_positions:
+            decisions[i] = {"action": "skip"}
+        return decisions
+
+    GEMINI_DECISION_STATS['entries'] += len(uncached_positions)
+    GEMINI_DECISION_STATS['batches'] += 1
+    fresh_decisions = request_gemini_decisions([items[i] for i in uncached_positions], gemini_config, retries)
+    for i, decision in zip(uncached_positions, fresh_decisions):
+        decisions[i] = decision
+        if decision is not None:
+            put_cached_decision(cache_keys[i], decision)
+    return decisions
+
+def request_gemini_decisions(items, gemini_config, retries=3):
+    """实际调用 Gemini 判断一批资源，失败时返回全 None 列表。"""
+    model = get_decision_model(gemini_config)
+
+    prompt_parts = [DECISION_PROMPT_HEADER.format(count=len(items))]
+    for i, item in enumerate(items):
+        prompt_parts.append(f"""
+----- 资源 {i+1} -----
+资源标题: {item['title']}
+资源描述: {item.get('description') or '无描述'}
+""")
+    full_prompt = "".join(prompt_parts)
+    print(f"  发送 {len(items)} 个资源给 Gemini 判断 (约 {estimate_token_count(full_prompt)} tokens)...")
+
+    decision_rpm = gemini_config.get('decision_rpm', DEFAULT_GEMINI_DECISION_RPM)
+    for attempt in range(retries):
+        response = None
+        try:
+            # 按每分钟请求数限速 (回放命中时不等待)
+            response = generate_content_with_replay(
+                model, gemini_config['model_name'], full_prompt,
+                generation_config={"response_mime_type": "application/json"},
+                before_live_call=lambda: wait_for_rate_limit('gemini', 60.0 / decision_rpm if decision_rpm else 0)
+            )
+            parsed_results = json.loads(response.text)
+
+            if not isinstance(parsed_results, list):
+                print(f"警告: Gemini 返回的不是 JSON 数组，尝试 {attempt + 1}/{retries}。返回: {response.text[:100]}...")
+                continue
+
+            # 优先按 index 对齐，缺失时按顺序对齐
+            decisions_by_index = {}
+            for position, result in enumerate(parsed_results):
+                index = result.get('index') if isinstance(result, dict) else None
+                if not isinstance(index, int) or not 1 <= index <= len(items) or index in decisions_by_index:
+                    index = position + 1
+                decisions_by_index.setdefault(index, result)
+
+            if len(decisions_by_index) != len(items):
+                print(f"警告: Gemini 返回 {len(parsed_results)} 条决策，期望 {len(items)} 条，尝试 {attempt + 1}/{retries}。")
+                continue
+
+            return [validate_decision(decisions_by_index[i + 1], response.text) for i in range(len(items))]
+
+        except LLMReplayMissError:
+            raise # 回放缺少记录时让本次运行失败，而不是当作 API 错误跳过
+        except Exception as e:
+            print(f"调用 Gemini API 发生错误: {e}")
+            print(f"尝试解析的响应文本: {response.text[:200] if response is not None else '无'}")
+            if "429" in str(e):
+                time.sleep(5 * (attempt + 1))
+            else:
+                break
 
-    # 修正：恢复正确的 RSS Feed 循环结构，确保每个 entry 在循环内处理
-    for feed_name, feed_url in config['rss_feeds'].items():
-        print(f"\n--- 处理 RSS Feed: {feed_name} ---")
-        try: # 捕获整个 Feed 的解析和处理错误
-            feed = feedparser.parse(feed_url)
-            if feed.bozo:
-                print(f"警告: RSS Feed '{feed_name}' 解析错误: {feed.bozo_exception}")
-
-            entries = feed.entries
-            print(f"找到 {len(entries)} 个条目。")
-
-            # 内部循环：处理每个 RSS 条目
-            for entry in entries:
-                original_link = entry.link 
-                title = entry.title
-                description = entry.get('description', '')
-                
-                # --- 获取实际下载链接 ---
-                actual_download_link = None
-
-                # 1. 优先检查 enclosure 标签
-                if hasattr(entry, 'enclosures') and entry.enclosures:
-                    for enc in entry.enclosures:
-                        if enc.href:
-                            if enc.type == 'application/x-bittorrent' or enc.href.startswith('magnet:'):
-                                actual_download_link = enc.href
-                                # print(f"  通过 enclosure 找到链接: {actual_download_link}") # 移除此行以减少冗余
-                                break
-                
-                # 2. 如果 enclosure 没有提供，则尝试解析原始链接 (网页或直接磁力)
-                if not actual_download_link:
-                    if original_link and original_link.startswith('magnet:'):
-                        actual_download_link = original_link
-                        # print(f"  原始链接已经是磁力链接: {actual_download_link}") # 移除此行
-                    elif original_link and "share.dmhy.org/topics/view/" in original_link:
-                        # print(f"  原始链接是网页，尝试从网页获取实际下载链接: {original_link}") # 移除此行
-                        try:
-                            headers = {
-                                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
-                            }
-                            response = requests.get(original_link, headers=headers, timeout=15)
-                            response.raise_for_status()
-                            soup = BeautifulSoup(response.text, 'html.parser')
-
-                            magnet_links_on_page = soup.find_all('a', href=re.compile(r'^magnet:'))
-                            if magnet_links_on_page:
-                                actual_download_link = magnet_links_on_page[0]['href']
-                                # print(f"  从网页找到磁力链接: {actual_download_link}") # 移除此行
-                            else:
-                                torrent_links_on_page = soup.find_all('a', href=re.compile(r'\.torrent$'))
-                                if torrent_links_on_page:
-                                    relative_path = torrent_links_on_page[0]['href']
-                                    actual_download_link = urljoin(original_link, relative_path)
-                                    # print(f"  从网页找到 .torrent 文件链接: {actual_download_link}") # 移除此行
-                                # else:
-                                    # print(f"  未在网页中找到磁力链接或 .torrent 文件链接。") # 移除此行
-
-                        except requests.exceptions.RequestException as req_e:
-                            print(f"  访问网页 '{original_link}' 失败: {req_e}")
-                        except Exception as parse_e:
-                            print(f"  解析网页 '{original_link}' 内容失败: {parse_e}")
-                    else:
-                        actual_download_link = original_link
-                        # print(f"  使用原始链接作为下载链接 (非已知类型): {actual_download_link}") # 移除此行
-
-                # 修正：在确定实际下载链接后，再提取 unique_id
-                unique_id = extract_infohash(actual_download_link)
-                if not unique_id:
-                    unique_id = original_link # 如果无法从实际下载链接提取 infohash，使用原始链接作为唯一标识
-
-                # 检查是否已处理过
-                if unique_id in seen_torrents:
-                    print(f"  已处理过，跳过: {title}") # 简化输出，不再显示 ID
-                    continue
-
-                # 如果未能获取实际下载链接，则跳过此条目（在去重后执行，确保已处理）
-                if not actual_download_link:
-                    print(f"  未能获取实际下载链接，跳过资源: {title}")
-                    seen_torrents.add(unique_id)
-                    save_seen_torrents(seen_torrents)
-                    continue 
+    return [None] * len(items)
+
+# --- 处理单个 Feed 的所有条目 ---
+def process_feed(feed_name, feed_url, feed, qb, seen_torrents, settings):
+    """
+    去重、决策并添加一个已抓取的 Feed 中的条目。settings 由 load_run_settings() 生成。
+    返回本 Feed 因本地规则预分类而避免的 LLM 调用次数。
+    """
+    gemini_config = settings['gemini_config']
+    default_download_path = settings['default_download_path']
+    dry_run = settings['dry_run']
+    decision_batch_size = settings['decision_batch_size']
+    pre_classifier_enabled = settings['pre_classifier_enabled']
+    resolve_concurrency = settings['resolve_concurrency']
+    description_compaction_enabled = settings['description_compaction_enabled']
+    description_token_cap = settings['description_token_cap']
+    llm_calls_avoided = 0
+
+    try: # 捕获整个 Feed 的解析和处理错误
+        if feed.bozo:
+            print(f"警告: RSS Feed '{feed_name}' 解析错误: {feed.bozo_exception}")
+
+        # 水位线 (上次完整处理到的发布时间和同一秒内的条目 ID) 之下的条目直接丢弃，不产生任何网络请求或 LLM 调用
+        entries = filter_entries_above_watermark(feed_name, feed.entries)
+        print(f"找到 {len(feed.entries)} 个条目，水位线之上 {len(entries)} 个。")
+
+        # --- 通过共享连接池并发获取所有条目的实际下载链接 ---
+        resolved_links = resolve_download_links(entries, resolve_concurrency, log_errors=True)
+
+        # 第一遍：去重，收集需要 AI 判断的条目
+        pending_entries = []
+        for entry, actual_download_link in zip(entries, resolved_links):
+            original_link = entry.link 
+            title = entry.title
+
+            # 修正：在确定实际下载链接后，再提取 unique_id
+            unique_id = extract_infohash(actual_download_link)
+            if not unique_id:
+                unique_id = original_link # 如果无法从实际下载链接提取 infohash，使用原始链接作为唯一标识
+
+            # 检查是否已处理过
+            if unique_id in seen_torrents:
+                print(f"  已处理过，跳过: {title}") # 简化输出，不再显示 ID
+                continue
+
+            # 已在 qBittorrent 中的种子 (例如手动添加过) 无需再判断
+            if unique_id != original_link and is_torrent_in_client(qb, unique_id):
+                print(f"  已在 qBittorrent 中，跳过: {title}")
+                record_seen_torrent(seen_torrents, unique_id)
+                continue
+
+            # 如果未能获取实际下载链接，则跳过此条目（在去重后执行，确保已处理）
+            if not actual_download_link:
+                print(f"  未能获取实际下载链接，跳过资源: {title}")
+                record_seen_torrent(seen_torrents, unique_id)
+                continue 
+
+            pending_entries.append({
+                "title": title,
+                # 去掉 HTML 和发布组宣传文字后再放入 prompt，决策缓存也按压缩后的描述命中
+                "description": compact_description(entry.get('description', ''), title, description_token_cap) if description_compaction_enabled else entry.get('description', ''),
+                "unique_id": unique_id,
+                "link": actual_download_link,
+                "rule_decision": classify_title(title) if pre_classifier_enabled else None # 本地规则能确定的无需调用 Gemini
+            })
+
+        # 第二遍：本地规则已确定的直接处理，其余按批次请求 Gemini，每批一次调用
+        rule_decided_entries = [e for e in pending_entries if e['rule_decision'] is not None]
+        llm_entries = [e for e in pending_entries if e['rule_decision'] is None]
+        # 只计算决策缓存也答不上来的条目: 缓存能回答的条目本来就不会发给 Gemini
+        uncached_llm_count = sum(1 for e in llm_entries if not has_cached_decision(make_decision_cache_key(e['title'], e['description'], DECISION_PROMPT_VERSION)))
+        uncached_rule_count = sum(1 for e in rule_decided_entries if not has_cached_decision(make_decision_cache_key(e['title'], e['description'], DECISION_PROMPT_VERSION)))
+        llm_calls_avoided = math.ceil((uncached_llm_count + uncached_rule_count) / decision_batch_size) - math.ceil(uncached_llm_count / decision_batch_size)
+
+        llm_batches = [llm_entries[i:i + decision_batch_size] for i in range(0, len(llm_entries), decision_batch_size)]
+        if rule_decided_entries:
+            print(f"\n  本地规则直接判定 {len(rule_decided_entries)} 个资源，{len(llm_entries)} 个交给 Gemini。")
+
+        # 按 Feed 中的原始顺序逐条处理，轮到某批的第一条 Gemini 条目时才请求这一批的决策
+        undecided_count = 0
+        llm_entries_done = 0
+        batch_decisions = [] # 当前 Gemini 批次的决策，按 llm_entries 中的顺序
+        for pending_entry in pending_entries:
+            if pending_entry['rule_decision'] is not None:
+                decision = pending_entry['rule_decision']
+            else:
+                if llm_entries_done % decision_batch_size == 0:
+                    batch_entries = llm_batches[llm_entries_done // decision_batch_size]
+                    print(f"\n  正在评估 {len(batch_entries)} 个资源 (第 {llm_entries_done + 1} - {llm_entries_done + len(batch_entries)} 条，共 {len(llm_entries)} 条)...")
+                    batch_decisions = decide_with_gemini_batch(batch_entries, gemini_config)
+                decision = batch_decisions[llm_entries_done % decision_batch_size]
+                llm_entries_done += 1
+
+            title = pending_entry['title']
+            unique_id = pending_entry['unique_id']
+            link_to_send_to_qb = pending_entry['link']
+
+            # --- 优化输出：只显示关键信息 ---
+            print(f"\n  评估资源: {title}")
+
+            if decision is None:
+                print(f"  决策失败，下次运行时重试。")
+                undecided_count += 1
+                continue
+
+            if decision['action'] == 'download':
+                target_path = decision.get('path', default_download_path)
+                target_tags = decision.get('tags', [])
                 
-                link_to_send_to_qb = actual_download_link
-
-                # --- 优化输出：只显示关键信息 ---
-                print(f"\n  评估资源: {title}")
-
-                decision = decide_with_gemini(title, description, gemini_config)
-
-                if decision['action'] == 'download':
-                    target_path = decision.get('path', default_download_path)
-                    target_tags = decision.get('tags', [])
-                    
-                    print(f"  决策: 下载! 目标路径: '{target_path}', 标签: {target_tags}")
-
-                    if not dry_run:
-                        try:
-                            print(f"  发送下载任务到qBittorrent: {title}")
-                            qb.download_from_link(
-                                link_to_send_to_qb,
-                                savepath=target_path,
-                                category=','.join(target_tags) if target_tags else None 
-                            )
-                            
-                            added_successfully = False
-                            time.sleep(2) 
-                            
-                            all_torrents = qb.torrents() 
-                            
-                            torrent_infohash = extract_infohash(link_to_send_to_qb)
-
-                            if torrent_infohash:
-                                found_torrent_in_qb = False
-                                for torrent in all_torrents:
-                                    if torrent['hash'] == torrent_infohash: 
-                                        found_torrent_in_qb = True
-                                        break
-                                
-                                if found_torrent_in_qb:
-                                    added_successfully = True
-                                    print(f"  任务添加成功: {title}")
-                                else:
-                                    print(f"  警告: Torrent '{title}' 未能在 qBittorrent 列表中找到。") # 简化警告
-                                    added_successfully = False # 明确标记为失败，并让外层except捕获
-                                    # 不再假设成功，让seen_torrents在except块中处理
+                print(f"  决策: 下载! 目标路径: '{target_path}', 标签: {target_tags}" + (f" (规则: {decision['rule']})" if decision.get('rule') else ""))
 
+                if not dry_run:
+                    try:
+                        print(f"  发送下载任务到qBittorrent: {title}")
+                        qb.download_from_link(
+                            link_to_send_to_qb,
+                            savepath=target_path,
+                            category=','.join(target_tags) if target_tags else None 
+                        )
+                        
+                        added_successfully = False
+                        
+                        torrent_infohash = extract_infohash(link_to_send_to_qb)
+
+                        if torrent_infohash:
+                            # 通过 sync/maindata 增量同步等待新任务出现，出现即确认
+                            found_torrent_in_qb = wait_for_torrent(qb, torrent_infohash)
+                            
+                            if found_torrent_in_qb:
+                                added_successfully = True
+                                print(f"  任务添加成功: {title}")
                             else:
-                                print(f"  警告: 无法精确验证添加，请手动检查qBittorrent。") # 简化警告
-                                added_successfully = True # 如果无法验证，仍假定成功，避免无限重试，但减少日志噪音
+                                print(f"  警告: Torrent '{title}' 未能在 qBittorrent 列表中找到。") # 简化警告
+                                added_successfully = False # 明确标记为失败，并让外层except捕获
+                                # 不再假设成功，让seen_torrents在except块中处理
+
+                        else:
+                            print(f"  警告: 无法精确验证添加，请手动检查qBittorrent。") # 简化警告
+                            added_successfully = True # 如果无法验证，仍假定成功，避免无限重试，但减少日志噪音
+
+                        if added_successfully:
+                            record_seen_torrent(seen_torrents, unique_id) # 只有明确成功或无法验证时才加入 seen_torrents
+                        else:
+                            # 如果明确添加失败，则不加入 seen_torrents，以便下次循环可以重新尝试
+                            undecided_count += 1 # 任务失败时不做去重标记，也不推进水位线，留给下次重新尝试
+
+                    except Exception as add_e:
+                        print(f"  添加下载任务失败 '{title}': {add_e}")
+                        # 发生任何添加任务的异常，都标记为已处理，防止无限重试
+                        record_seen_torrent(seen_torrents, unique_id)
+                else:
+                    print(f"  (模拟运行) 将下载 '{title}' 到 '{target_path}'，标签: {target_tags}")
+                    record_seen_torrent(seen_torrents, unique_id)
+            else:
+                print(f"  决策: 跳过。" + (f" (规则: {decision['rule']})" if decision.get('rule') else ""))
+                record_seen_torrent(seen_torrents, unique_id)
 
-                            if added_successfully:
-                                seen_torrents.add(unique_id) # 只有明确成功或无法验证时才加入 seen_torrents
-                                save_seen_torrents(seen_torrents)
-                            else:
-                                # 如果明确添加失败，则不加入 seen_torrents，以便下次循环可以重新尝试
-                                pass # 任务失败时不做去重标记，留给下次重新尝试
-
-                        except Exception as add_e:
-                            print(f"  添加下载任务失败 '{title}': {add_e}")
-                            # 发生任何添加任务的异常，都标记为已处理，防止无限重试
-                            seen_torrents.add(unique_id) 
-                            save_seen_torrents(seen_torrents)
-                    else:
-                        print(f"  (模拟运行) 将下载 '{title}' 到 '{target_path}'，标签: {target_tags}")
-                        seen_torrents.add(unique_id)
-                        save_seen_torrents(seen_torrents)
+        save_decision_cache()
+
+        # 整个 Feed 处理完毕后才写入条件请求缓存和水位线，中途出错或有条目未能决策则下次重新处理
+        if undecided_count == 0:
+            commit_feed_http_cache(feed_url)
+            commit_feed_watermark(feed_name)
+
+    except LLMReplayMissError:
+        raise
+    except Exception as e: # 这个 try 块的 except，用于捕获整个 RSS 处理过程的错误
+        print(f"处理 RSS Feed '{feed_name}' 时发生错误: {e}")
+
+    return llm_calls_avoided
+
+
+# --- 运行参数 ---
+def load_run_settings(config):
+    """从配置中读取处理 Feed 所需的参数。"""
+    gemini_config = config['gemini']
+    compaction_config = config.get('description_compaction', {})
+    return {
+        "gemini_config": gemini_config,
+        "default_download_path": config.get('default_download_path', '/downloads/Others'),
+        "dry_run": config.get('dry_run', False),
+        "decision_batch_size": max(1, int(gemini_config.get('decision_batch_size', DEFAULT_DECISION_BATCH_SIZE))),
+        "pre_classifier_enabled": config.get('pre_classifier_enabled', True),
+        "resolve_concurrency": config.get('dmhy_resolve_concurrency', DEFAULT_RESOLVE_CONCURRENCY),
+        "description_compaction_enabled": compaction_config.get('enabled', True),
+        "description_token_cap": compaction_config.get('token_cap', DEFAULT_DESCRIPTION_TOKEN_CAP)
+    }
+
+# --- qBittorrent 连接 ---
+def connect_qbittorrent(qb_config):
+    qb = Client(qb_config['url'])
+    qb.login(qb_config['username'], qb_config['password'])
+    print(f"成功连接到 qBittorrent ({qb_config['url']}).")
+    sync_qb_torrents(qb) # 建立本地种子 hash 镜像，之后只做增量同步
+    return qb
+
+def ensure_qb_session(qb, qb_config):
+    """常驻模式下每次处理 Feed 前调用：增量同步失败 (例如会话过期) 时重新登录一次。"""
+    if sync_qb_torrents(qb):
+        return True
+    try:
+        qb.login(qb_config['username'], qb_config['password'])
+        print("已重新登录 qBittorrent。")
+    except Exception as e:
+        print(f"重新登录 qBittorrent 失败: {e}")
+        return False
+    return sync_qb_torrents(qb)
+
+# --- 单次运行：并发抓取所有 RSS Feed，耗时接近最慢的单个 Feed ---
+def run_once(config, qb, seen_torrents, settings):
+    llm_calls_avoided = 0
+    feed_fetch_concurrency = config.get('feed_fetch_concurrency', DEFAULT_FEED_FETCH_CONCURRENCY)
+    print(f"\n正在并发抓取 {len(config['rss_feeds'])} 个 RSS Feed (并发数: {feed_fetch_concurrency})...")
+    fetched_feeds = fetch_feeds_concurrently(config['rss_feeds'], feed_fetch_concurrency)
+
+    for feed_name, feed, fetch_error in fetched_feeds:
+        print(f"\n--- 处理 RSS Feed: {feed_name} ---")
+        if fetch_error:
+            print(f"处理 RSS Feed '{feed_name}' 时发生错误: {fetch_error}")
+            continue
+        if feed is None:
+            print("Feed 自上次处理后没有变化 (304 或内容相同)，跳过。")
+            continue
+        llm_calls_avoided += process_feed(feed_name, config['rss_feeds'][feed_name], feed, qb, seen_torrents, settings)
+
+    return llm_calls_avoided
+
+# --- 常驻模式：每个 Feed 按各自的间隔轮询，由最小堆调度 ---
+def run_daemon(config, qb, seen_torrents, settings):
+    """
+    保持 qBittorrent 会话、已处理集合、各类缓存和 Gemini 模型常驻内存，
+    每个 Feed 到期时才抓取。同一站点的请求按 host_min_interval_seconds 限速。
+    开启 adaptive_polling 时根据各 Feed 的发布节奏和 <ttl> 调整轮询间隔。按 Ctrl+C 退出。
+    """
+    daemon_config = config.get('daemon', {})
+    host_min_interval = daemon_config.get('host_min_interval_seconds', DEFAULT_HOST_MIN_INTERVAL)
+    adaptive_polling = daemon_config.get('adaptive_polling', True)
+    max_poll_interval = daemon_config.get('max_poll_interval_seconds', DEFAULT_MAX_FEED_POLL_INTERVAL)
+    init_feed_schedule(
+        config['rss_feeds'],
+        daemon_config.get('poll_interval_seconds', DEFAULT_FEED_POLL_INTERVAL),
+        daemon_config.get('feed_poll_intervals')
+    )
+    if adaptive_polling:
+        # 先用已保存条目的发布时间预热，第一轮抓取后即可按学到的节奏调度
+        seed_publish_history_from_analyzed_entries(config['rss_feeds'])
+        for feed_name in config['rss_feeds']:
+            update_feed_poll_interval(feed_name, max_poll_interval)
+    print(f"\n进入常驻模式，共 {len(config['rss_feeds'])} 个 RSS Feed{'，自适应轮询' if adaptive_polling else ''}。按 Ctrl+C 退出。")
+
+    llm_calls_avoided = 0
+    try:
+        while True:
+            feed_name = wait_for_next_feed()
+            if feed_name is None:
+                print("没有需要轮询的 RSS Feed。")
+                break
+            feed_url = config['rss_feeds'][feed_name]
+            print(f"\n--- [{time.strftime('%Y-%m-%d %H:%M:%S')}] 轮询 RSS Feed: {feed_name} ---")
+
+            wait_for_rate_limit(urlparse(feed_url).netloc, host_min_interval)
+            _, feed, fetch_error = fetch_feed(feed_name, feed_url)
+            if fetch_error:
+                print(f"处理 RSS Feed '{feed_name}' 时发生错误: {fetch_error}")
+            elif feed is None:
+                print("Feed 自上次处理后没有变化 (304 或内容相同)，跳过。")
+                save_feed_http_cache()
             else:
-                print(f"  决策: 跳过。")
-                seen_torrents.add(unique_id)
-                save_seen_torrents(seen_torrents)
+                observe_feed(feed_name, feed)
+                if qb is None or ensure_qb_session(qb, config['qbittorrent']):
+                    llm_calls_avoided += process_feed(feed_name, feed_url, feed, qb, seen_torrents, settings)
+                else:
+                    print("qBittorrent 暂不可用，本次不处理该 Feed，下次轮询时重试。")
+
+            poll_interval = update_feed_poll_interval(feed_name, max_poll_interval) if adaptive_polling else None
+            next_poll_time = reschedule_feed(feed_name, poll_interval)
+            save_feed_poll_schedule(FEED_POLL_SCHEDULE_FILE)
+            print(f"下次轮询 '{feed_name}': {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(next_poll_time))}")
+    except KeyboardInterrupt:
+        print("\n收到中断信号，退出常驻模式。")
 
-            time.sleep(1) # 每一个 entry 处理后的延迟
+    return llm_calls_avoided
+
+# --- 主逻辑函数 ---
+def main():
+    config = load_config()
+    daemon_mode = '--daemon' in sys.argv[1:] or config.get('daemon', {}).get('enabled', False)
+    llm_replay_mode = config.get('llm_replay', {}).get('mode', DEFAULT_LLM_REPLAY_MODE)
+    configure_llm_replay(llm_replay_mode, config.get('llm_replay', {}).get('store_dir', DEFAULT_LLM_REPLAY_STORE_DIR))
+    prepare_llm_replay_state('auto_torrent_downloader', [
+        SEEN_TORRENTS_FILE, SEEN_TORRENTS_JOURNAL_FILE, FEED_HTTP_CACHE_FILE, FEED_WATERMARK_FILE,
+        LINK_RESOLUTION_CACHE_FILE, DECISION_CACHE_FILE, FEED_POLL_SCHEDULE_FILE,
+        ENTRY_STORE_FILE, ENTRY_STORE_FILE + '-wal', LEGACY_ENTRIES_FILE # 常驻模式用已分析条目预热发布节奏
+    ])
+    seen_torrents = load_seen_torrent_set()
+    load_feed_http_cache()
+    load_feed_watermarks()
+    load_link_resolution_cache() # 与 interactive_qb_ai_v2 共用，已解析过的 dmhy 页面不再访问网络
+    load_decision_cache(
+        config['gemini'].get('decision_cache_max_entries', DEFAULT_DECISION_CACHE_MAX_ENTRIES),
+        config['gemini'].get('decision_cache_ttl_days', DEFAULT_DECISION_CACHE_TTL_DAYS)
+    )
+
+    settings = load_run_settings(config)
+    load_description_boilerplate(config.get('description_compaction', {}).get('boilerplate'))
+    if llm_replay_mode == "replay":
+        settings['dry_run'] = True # 回放不访问网络，也就不连接 qBittorrent，下载只模拟
+    if settings['pre_classifier_enabled']:
+        load_pre_classifier_rules(config.get('pre_classifier_rules'))
+
+    print(f"脚本以 {'模拟运行模式' if settings['dry_run'] else '实际运行模式'} 启动{'，常驻模式' if daemon_mode else ''}。")
+
+    qb = None
+    if llm_replay_mode == "replay":
+        print("回放模式: 不连接 qBittorrent。")
+    else:
+        try:
+            qb = connect_qbittorrent(config['qbittorrent'])
+        except Exception as e:
+            print(f"连接或登录 qBittorrent 失败: {e}")
+            print("请检查 qBittorrent Web UI 是否开启，以及配置文件中的 URL、用户名和密码是否正确。")
+            exit()
 
-        except Exception as e: # 这个 try 块的 except，用于捕获整个 RSS 处理过程的错误
-            print(f"处理 RSS Feed '{feed_name}' 时发生错误: {e}")
-        
-        time.sleep(5) # 整个 RSS Feed 处理完后的延迟
+    if daemon_mode:
+        llm_calls_avoided = run_daemon(config, qb, seen_torrents, settings)
+    else:
+        llm_calls_avoided = run_once(config, qb, seen_torrents, settings)
+
+    # 把本次运行追加的日志合并回 seen_torrents.json 快照
+    compact_seen_torrents(seen_torrents)
+
+    if settings['pre_classifier_enabled']:
+        rule_stats = get_pre_classifier_stats()
+        print(f"\n本地规则预分类: 直接判定 {rule_stats['settled_locally']} 条，未命中规则 {rule_stats['not_settled_locally']} 条，避免约 {llm_calls_avoided} 次 LLM 调用。")
+        for rule_name, hit_count in rule_stats['rule_hits'].items():
+            if hit_count:
+                print(f"  - {rule_name}: {hit_count} 条")
+
+    save_decision_cache()
+    cache_stats = get_decision_cache_stats()
+    print(f"\n决策缓存: 命中 {cache_stats['hits']} 次，未命中 {cache_stats['misses']} 次，当前缓存 {cache_stats['size']} 条。")
+    print(f"实际发给 Gemini 判断: {GEMINI_DECISION_STATS['entries']} 条，共 {GEMINI_DECISION_STATS['batches']} 批。")
+    if llm_replay_mode != DEFAULT_LLM_REPLAY_MODE:
+        llm_replay_stats = get_llm_replay_stats()
+        print(f"LLM 记录/回放 ({llm_replay_mode}): 命中 {llm_replay_stats['hits']} 次，未命中 {llm_replay_stats['misses']} 次，新记录 {llm_replay_stats['recorded']} 次。")
 
     if qb:
         try:
@@ -345,4 +587,4 @@ def main():
     print("\n脚本执行完毕。")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+"""
+对比 dmhy 页面下载链接提取的两种实现：
+  - extract_download_link_from_page   (BeautifulSoup 完整解析)
+  - extract_download_link_from_chunks (字节级流式扫描，找到第一个磁力链接即停止)
+
+用法:
+  python bench_magnet_extractor.py [页面目录] [重复次数]
+  python bench_magnet_extractor.py --download [页面目录] [页面数量]   # 从 ai_analyzed_entries.json 中下载 dmhy 页面保存到目录
+"""
+import json
+import os
+import sys
+import time
+from dmhy_resolver import (
+    extract_download_link_from_page,
+    extract_download_link_from_chunks,
+    get_http_session,
+    DMHY_TOPIC_MARKER,
+    RESOLVE_REQUEST_TIMEOUT,
+    STREAM_CHUNK_SIZE
+)
+
+AI_ANALYZED_ENTRIES_FILE = 'ai_analyzed_entries.json'
+DEFAULT_PAGES_DIR = 'dmhy_pages'
+DEFAULT_REPEAT = 20
+PAGE_URL_FILE = 'urls.json' # 保存 文件名 -> 原始页面地址，用于 urljoin
+
+
+# --- 下载样本页面 ---
+def download_sample_pages(pages_dir, count):
+    with open(AI_ANALYZED_ENTRIES_FILE, 'r', encoding='utf-8') as f:
+        entries = json.load(f)
+    links = [e['original_link'] for e in entries if DMHY_TOPIC_MARKER in (e.get('original_link') or '')][:count]
+
+    os.makedirs(pages_dir, exist_ok=True)
+    session = get_http_session()
+    page_urls = {}
+    for i, link in enumerate(links):
+        try:
+            response = session.get(link, timeout=RESOLVE_REQUEST_TIMEOUT)
+            response.raise_for_status()
+        except Exception as e:
+            print(f"  下载 '{link}' 失败: {e}")
+            continue
+        file_name = f"page_{i:04d}.html"
+        with open(os.path.join(pages_dir, file_name), 'wb') as f:
+            f.write(response.content)
+        page_urls[file_name] = link
+        print(f"  已保存 {file_name} ({len(response.content)} 字节)")
+
+    with open(os.path.join(pages_dir, PAGE_URL_FILE), 'w', encoding='utf-8') as f:
+        json.dump(page_urls, f, ensure_ascii=False, indent=4)
+
+# --- 加载样本页面 ---
+def load_sample_pages(pages_dir):
+    page_urls = {}
+    url_file = os.path.join(pages_dir, PAGE_URL_FILE)
+    if os.path.exists(url_file):
+        with open(url_file, 'r', encoding='utf-8') as f:
+            page_urls = json.load(f)
+
+    pages = []
+    for file_name in sorted(os.listdir(pages_dir)):
+        if not file_name.endswith('.html'):
+            continue
+        with open(os.path.join(pages_dir, file_name), 'rb') as f:
+            body = f.read()
+        page_url = page_urls.get(file_name, 'http://share.dmhy.org/topics/view/' + file_name)
+        pages.append((file_name, page_url, body))
+    return pages
+
+# --- 计时 ---
+def run_benchmark(pages, repeat):
+    mismatches = 0
+    for file_name, page_url, body in pages:
+        expected = extract_download_link_from_page(body.decode('utf-8', errors='replace'), page_url)
+        actual = extract_download_link_from_chunks(
+            (body[i:i + STREAM_CHUNK_SIZE] for i in range(0, len(body), STREAM_CHUNK_SIZE)), page_url
+        )
+        if expected != actual:
+            mismatches += 1
+            print(f"  结果不一致: {file_name}\n    BeautifulSoup: {expected}\n    流式扫描:      {actual}")
+
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for _, page_url, body in pages:
+            extract_download_link_from_page(body.decode('utf-8', errors='replace'), page_url)
+    soup_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for _, page_url, body in pages:
+            extract_download_link_from_chunks(
+                (body[i:i + STREAM_CHUNK_SIZE] for i in range(0, len(body), STREAM_CHUNK_SIZE)), page_url
+            )
+    stream_seconds = time.perf_counter() - start
+
+    runs = repeat * len(pages)
+    print(f"页面数: {len(pages)}，每种实现运行 {runs} 次，结果不一致: {mismatches}")
+    print(f"  BeautifulSoup: 总计 {soup_seconds:.3f}s，平均 {soup_seconds / runs * 1000:.3f} ms/页")
+    print(f"  流式扫描:      总计 {stream_seconds:.3f}s，平均 {stream_seconds / runs * 1000:.3f} ms/页")
+    if stream_seconds > 0:
+        print(f"  加速比: {soup_seconds / stream_seconds:.1f}x")
+
+
+def main():
+    args = sys.argv[1:]
+    if args and args[0] == '--download':
+        pages_dir = args[1] if len(args) > 1 else DEFAULT_PAGES_DIR
+        count = int(args[2]) if len(args) > 2 else 50
+        download_sample_pages(pages_dir, count)
+        return
+
+    pages_dir = args[0] if args else DEFAULT_PAGES_DIR
+    repeat = int(args[1]) if len(args) > 1 else DEFAULT_REPEAT
+    if not os.path.isdir(pages_dir):
+        print(f"错误: 页面目录 '{pages_dir}' 不存在。可先运行: python {sys.argv[0]} --download {pages_dir} 50")
+        return
+
+    pages = load_sample_pages(pages_dir)
+    if not pages:
+        print(f"错误: 页面目录 '{pages_dir}' 中没有 .html 文件。")
+        return
+    run_benchmark(pages, repeat)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+import copy
+import hashlib
+import json
+import os
+import time
+from collections import OrderedDict
+from json.decoder import JSONDecodeError
+
+from text_normalizer import normalize_text
+
+# --- 配置及文件路径 ---
+DECISION_CACHE_FILE = 'decision_cache.json'
+DEFAULT_DECISION_CACHE_MAX_ENTRIES = 5000
+DEFAULT_DECISION_CACHE_TTL_DAYS = 90
+
+# --- 全局变量 ---
+DECISION_CACHE = OrderedDict() # {key: {"decision": {...}, "ts": 写入时间}}，按最近使用排序 (LRU)
+DECISION_CACHE_MAX_ENTRIES = DEFAULT_DECISION_CACHE_MAX_ENTRIES
+DECISION_CACHE_TTL_SECONDS = DEFAULT_DECISION_CACHE_TTL_DAYS * 86400
+DECISION_CACHE_HITS = 0
+DECISION_CACHE_MISSES = 0
+_DECISION_CACHE_DIRTY = False
+
+
+# --- 指纹 ---
+def make_decision_cache_key(title, description, prompt_version):
+    """由规范化后的标题、描述和提示词版本生成缓存键。提示词改动后升级版本号即可让旧决策失效。"""
+    fingerprint_source = f"{prompt_version}\n{normalize_text(title)}\n{normalize_text(description)}"
+    return hashlib.sha256(fingerprint_source.encode('utf-8')).hexdigest()
+
+
+# --- 加载/保存决策缓存 ---
+def load_decision_cache(max_entries=DEFAULT_DECISION_CACHE_MAX_ENTRIES, ttl_days=DEFAULT_DECISION_CACHE_TTL_DAYS):
+    global DECISION_CACHE, DECISION_CACHE_MAX_ENTRIES, DECISION_CACHE_TTL_SECONDS, DECISION_CACHE_HITS, DECISION_CACHE_MISSES, _DECISION_CACHE_DIRTY
+    DECISION_CACHE = OrderedDict()
+    DECISION_CACHE_MAX_ENTRIES = max(1, int(max_entries))
+    DECISION_CACHE_TTL_SECONDS = float(ttl_days) * 86400
+    DECISION_CACHE_HITS = 0
+    DECISION_CACHE_MISSES = 0
+    _DECISION_CACHE_DIRTY = False
+
+    if not os.path.exists(DECISION_CACHE_FILE):
+        return
+    try:
+        with open(DECISION_CACHE_FILE, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        now = time.time()
+        # 文件中按从旧到新的使用顺序保存
+        for item in data if isinstance(data, list) else []:
+            if not isinstance(item, dict) or 'key' not in item or 'decision' not in item:
+                continue
+            if now - item.get('ts', 0) > DECISION_CACHE_TTL_SECONDS:
+                continue
+            DECISION_CACHE[item['key']] = {"decision": item['decision'], "ts": item.get('ts', 0)}
+        while len(DECISION_CACHE) > DECISION_CACHE_MAX_ENTRIES:
+            DECISION_CACHE.popitem(last=False)
+    except JSONDecodeError:
+        print(f"警告: 无法解析文件 '{DECISION_CACHE_FILE}' (文件为空或JSON格式错误)。将使用空的决策缓存。")
+        DECISION_CACHE = OrderedDict()
+    except Exception as e:
+        print(f"警告: 读取文件 '{DECISION_CACHE_FILE}' 发生错误: {e}。将使用空的决策缓存。")
+        DECISION_CACHE = OrderedDict()
+
+def save_decision_cache():
+    global _DECISION_CACHE_DIRTY
+    if not _DECISION_CACHE_DIRTY:
+        return
+    items_to_save = [{"key": key, "decision": value['decision'], "ts": value['ts']} for key, value in DECISION_CACHE.items()]
+    temp_file = DECISION_CACHE_FILE + '.tmp'
+    with open(temp_file, 'w', encoding='utf-8') as f:
+        json.dump(items_to_save, f, ensure_ascii=False)
+    os.replace(temp_file, DECISION_CACHE_FILE)
+    _DECISION_CACHE_DIRTY = False
+
+
+# --- 查询/写入 ---
+def has_cached_decision(key):
+    """是否有未过期的缓存决策，不计入命中/未命中统计。"""
+    cached = DECISION_CACHE.get(key)
+    return cached is not None and time.time() - cached['ts'] <= DECISION_CACHE_TTL_SECONDS
+
+def get_cached_decision(key):
+    """命中且未过期时返回决策副本并计为一次命中，否则返回 None 并计为一次未命中。"""
+    global DECISION_CACHE_HITS, DECISION_CACHE_MISSES, _DECISION_CACHE_DIRTY
+    cached = DECISION_CACHE.get(key)
+    if cached is not None and time.time() - cached['ts'] > DECISION_CACHE_TTL_SECONDS:
+        del DECISION_CACHE[key]
+        _DECISION_CACHE_DIRTY = True
+        cached = None
+
+    if cached is None:
+        DECISION_CACHE_MISSES += 1
+        return None
+
+    DECISION_CACHE.move_to_end(key)
+    _DECISION_CACHE_DIRTY = True
+    DECISION_CACHE_HITS += 1
+    return copy.deepcopy(cached['decision'])
+
+def put_cached_decision(key, decision):
+    global _DECISION_CACHE_DIRTY
+    DECISION_CACHE[key] = {"decision": decision, "ts": time.time()}
+    DECISION_CACHE.move_to_end(key)
+    while len(DECISION_CACHE) > DECISION_CACHE_MAX_ENTRIES:
+        DECISION_CACHE.popitem(last=False)
+    _DECISION_CACHE_DIRTY = True
+
+def get_decision_cache_stats():
+    return {"hits": DECISION_CACHE_HITS, "misses": DECISION_CACHE_MISSES, "size": len(DECISION_CACHE)}
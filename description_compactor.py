@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+"""
+发给 Gemini 之前压缩资源描述 (提取元数据和下载决策的 prompt 共用)。
+
+  - 去掉 HTML 标签 (包括 RSS 截断后残留的半个标签) 和链接，反转义实体，合并空白
+  - 按发布组去掉固定的宣传文字 (例如天使动漫每条都带的 "8350张Hi-Res自购专辑全网首发…")，
+    发布组由标题或描述中出现的组名识别，config.json 的 description_compaction.boilerplate 可追加
+  - 去掉与标题重复的部分，只保留标题之外的信息 (例如文件大小)
+  - 每条描述不超过 token_cap 个估算 token，超出部分截断
+"""
+import html
+import re
+
+from gemini_quota import estimate_token_count
+
+# --- 配置 ---
+DEFAULT_DESCRIPTION_TOKEN_CAP = 120
+TRUNCATION_MARK = "…"
+
+# 各发布组的固定宣传文字，按行匹配 (re.search)，命中的行整行去掉
+DEFAULT_DESCRIPTION_BOILERPLATE = {
+    "天使动漫": [
+        r'^\d+张Hi-Res', # 8350张Hi-Res自购专辑全网首发 16900张CD自抓 (常被截断)
+        r'^\d+(?:本|\.\.\.|…)', # 3900本精美画册下载 (常被截断)
+        r'^【(?:天使动漫|[^】]*(?:活动|坛庆|元旦|圣诞|春节|新年))', # 论坛活动公告
+        r'送祝福',
+        r'Quick upgrade method|アカウントアップグレード',
+    ],
+}
+
+# --- 全局变量 ---
+DESCRIPTION_BOILERPLATE_PATTERNS = {} # {发布组名: [编译后的正则]}
+
+_LINE_BREAK_TAG_PATTERN = re.compile(r'<\s*(?:br|/p|p|/div|div|/li)\b[^>]*>', re.IGNORECASE)
+_HTML_TAG_PATTERN = re.compile(r'<[^>]*>')
+_DANGLING_TAG_PATTERN = re.compile(r'<[^>]*$')
+_URL_PATTERN = re.compile(r'(?:https?://|www\.)\S+', re.IGNORECASE)
+_INLINE_WHITESPACE_PATTERN = re.compile(r'[ \t\r\f\v 　]+')
+_ELLIPSIS_ONLY_PATTERN = re.compile(r'^[.。…·\s]*$')
+
+
+# --- 加载规则 ---
+def load_description_boilerplate(extra_boilerplate=None):
+    """加载默认规则和 config.json 中的 description_compaction.boilerplate ({发布组名: [正则, ...]})，同名的组合并。"""
+    DESCRIPTION_BOILERPLATE_PATTERNS.clear()
+    for boilerplate in (DEFAULT_DESCRIPTION_BOILERPLATE, extra_boilerplate or {}):
+        for team_name, patterns in boilerplate.items():
+            compiled_patterns = DESCRIPTION_BOILERPLATE_PATTERNS.setdefault(team_name, [])
+            for pattern in patterns or []:
+                try:
+                    compiled_patterns.append(re.compile(pattern))
+                except re.error as e:
+                    print(f"警告: 描述压缩规则 '{team_name}': '{pattern}' 不是有效的正则表达式，已忽略: {e}")
+
+
+# --- 压缩 ---
+def _description_lines(description):
+    text = _LINE_BREAK_TAG_PATTERN.sub('\n', description)
+    text = _DANGLING_TAG_PATTERN.sub('', _HTML_TAG_PATTERN.sub(' ', text))
+    text = _URL_PATTERN.sub(' ', html.unescape(text))
+    lines = (_INLINE_WHITESPACE_PATTERN.sub(' ', line).strip() for line in text.split('\n'))
+    return [line for line in lines if line and not _ELLIPSIS_ONLY_PATTERN.match(line)]
+
+def _truncate_to_token_cap(text, token_cap):
+    if token_cap is None or estimate_token_count(text) <= token_cap:
+        return text
+    low, high = 0, len(text)
+    while low < high: # 二分查找不超过上限的最长前缀
+        middle = (low + high + 1) // 2
+        if estimate_token_count(text[:middle]) < token_cap:
+            low = middle
+        else:
+            high = middle - 1
+    return text[:low].rstrip() + TRUNCATION_MARK
+
+def compact_description(description, title=None, token_cap=DEFAULT_DESCRIPTION_TOKEN_CAP):
+    """返回压缩后的描述 (见模块说明)，没有剩余内容时返回空字符串。token_cap 为 None 时不截断。"""
+    if not description:
+        return ''
+    lines = _description_lines(description)
+
+    team_text = f"{title or ''}\n{description}"
+    patterns = [pattern for team_name, team_patterns in DESCRIPTION_BOILERPLATE_PATTERNS.items()
+                if team_name in team_text for pattern in team_patterns]
+    if patterns:
+        lines = [line for line in lines if not any(pattern.search(line) for pattern in patterns)]
+
+    if title:
+        title_text = _INLINE_WHITESPACE_PATTERN.sub(' ', html.unescape(title)).strip()
+        lines = [line.replace(title_text, ' ').strip() if title_text else line for line in lines]
+        lines = [line for line in lines if line]
+
+    return _truncate_to_token_cap(' / '.join(lines), token_cap)
+
+
+load_description_boilerplate()
@@ -0,0 +1,238 @@
+# -*- coding: utf-8 -*-
+import html
+import json
+import os
+import re
+import threading
+from json.decoder import JSONDecodeError
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urljoin
+import requests
+from requests.adapters import HTTPAdapter
+from bs4 import BeautifulSoup
+
+from llm_replay import fetch_http_with_replay, get_llm_replay_mode, LLMReplayMissError
+
+# --- 配置及文件路径 ---
+LINK_RESOLUTION_CACHE_FILE = 'link_resolution_cache.json'
+DEFAULT_RESOLVE_CONCURRENCY = 8
+RESOLVE_REQUEST_TIMEOUT = 15
+STREAM_CHUNK_SIZE = 16384
+DMHY_TOPIC_MARKER = "share.dmhy.org/topics/view/"
+RESOLVER_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
+}
+
+# --- 流式提取用的字节级正则 (只匹配 <a> 标签中带完整引号的 href) ---
+_MAGNET_HREF_PATTERN = re.compile(rb'<a\b[^>]*?\bhref\s*=\s*(?:"((?-i:magnet:)[^"]*)"|\'((?-i:magnet:)[^\']*)\')', re.IGNORECASE)
+_TORRENT_HREF_PATTERN = re.compile(rb'<a\b[^>]*?\bhref\s*=\s*(?:"([^"]*(?-i:\.torrent))"|\'([^\']*(?-i:\.torrent))\')', re.IGNORECASE)
+_STREAM_TAIL_KEEP = 8192 # 跨块匹配时保留的尾部字节数，足以容纳带大量 tracker 的磁力链接
+
+# --- 全局变量 ---
+_HTTP_SESSION = None
+_HTTP_SESSION_POOL_SIZE = 0
+_HTTP_SESSION_LOCK = threading.Lock()
+LINK_RESOLUTION_CACHE = {} # 持久化的 original_link -> 实际下载链接 映射，命中时不访问网络
+_LINK_RESOLUTION_CACHE_DIRTY = False
+_LINK_RESOLUTION_CACHE_LOCK = threading.Lock()
+
+
+# --- 加载/保存链接解析缓存 ---
+def load_link_resolution_cache():
+    global LINK_RESOLUTION_CACHE, _LINK_RESOLUTION_CACHE_DIRTY
+    _LINK_RESOLUTION_CACHE_DIRTY = False
+    if not os.path.exists(LINK_RESOLUTION_CACHE_FILE):
+        LINK_RESOLUTION_CACHE = {}
+        return
+    try:
+        with open(LINK_RESOLUTION_CACHE_FILE, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+            LINK_RESOLUTION_CACHE = data if isinstance(data, dict) else {}
+    except JSONDecodeError:
+        print(f"警告: 无法解析文件 '{LINK_RESOLUTION_CACHE_FILE}' (文件为空或JSON格式错误)。将使用空缓存。")
+        LINK_RESOLUTION_CACHE = {}
+    except Exception as e:
+        print(f"警告: 读取文件 '{LINK_RESOLUTION_CACHE_FILE}' 发生错误: {e}。将使用空缓存。")
+        LINK_RESOLUTION_CACHE = {}
+
+def save_link_resolution_cache(force=False):
+    """缓存有新增内容时才写盘。"""
+    global _LINK_RESOLUTION_CACHE_DIRTY
+    with _LINK_RESOLUTION_CACHE_LOCK:
+        if not (_LINK_RESOLUTION_CACHE_DIRTY or force):
+            return
+        cache_to_save = dict(LINK_RESOLUTION_CACHE)
+        _LINK_RESOLUTION_CACHE_DIRTY = False
+    with open(LINK_RESOLUTION_CACHE_FILE, 'w', encoding='utf-8') as f:
+        json.dump(cache_to_save, f, ensure_ascii=False, indent=4)
+
+def remember_resolved_link(original_link, actual_download_link):
+    """记录一次成功的解析结果；与原始链接相同 (即未真正解析) 的不记录。"""
+    global _LINK_RESOLUTION_CACHE_DIRTY
+    if not original_link or not actual_download_link or actual_download_link == original_link:
+        return
+    with _LINK_RESOLUTION_CACHE_LOCK:
+        if LINK_RESOLUTION_CACHE.get(original_link) != actual_download_link:
+            LINK_RESOLUTION_CACHE[original_link] = actual_download_link
+            _LINK_RESOLUTION_CACHE_DIRTY = True
+
+def seed_link_resolution_cache(entries):
+    """用已分析条目 (ai_analyzed_entries.json) 中的 original_link/actual_download_link 填充缓存。"""
+    for entry_data in entries:
+        remember_resolved_link(entry_data.get('original_link'), entry_data.get('actual_download_link'))
+
+
+# --- 共享的 keep-alive 连接池 ---
+def get_http_session(pool_size=DEFAULT_RESOLVE_CONCURRENCY):
+    """返回进程内共享的 requests.Session，连接池大小不小于 pool_size，避免每个页面重新握手。"""
+    global _HTTP_SESSION, _HTTP_SESSION_POOL_SIZE
+    with _HTTP_SESSION_LOCK:
+        if _HTTP_SESSION is None or pool_size > _HTTP_SESSION_POOL_SIZE:
+            session = requests.Session()
+            session.headers.update(RESOLVER_HEADERS)
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size, max_retries=1)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            if _HTTP_SESSION is not None:
+                _HTTP_SESSION.close()
+            _HTTP_SESSION = session
+            _HTTP_SESSION_POOL_SIZE = pool_size
+        return _HTTP_SESSION
+
+# --- 从 dmhy 页面中提取下载链接 ---
+def extract_download_link_from_page(html_text, page_url):
+    """
+    (BeautifulSoup 完整解析版本，保留作为基准和对照)
+    优先返回页面中第一个磁力链接，其次返回 .torrent 链接 (转换为绝对地址)，都没有则返回 None。
+    """
+    soup = BeautifulSoup(html_text, 'html.parser')
+
+    magnet_links_on_page = soup.find_all('a', href=re.compile(r'^magnet:'))
+    if magnet_links_on_page:
+        return magnet_links_on_page[0]['href']
+
+    torrent_links_on_page = soup.find_all('a', href=re.compile(r'\.torrent$'))
+    if torrent_links_on_page:
+        relative_path = torrent_links_on_page[0]['href']
+        return urljoin(page_url, relative_path)
+    return None
+
+def extract_download_link_from_chunks(chunks, page_url, encoding='utf-8'):
+    """
+    流式版本：逐块扫描页面字节，遇到第一个磁力链接 href 立即返回，不构建 DOM 树。
+    扫描完仍没有磁力链接时，返回第一个 .torrent href (按 urljoin 转换为绝对地址)。
+    结果与 extract_download_link_from_page 一致 (href 中的 HTML 实体会被解码)。
+    """
+    buffer = b''
+    first_torrent_href = None
+    for chunk in chunks:
+        if not chunk:
+            continue
+        buffer += chunk
+
+        magnet_match = _MAGNET_HREF_PATTERN.search(buffer)
+        if magnet_match:
+            magnet_href = magnet_match.group(1) or magnet_match.group(2)
+            return html.unescape(magnet_href.decode(encoding, errors='replace'))
+
+        if first_torrent_href is None:
+            torrent_match = _TORRENT_HREF_PATTERN.search(buffer)
+            if torrent_match:
+                first_torrent_href = torrent_match.group(1) or torrent_match.group(2)
+
+        # 只保留可能包含未闭合 <a 标签的尾部，避免重复扫描整个页面
+        last_tag_start = buffer.rfind(b'<')
+        if last_tag_start >= 0 and len(buffer) - last_tag_start <= _STREAM_TAIL_KEEP:
+            buffer = buffer[last_tag_start:]
+        else:
+            buffer = buffer[-_STREAM_TAIL_KEEP:]
+
+    if first_torrent_href is not None:
+        relative_path = html.unescape(first_torrent_href.decode(encoding, errors='replace'))
+        return urljoin(page_url, relative_path)
+    return None
+
+def extract_download_link_from_response(response, page_url):
+    """对 stream=True 的响应进行流式提取，找到磁力链接后不再读取剩余内容。"""
+    return extract_download_link_from_chunks(
+        response.iter_content(chunk_size=STREAM_CHUNK_SIZE),
+        page_url,
+        response.encoding or 'utf-8'
+    )
+
+def _get_page_response(session, page_url):
+    """记录/回放模式下整页下载 (不能中途停止读取)，返回 (状态码, 响应头, 正文)。"""
+    response = session.get(page_url, timeout=RESOLVE_REQUEST_TIMEOUT)
+    return response.status_code, {"encoding": response.encoding}, response.content
+
+def _fetch_download_link_from_page(session, page_url):
+    """访问 dmhy 页面并提取下载链接。live 模式流式读取，找到链接即停止。"""
+    if get_llm_replay_mode() == "live":
+        with session.get(page_url, timeout=RESOLVE_REQUEST_TIMEOUT, stream=True) as response:
+            response.raise_for_status()
+            return extract_download_link_from_response(response, page_url)
+
+    status_code, response_headers, body = fetch_http_with_replay(page_url, lambda: _get_page_response(session, page_url))
+    if status_code >= 400:
+        raise requests.HTTPError(f"{status_code} Error for url: {page_url}")
+    return extract_download_link_from_chunks([body], page_url, response_headers.get('encoding') or 'utf-8')
+
+# --- 解析单个 RSS entry 的下载链接 ---
+def resolve_download_link(entry, session=None, log_errors=False):
+    """
+    依次检查 enclosure、原始磁力链接和 dmhy 话题页面，返回实际下载链接。
+    dmhy 页面先查 LINK_RESOLUTION_CACHE，命中则不访问网络。
+    dmhy 页面访问或解析失败 (或页面中没有链接) 时返回 None；其他类型的链接原样返回。
+    """
+    original_link = entry.get('link')
+
+    enclosures = entry.get('enclosures') or []
+    for enc in enclosures:
+        href = enc.get('href')
+        if href:
+            if enc.get('type') == 'application/x-bittorrent' or href.startswith('magnet:'):
+                return href
+
+    if original_link and original_link.startswith('magnet:'):
+        return original_link
+    elif original_link and DMHY_TOPIC_MARKER in original_link:
+        cached_link = LINK_RESOLUTION_CACHE.get(original_link)
+        if cached_link:
+            return cached_link
+
+        session = session or get_http_session()
+        try:
+            actual_download_link = _fetch_download_link_from_page(session, original_link)
+            remember_resolved_link(original_link, actual_download_link)
+            return actual_download_link
+        except LLMReplayMissError:
+            raise
+        except requests.exceptions.RequestException as req_e:
+            if log_errors:
+                print(f"  访问网页 '{original_link}' 失败: {req_e}")
+        except Exception as parse_e:
+            if log_errors:
+                print(f"  解析网页 '{original_link}' 内容失败: {parse_e}")
+        return None
+
+    return original_link
+
+# --- 批量并发解析 ---
+def resolve_download_links(entries, max_workers=DEFAULT_RESOLVE_CONCURRENCY, log_errors=False):
+    """
+    通过共享连接池并发解析一批 RSS entry 的下载链接。
+    返回与 entries 顺序一致的链接列表 (无法解析的为 None)。新解析出的链接会写入持久缓存。
+    """
+    if not entries:
+        return []
+
+    max_workers = max(1, int(max_workers or 1))
+    session = get_http_session(max_workers)
+    if max_workers == 1 or len(entries) == 1:
+        resolved_links = [resolve_download_link(entry, session, log_errors) for entry in entries]
+    else:
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(entries))) as executor:
+            resolved_links = list(executor.map(lambda entry: resolve_download_link(entry, session, log_errors), entries))
+
+    save_link_resolution_cache()
+    return resolved_links
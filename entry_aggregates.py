@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+"""
+对话工具 list_recent_animes_with_music / get_overall_resource_summary 使用的物化汇总，
+在条目加入 (ALL_AI_SEARCHABLE_ENTRIES) 和下载 (加入 SEEN_TORRENTS) 时增量更新，查询时不再遍历全部条目。
+
+  - 条目总数
+  - 未处理条目池: 列表 + 位置表，增删 O(1)，随机抽样 O(k)
+  - 每部动漫未处理的音乐条目: 按发布时间倒序的有序键列表 (数量即列表长度，最新一条即第一项)，
+    各动漫再按最新音乐的时间排成有序列表
+"""
+import bisect
+import random
+from entry_index import to_timestamp
+
+# --- 配置 ---
+ANIME_MUSIC_MEDIA_TYPE = "动漫音乐"
+
+# --- 全局变量 ---
+TOTAL_ENTRY_COUNT = 0
+UNIQUE_ID_TO_ENTRY_ID = {} # {unique_id: 条目编号}
+UNSEEN_ENTRY_POOL = [] # 未处理条目的编号 (无序)
+UNSEEN_POOL_POSITIONS = {} # {条目编号: 在 UNSEEN_ENTRY_POOL 中的位置}
+ENTRY_ANIME_MUSIC = {} # {条目编号: (动漫名, 时间键)}，只记录动漫音乐条目
+ANIME_MUSIC_KEYS = {} # {动漫名: 未处理音乐条目的时间键升序列表 (-发布时间戳, 条目编号)}
+ANIME_ORDER_KEYS = [] # [(最新音乐的时间键, 动漫名)] 升序，即最近有更新的动漫在前
+
+
+# --- 建立/维护汇总 ---
+def reset_entry_aggregates():
+    global TOTAL_ENTRY_COUNT
+    TOTAL_ENTRY_COUNT = 0
+    UNIQUE_ID_TO_ENTRY_ID.clear()
+    UNSEEN_ENTRY_POOL.clear()
+    UNSEEN_POOL_POSITIONS.clear()
+    ENTRY_ANIME_MUSIC.clear()
+    ANIME_MUSIC_KEYS.clear()
+    ANIME_ORDER_KEYS.clear()
+
+def _make_time_key(entry_id, published):
+    published_timestamp = to_timestamp(published)
+    return (-published_timestamp if published_timestamp is not None else float('inf'), entry_id)
+
+def _add_anime_music_key(anime_title, time_key):
+    keys = ANIME_MUSIC_KEYS.setdefault(anime_title, [])
+    if keys:
+        ANIME_ORDER_KEYS.pop(bisect.bisect_left(ANIME_ORDER_KEYS, (keys[0], anime_title)))
+    bisect.insort(keys, time_key)
+    bisect.insort(ANIME_ORDER_KEYS, (keys[0], anime_title))
+
+def _remove_anime_music_key(anime_title, time_key):
+    keys = ANIME_MUSIC_KEYS.get(anime_title)
+    if not keys:
+        return
+    position = bisect.bisect_left(keys, time_key)
+    if position >= len(keys) or keys[position] != time_key:
+        return
+    ANIME_ORDER_KEYS.pop(bisect.bisect_left(ANIME_ORDER_KEYS, (keys[0], anime_title)))
+    keys.pop(position)
+    if keys:
+        bisect.insort(ANIME_ORDER_KEYS, (keys[0], anime_title))
+    else:
+        del ANIME_MUSIC_KEYS[anime_title]
+
+def add_entry_to_aggregates(entry_id, entry_data, is_seen=False):
+    """新条目加入 ALL_AI_SEARCHABLE_ENTRIES 后调用。"""
+    global TOTAL_ENTRY_COUNT
+    TOTAL_ENTRY_COUNT += 1
+    UNIQUE_ID_TO_ENTRY_ID[entry_data['unique_id']] = entry_id
+
+    metadata = entry_data.get('metadata') or {}
+    anime_title = metadata.get('anime_title')
+    if anime_title and metadata.get('media_type') == ANIME_MUSIC_MEDIA_TYPE:
+        ENTRY_ANIME_MUSIC[entry_id] = (anime_title, _make_time_key(entry_id, entry_data.get('published_parsed')))
+
+    if not is_seen:
+        UNSEEN_POOL_POSITIONS[entry_id] = len(UNSEEN_ENTRY_POOL)
+        UNSEEN_ENTRY_POOL.append(entry_id)
+        if entry_id in ENTRY_ANIME_MUSIC:
+            _add_anime_music_key(*ENTRY_ANIME_MUSIC[entry_id])
+
+def update_entry_metadata_aggregates(entry_id, entry_data):
+    """条目的元数据被替换 (例如补全) 后调用，重新判断是否计入动漫音乐汇总。"""
+    if entry_id in ENTRY_ANIME_MUSIC:
+        if entry_id in UNSEEN_POOL_POSITIONS:
+            _remove_anime_music_key(*ENTRY_ANIME_MUSIC[entry_id])
+        del ENTRY_ANIME_MUSIC[entry_id]
+
+    metadata = entry_data.get('metadata') or {}
+    anime_title = metadata.get('anime_title')
+    if anime_title and metadata.get('media_type') == ANIME_MUSIC_MEDIA_TYPE:
+        ENTRY_ANIME_MUSIC[entry_id] = (anime_title, _make_time_key(entry_id, entry_data.get('published_parsed')))
+        if entry_id in UNSEEN_POOL_POSITIONS:
+            _add_anime_music_key(*ENTRY_ANIME_MUSIC[entry_id])
+
+def build_entry_aggregates(entries, seen_torrents):
+    reset_entry_aggregates()
+    for entry_id, entry_data in enumerate(entries):
+        add_entry_to_aggregates(entry_id, entry_data, entry_data['unique_id'] in seen_torrents)
+
+def mark_entry_seen(unique_id):
+    """资源被下载 (加入已处理列表) 后调用，把条目移出未处理池和动漫音乐汇总。"""
+    entry_id = UNIQUE_ID_TO_ENTRY_ID.get(unique_id)
+    position = UNSEEN_POOL_POSITIONS.pop(entry_id, None)
+    if position is None:
+        return
+    # 用最后一项填补空位，O(1) 删除
+    last_entry_id = UNSEEN_ENTRY_POOL.pop()
+    if last_entry_id != entry_id:
+        UNSEEN_ENTRY_POOL[position] = last_entry_id
+        UNSEEN_POOL_POSITIONS[last_entry_id] = position
+    if entry_id in ENTRY_ANIME_MUSIC:
+        _remove_anime_music_key(*ENTRY_ANIME_MUSIC[entry_id])
+
+
+# --- 查询 ---
+def get_total_entry_count():
+    return TOTAL_ENTRY_COUNT
+
+def get_entry_id(unique_id):
+    """unique_id 对应的条目编号 (ALL_AI_SEARCHABLE_ENTRIES 中的下标)，不存在时返回 None。"""
+    return UNIQUE_ID_TO_ENTRY_ID.get(unique_id)
+
+def sample_unseen_entries(count):
+    """从未处理条目中随机抽取最多 count 个编号。"""
+    count = max(0, min(count, len(UNSEEN_ENTRY_POOL)))
+    return random.sample(UNSEEN_ENTRY_POOL, count)
+
+def get_recent_anime_music(limit, latest_count=3):
+    """
+    返回最近有未处理音乐更新的 limit 部动漫: [(动漫名, 未处理音乐数量, 最新 latest_count 条的编号)]。
+    """
+    recent_animes = []
+    for _, anime_title in ANIME_ORDER_KEYS[:max(0, limit)]:
+        keys = ANIME_MUSIC_KEYS[anime_title]
+        recent_animes.append((anime_title, len(keys), [key[1] for key in keys[:latest_count]]))
+    return recent_animes
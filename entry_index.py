@@ -0,0 +1,257 @@
+# -*- coding: utf-8 -*-
+"""
+search_rss_items 使用的内存倒排索引，条目加入 ALL_AI_SEARCHABLE_ENTRIES 时同步维护。
+
+  - 元数据字段 (media_type / song_type / quality / anime_title / artists): 小写后的字段值 -> 条目编号集合，
+    另对各字段的不同取值建立 1-gram / 2-gram 索引，子串查询只需检查包含这些 gram 的少量取值
+  - 原始标题: 2-gram -> 条目编号集合，候选再用小写标题确认
+  - 多条件查询对各条件得到的编号集合求交集，从最小的集合开始
+  - 发布时间顺序: 有序键数组 (bisect 维护)，按时间倒序的分页用游标 (时间键 + 编号) 定位，
+    日期范围查询是数组上的区间扫描
+
+条目编号即条目在 ALL_AI_SEARCHABLE_ENTRIES 中的下标 (只追加，不删除)；元数据补全后用 reindex_entry_metadata() 原地更新。
+匹配语义与原先的逐条扫描一致 (不区分大小写的子串匹配)。
+"""
+
+import bisect
+import calendar
+from datetime import datetime
+
+# --- 配置 ---
+INDEXED_METADATA_FIELDS = ('media_type', 'song_type', 'quality', 'anime_title', 'artists')
+
+# --- 全局变量 ---
+FIELD_VALUE_POSTINGS = {} # {字段: {小写取值: {条目编号}}}
+FIELD_VALUE_GRAMS = {} # {字段: {gram: {小写取值}}}
+FIELD_PRESENT_IDS = {} # {字段: {该字段非空的条目编号}}
+TITLE_GRAM_POSTINGS = {} # {标题 2-gram: {条目编号}}
+TITLE_LOWER = [] # 条目编号 -> 小写的原始标题，用于确认候选
+ENTRY_TIME_KEYS = [] # 条目编号 -> 时间键 (-发布时间戳, 条目编号)，没有发布时间的为 (inf, 编号)
+TIME_ORDER_KEYS = [] # 所有时间键升序排列，即按发布时间倒序、同一时间按编号升序
+INDEXED_ENTRY_COUNT = 0
+
+
+# --- gram 切分 ---
+def _value_grams(text):
+    """字段取值的 1-gram 和 2-gram (取值种类少，两种都存，单字查询也能命中索引)。"""
+    grams = set(text)
+    grams.update(text[i:i + 2] for i in range(len(text) - 1))
+    return grams
+
+def _title_grams(text):
+    return {text[i:i + 2] for i in range(len(text) - 1)}
+
+def _intersect(sets):
+    """从最小的集合开始求交集。sets 为空时返回 None 表示“不限制”。"""
+    sets = sorted(sets, key=len)
+    if not sets:
+        return None
+    result = set(sets[0])
+    for other in sets[1:]:
+        if not result:
+            break
+        result &= other
+    return result
+
+
+# --- 建立/维护索引 ---
+def reset_entry_index():
+    global INDEXED_ENTRY_COUNT
+    FIELD_VALUE_POSTINGS.clear()
+    FIELD_VALUE_GRAMS.clear()
+    FIELD_PRESENT_IDS.clear()
+    TITLE_GRAM_POSTINGS.clear()
+    TITLE_LOWER.clear()
+    ENTRY_TIME_KEYS.clear()
+    TIME_ORDER_KEYS.clear()
+    for field in INDEXED_METADATA_FIELDS:
+        FIELD_VALUE_POSTINGS[field] = {}
+        FIELD_VALUE_GRAMS[field] = {}
+        FIELD_PRESENT_IDS[field] = set()
+    INDEXED_ENTRY_COUNT = 0
+
+def _index_field_value(field, value, entry_id):
+    value_lower = value.lower()
+    postings = FIELD_VALUE_POSTINGS[field].get(value_lower)
+    if postings is None:
+        postings = FIELD_VALUE_POSTINGS[field][value_lower] = set()
+        for gram in _value_grams(value_lower):
+            FIELD_VALUE_GRAMS[field].setdefault(gram, set()).add(value_lower)
+    postings.add(entry_id)
+    FIELD_PRESENT_IDS[field].add(entry_id)
+
+def _metadata_field_values(metadata, field):
+    value = metadata.get(field)
+    values = value if isinstance(value, list) else [value]
+    return [v for v in values if isinstance(v, str) and v]
+
+def index_entry(entry_id, entry_data):
+    """把 ALL_AI_SEARCHABLE_ENTRIES[entry_id] 加入索引，必须按编号顺序调用。"""
+    global INDEXED_ENTRY_COUNT
+    if not FIELD_VALUE_POSTINGS:
+        reset_entry_index()
+    metadata = entry_data.get('metadata') or {}
+    for field in INDEXED_METADATA_FIELDS:
+        for value in _metadata_field_values(metadata, field):
+            _index_field_value(field, value, entry_id)
+
+    title_lower = (entry_data.get('title') or '').lower()
+    TITLE_LOWER.append(title_lower)
+    for gram in _title_grams(title_lower):
+        TITLE_GRAM_POSTINGS.setdefault(gram, set()).add(entry_id)
+
+    published_timestamp = to_timestamp(entry_data.get('published_parsed'))
+    time_key = (-published_timestamp if published_timestamp is not None else float('inf'), entry_id)
+    ENTRY_TIME_KEYS.append(time_key)
+    bisect.insort(TIME_ORDER_KEYS, time_key) # 新条目通常最新，插入位置靠前但只是一次内存移动
+    INDEXED_ENTRY_COUNT = entry_id + 1
+
+def reindex_entry_metadata(entry_id, old_metadata, new_metadata):
+    """已索引条目的元数据被替换 (例如补全) 后调用，移除旧取值的编号并加入新取值。标题和发布时间不变。"""
+    old_metadata = old_metadata or {}
+    new_metadata = new_metadata or {}
+    for field in INDEXED_METADATA_FIELDS:
+        for value in _metadata_field_values(old_metadata, field):
+            # 取值本身保留在表中 (可能为空集合)，gram 索引无需改动
+            FIELD_VALUE_POSTINGS[field].get(value.lower(), set()).discard(entry_id)
+        FIELD_PRESENT_IDS[field].discard(entry_id)
+        for value in _metadata_field_values(new_metadata, field):
+            _index_field_value(field, value, entry_id)
+
+def to_timestamp(published):
+    """datetime / struct_time / [年, 月, 日, 时, 分, 秒] -> 秒 (按 UTC 解释)，无法解析时返回 None。"""
+    if isinstance(published, datetime):
+        published = published.timetuple()
+    try:
+        return calendar.timegm(tuple(published[:6]) + (0, 0, 0))
+    except (TypeError, ValueError, IndexError):
+        return None
+
+def build_entry_index(entries):
+    reset_entry_index()
+    for entry_id, entry_data in enumerate(entries):
+        index_entry(entry_id, entry_data)
+
+
+# --- 查询 ---
+def _values_containing(field, query_lower):
+    """该字段中包含 query_lower 的所有取值。"""
+    gram_sets = [FIELD_VALUE_GRAMS[field].get(gram, set()) for gram in _value_grams(query_lower)]
+    candidates = _intersect(gram_sets) or set()
+    return [value for value in candidates if query_lower in value]
+
+def find_entries_with_field(field, query):
+    """字段取值包含 query (不区分大小写) 的条目编号集合。artists 为列表，任一艺术家匹配即可。"""
+    query_lower = query.lower()
+    if not query_lower:
+        return set(FIELD_PRESENT_IDS.get(field, set()))
+    postings = FIELD_VALUE_POSTINGS.get(field, {})
+    matched_ids = set()
+    for value in _values_containing(field, query_lower):
+        matched_ids |= postings[value]
+    return matched_ids
+
+def find_entries_with_title(query):
+    """原始标题包含 query (不区分大小写) 的条目编号集合。"""
+    query_lower = query.lower()
+    if len(query_lower) < 2:
+        # 单字查询没有 2-gram 可用，直接扫描小写标题
+        return {entry_id for entry_id, title in enumerate(TITLE_LOWER) if query_lower in title}
+    candidates = _intersect([TITLE_GRAM_POSTINGS.get(gram, set()) for gram in _title_grams(query_lower)]) or set()
+    return {entry_id for entry_id in candidates if query_lower in TITLE_LOWER[entry_id]}
+
+def find_entries_by_anime_title(query):
+    """
+    与原逻辑一致：条目必须有 anime_title，且 (查询包含于 anime_title / anime_title 包含于查询 / 查询包含于原始标题)。
+    “anime_title 包含于查询”通过枚举查询的所有子串并直接查取值表完成。
+    """
+    query_lower = query.lower()
+    postings = FIELD_VALUE_POSTINGS.get('anime_title', {})
+    matched_ids = find_entries_with_field('anime_title', query)
+    for start in range(len(query_lower)):
+        for end in range(start + 1, len(query_lower) + 1):
+            value_postings = postings.get(query_lower[start:end])
+            if value_postings:
+                matched_ids |= value_postings
+    matched_ids |= find_entries_with_title(query) & FIELD_PRESENT_IDS.get('anime_title', set())
+    return matched_ids
+
+def find_entries_with_field_values(field, values):
+    """字段取值 (不区分大小写) 恰好为 values 之一的条目编号集合。"""
+    postings = FIELD_VALUE_POSTINGS.get(field, {})
+    matched_ids = set()
+    for value in values:
+        matched_ids |= postings.get(value.lower(), set())
+    return matched_ids
+
+def find_matching_entry_ids(anime_title=None, artist=None, song_type=None, quality=None, media_type=None, anime_title_aliases=None):
+    """
+    返回满足所有给定条件的条目编号集合；没有任何条件时返回 None (表示全部条目)。
+    anime_title_aliases: 由 anime_alias.resolve_anime_titles() 解析出的 anime_title 取值，与子串匹配的结果合并。
+    """
+    posting_sets = []
+    if media_type:
+        posting_sets.append(find_entries_with_field('media_type', media_type))
+    if song_type:
+        posting_sets.append(find_entries_with_field('song_type', song_type))
+    if quality:
+        posting_sets.append(find_entries_with_field('quality', quality))
+    if artist:
+        posting_sets.append(find_entries_with_field('artists', artist))
+    if anime_title:
+        anime_title_ids = find_entries_by_anime_title(anime_title)
+        if anime_title_aliases:
+            anime_title_ids |= find_entries_with_field_values('anime_title', anime_title_aliases)
+        posting_sets.append(anime_title_ids)
+
+    return _intersect(posting_sets)
+
+
+# --- 按发布时间倒序分页 (游标) ---
+def encode_time_cursor(time_key):
+    return f"{time_key[0]!r}:{time_key[1]}"
+
+def decode_time_cursor(cursor):
+    """游标格式为 "时间键:条目编号"，无法解析时返回 None。"""
+    try:
+        time_value, entry_id = str(cursor).rsplit(':', 1)
+        return (float(time_value), int(entry_id))
+    except ValueError:
+        return None
+
+def page_entries_by_time(candidate_ids=None, start_time=None, end_time=None, cursor=None, offset=0, limit=20, accept=None):
+    """
+    按发布时间倒序返回一页条目编号。
+      candidate_ids: 条件查询得到的编号集合，None 表示全部条目
+      start_time / end_time: 发布时间范围 (datetime，含两端)，在有序键数组上二分定位
+      cursor: 上一页返回的 next_cursor，从其之后继续；没有游标时才使用 offset
+      accept: 可选的过滤函数 accept(entry_id)，例如只要未处理过的条目
+    返回 (编号列表, 总数, 下一页游标或 None, 本页第一条在结果中的位置)。
+    """
+    if candidate_ids is None:
+        keys = TIME_ORDER_KEYS
+    else:
+        keys = sorted(ENTRY_TIME_KEYS[entry_id] for entry_id in candidate_ids)
+
+    # 时间键为 -时间戳，较新的时间对应较小的键
+    lo, hi = 0, len(keys)
+    if end_time is not None:
+        lo = bisect.bisect_left(keys, (-to_timestamp(end_time), -1))
+    if start_time is not None:
+        hi = bisect.bisect_right(keys, (-to_timestamp(start_time), float('inf')))
+    hi = max(lo, hi)
+
+    if accept is not None:
+        keys = [key for key in keys[lo:hi] if accept(key[1])]
+        lo, hi = 0, len(keys)
+
+    cursor_key = decode_time_cursor(cursor) if cursor else None
+    if cursor_key is not None:
+        start = min(max(bisect.bisect_right(keys, cursor_key, lo, hi), lo), hi)
+    else:
+        start = min(lo + max(0, offset), hi)
+    end = min(start + max(0, limit), hi)
+
+    page_keys = keys[start:end]
+    next_cursor = encode_time_cursor(page_keys[-1]) if page_keys and end < hi else None
+    return [key[1] for key in page_keys], hi - lo, next_cursor, start - lo
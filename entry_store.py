@@ -0,0 +1,252 @@
+# -*- coding: utf-8 -*-
+"""
+AI 分析过的条目存储 (SQLite，WAL 模式)，取代整体读写的 ai_analyzed_entries.json。
+
+  - 每个元数据字段单独一列，启动时只读取检索需要的列，不加载描述 (description)
+  - 新条目增量插入，不再整体重写文件
+  - 首次打开空库时自动导入旧的 ai_analyzed_entries.json
+  - reenrich_queue 表: 元数据缺失或不完整、等待重新提取的条目 (见 interactive_qb_ai_v2 的后台补全)
+
+也可以手动导入: python entry_store.py [ai_analyzed_entries.json]
+"""
+import json
+import os
+import sqlite3
+import sys
+import threading
+from datetime import datetime
+
+# --- 配置及文件路径 ---
+ENTRY_STORE_FILE = 'ai_analyzed_entries.db'
+LEGACY_ENTRIES_FILE = 'ai_analyzed_entries.json'
+METADATA_FIELDS = ('title', 'media_type', 'anime_title', 'song_type', 'quality', 'artists', 'resolution')
+METADATA_COLUMNS = {field: 'meta_title' if field == 'title' else field for field in METADATA_FIELDS} # 元数据字段 -> 列名
+
+# --- 全局变量 ---
+ENTRY_STORE_CONN = None
+_ENTRY_STORE_LOCK = threading.Lock()
+
+_SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS entries (
+    unique_id TEXT PRIMARY KEY,
+    infohash TEXT,
+    original_link TEXT,
+    actual_download_link TEXT,
+    title TEXT,
+    published TEXT,
+    description TEXT,
+    {', '.join(f'{column} TEXT' for column in METADATA_COLUMNS.values())},
+    has_metadata INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_entries_original_link ON entries(original_link);
+CREATE INDEX IF NOT EXISTS idx_entries_published ON entries(published);
+CREATE TABLE IF NOT EXISTS reenrich_queue (
+    unique_id TEXT PRIMARY KEY,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    enqueued_at TEXT,
+    last_attempt_at TEXT
+);
+"""
+
+
+# --- 打开数据库 ---
+def open_entry_store(db_file=ENTRY_STORE_FILE):
+    """打开 (必要时创建) 条目数据库，启用 WAL。重复调用返回同一个连接。"""
+    global ENTRY_STORE_CONN
+    if ENTRY_STORE_CONN is not None:
+        return ENTRY_STORE_CONN
+    conn = sqlite3.connect(db_file, check_same_thread=False)
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=NORMAL')
+    conn.executescript(_SCHEMA)
+    ENTRY_STORE_CONN = conn
+    return conn
+
+def close_entry_store():
+    global ENTRY_STORE_CONN
+    if ENTRY_STORE_CONN is not None:
+        ENTRY_STORE_CONN.close()
+        ENTRY_STORE_CONN = None
+
+def count_entries():
+    with _ENTRY_STORE_LOCK:
+        return open_entry_store().execute('SELECT COUNT(*) FROM entries').fetchone()[0]
+
+
+# --- 行 <-> 条目字典 ---
+def get_entry_unique_id(entry_data):
+    return entry_data.get('infohash') or entry_data.get('original_link')
+
+def _to_published_text(published_parsed):
+    if isinstance(published_parsed, datetime):
+        return published_parsed.isoformat()
+    if isinstance(published_parsed, (list, tuple)) and len(published_parsed) >= 6:
+        try:
+            return datetime(*published_parsed[:6]).isoformat()
+        except (TypeError, ValueError):
+            return None
+    return None
+
+def _metadata_values(metadata):
+    """按 METADATA_FIELDS 顺序取出各列的值，列表 (artists) 存为 JSON 文本。"""
+    values = []
+    for field in METADATA_FIELDS:
+        value = metadata.get(field)
+        values.append(json.dumps(value, ensure_ascii=False) if isinstance(value, list) else value)
+    return values
+
+def _entry_to_row(unique_id, entry_data):
+    metadata = entry_data.get('metadata') or {}
+    row = [
+        unique_id,
+        entry_data.get('infohash'),
+        entry_data.get('original_link'),
+        entry_data.get('actual_download_link'),
+        entry_data.get('title'),
+        _to_published_text(entry_data.get('published_parsed')),
+        entry_data.get('description')
+    ]
+    row += _metadata_values(metadata)
+    row.append(1 if metadata else 0)
+    return row
+
+def _row_to_entry(row, with_description=False):
+    entry_data = {
+        "unique_id": row['unique_id'],
+        "title": row['title'],
+        "original_link": row['original_link'],
+        "actual_download_link": row['actual_download_link'],
+        "infohash": row['infohash'],
+        "published_parsed": datetime.fromisoformat(row['published']) if row['published'] else None,
+        "metadata": {}
+    }
+    if with_description:
+        entry_data['description'] = row['description']
+    if row['has_metadata']:
+        for field, column in METADATA_COLUMNS.items():
+            value = row[column]
+            if field == 'artists' and value:
+                try:
+                    value = json.loads(value)
+                except ValueError:
+                    value = [value]
+            entry_data['metadata'][field] = value
+    return entry_data
+
+
+# --- 读取 ---
+def load_entries(with_description=False):
+    """按发布时间顺序读取所有条目。默认不读取描述列，启动时只需要检索用的字段。"""
+    columns = ['unique_id', 'infohash', 'original_link', 'actual_download_link', 'title', 'published', 'has_metadata']
+    columns += list(METADATA_COLUMNS.values())
+    if with_description:
+        columns.append('description')
+    with _ENTRY_STORE_LOCK:
+        cursor = open_entry_store().cursor()
+        cursor.row_factory = sqlite3.Row
+        rows = cursor.execute(f"SELECT {', '.join(columns)} FROM entries ORDER BY published, rowid").fetchall()
+    return [_row_to_entry(row, with_description) for row in rows]
+
+def get_entry_description(unique_id):
+    """按需读取单个条目的描述。"""
+    with _ENTRY_STORE_LOCK:
+        row = open_entry_store().execute('SELECT description FROM entries WHERE unique_id = ?', (unique_id,)).fetchone()
+    return row[0] if row else None
+
+
+# --- 写入 ---
+def insert_entries(entries):
+    """增量写入 (或覆盖同 unique_id 的) 条目，整批在一个事务中提交。返回写入条数。"""
+    rows = []
+    for entry_data in entries:
+        unique_id = entry_data.get('unique_id') or get_entry_unique_id(entry_data)
+        if unique_id:
+            rows.append(_entry_to_row(unique_id, entry_data))
+    if not rows:
+        return 0
+    placeholders = ', '.join('?' * len(rows[0]))
+    with _ENTRY_STORE_LOCK:
+        conn = open_entry_store()
+        with conn:
+            conn.executemany(f"INSERT OR REPLACE INTO entries VALUES ({placeholders})", rows)
+    return len(rows)
+
+
+# --- 元数据补全队列 ---
+def is_metadata_incomplete(metadata):
+    """元数据为空，或缺少标题/媒体类型 (字段过滤搜索时找不到该条目)。"""
+    return not metadata or not metadata.get('title') or not metadata.get('media_type')
+
+def enqueue_reenrichment(unique_ids):
+    """把条目加入补全队列，已在队列中 (包括已放弃的) 的不重复加入。返回新加入的条数。"""
+    now = datetime.now().isoformat()
+    rows = [(unique_id, now) for unique_id in unique_ids if unique_id]
+    if not rows:
+        return 0
+    with _ENTRY_STORE_LOCK:
+        conn = open_entry_store()
+        with conn:
+            before = conn.total_changes
+            conn.executemany("INSERT OR IGNORE INTO reenrich_queue (unique_id, enqueued_at) VALUES (?, ?)", rows)
+            return conn.total_changes - before
+
+def next_reenrichment_ids(limit, max_attempts):
+    """按尝试次数、入队时间取出最多 limit 个待补全条目，尝试次数达到 max_attempts 的不再取出。"""
+    with _ENTRY_STORE_LOCK:
+        rows = open_entry_store().execute(
+            "SELECT unique_id FROM reenrich_queue WHERE attempts < ? ORDER BY attempts, enqueued_at, rowid LIMIT ?",
+            (max_attempts, limit)
+        ).fetchall()
+    return [row[0] for row in rows]
+
+def count_pending_reenrichment(max_attempts):
+    with _ENTRY_STORE_LOCK:
+        return open_entry_store().execute("SELECT COUNT(*) FROM reenrich_queue WHERE attempts < ?", (max_attempts,)).fetchone()[0]
+
+def record_reenrichment_attempt(unique_ids):
+    """补全仍失败的条目尝试次数加一，排到队列后面。"""
+    now = datetime.now().isoformat()
+    with _ENTRY_STORE_LOCK:
+        conn = open_entry_store()
+        with conn:
+            conn.executemany(
+                "UPDATE reenrich_queue SET attempts = attempts + 1, last_attempt_at = ? WHERE unique_id = ?",
+                [(now, unique_id) for unique_id in unique_ids]
+            )
+
+def complete_reenrichment(metadata_by_id):
+    """写入补全后的元数据 ({unique_id: metadata}) 并移出队列，在一个事务中完成。"""
+    if not metadata_by_id:
+        return
+    assignments = ', '.join(f'{column} = ?' for column in METADATA_COLUMNS.values())
+    rows = [_metadata_values(metadata) + [unique_id] for unique_id, metadata in metadata_by_id.items()]
+    with _ENTRY_STORE_LOCK:
+        conn = open_entry_store()
+        with conn:
+            conn.executemany(f"UPDATE entries SET {assignments}, has_metadata = 1 WHERE unique_id = ?", rows)
+            conn.executemany("DELETE FROM reenrich_queue WHERE unique_id = ?", [(unique_id,) for unique_id in metadata_by_id])
+
+
+# --- 导入旧的 JSON 文件 ---
+def import_legacy_entries(json_file=LEGACY_ENTRIES_FILE):
+    """把 ai_analyzed_entries.json 中的全部条目导入数据库，返回导入条数。"""
+    if not os.path.exists(json_file):
+        return 0
+    with open(json_file, 'r', encoding='utf-8') as f:
+        legacy_entries = json.load(f)
+    return insert_entries(entry for entry in legacy_entries if isinstance(entry, dict))
+
+def migrate_legacy_entries_if_needed(json_file=LEGACY_ENTRIES_FILE):
+    """数据库为空且存在旧 JSON 文件时自动导入一次。"""
+    if count_entries() > 0 or not os.path.exists(json_file):
+        return 0
+    imported_count = import_legacy_entries(json_file)
+    print(f"已从 '{json_file}' 导入 {imported_count} 个条目到 '{ENTRY_STORE_FILE}'。")
+    return imported_count
+
+
+if __name__ == "__main__":
+    source_file = sys.argv[1] if len(sys.argv) > 1 else LEGACY_ENTRIES_FILE
+    open_entry_store()
+    print(f"已从 '{source_file}' 导入 {import_legacy_entries(source_file)} 个条目，数据库现有 {count_entries()} 个条目。")
+    close_entry_store()
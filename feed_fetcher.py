@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+import feedparser
+import hashlib
+import json
+import os
+import threading
+from json.decoder import JSONDecodeError
+from concurrent.futures import ThreadPoolExecutor
+import requests
+
+from llm_replay import fetch_http_with_replay, get_llm_replay_mode, LLMReplayMissError
+
+# --- 配置及文件路径 ---
+FEED_HTTP_CACHE_FILE = 'feed_http_cache.json'
+DEFAULT_FEED_FETCH_CONCURRENCY = 4
+FEED_REQUEST_TIMEOUT = 30
+FEED_USER_AGENT = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
+
+# --- 全局变量 ---
+FEED_HTTP_CACHE_PATH = FEED_HTTP_CACHE_FILE # 当前脚本使用的缓存文件，各脚本各自独立，互不影响对方的增量判断
+FEED_HTTP_CACHE = {} # 已确认处理完毕的缓存: {feed_url: {"etag", "last_modified", "body_hash"}}
+PENDING_FEED_HTTP_CACHE = {} # 本次抓取得到、尚未确认处理完毕的缓存
+_FEED_HTTP_CACHE_LOCK = threading.Lock()
+
+
+# --- 加载/保存 Feed HTTP 缓存 ---
+def load_feed_http_cache(cache_file=FEED_HTTP_CACHE_FILE):
+    global FEED_HTTP_CACHE, FEED_HTTP_CACHE_PATH
+    FEED_HTTP_CACHE_PATH = cache_file
+    if not os.path.exists(FEED_HTTP_CACHE_PATH):
+        FEED_HTTP_CACHE = {}
+        return
+    try:
+        with open(FEED_HTTP_CACHE_PATH, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+            FEED_HTTP_CACHE = data if isinstance(data, dict) else {}
+    except JSONDecodeError:
+        print(f"警告: 无法解析文件 '{FEED_HTTP_CACHE_PATH}' (文件为空或JSON格式错误)。将重新下载所有 Feed。")
+        FEED_HTTP_CACHE = {}
+    except Exception as e:
+        print(f"警告: 读取文件 '{FEED_HTTP_CACHE_PATH}' 发生错误: {e}。将重新下载所有 Feed。")
+        FEED_HTTP_CACHE = {}
+
+def save_feed_http_cache():
+    with _FEED_HTTP_CACHE_LOCK:
+        cache_to_save = dict(FEED_HTTP_CACHE)
+    with open(FEED_HTTP_CACHE_PATH, 'w', encoding='utf-8') as f:
+        json.dump(cache_to_save, f, ensure_ascii=False, indent=4)
+
+def commit_feed_http_cache(feed_url):
+    """
+    在某个 Feed 的条目全部处理完后调用，把本次抓取的 ETag/Last-Modified/正文哈希写入持久缓存。
+    处理中途失败则不调用，下次运行会重新下载并解析该 Feed。
+    """
+    with _FEED_HTTP_CACHE_LOCK:
+        validators = PENDING_FEED_HTTP_CACHE.pop(feed_url, None)
+        if not validators:
+            return
+        FEED_HTTP_CACHE[feed_url] = validators
+    save_feed_http_cache()
+
+
+# --- 抓取单个 RSS Feed (条件请求) ---
+def _get_feed_response(feed_url, headers):
+    """返回 (状态码, 用到的响应头, 正文)，供记录/回放层保存。"""
+    response = requests.get(feed_url, headers=headers, timeout=FEED_REQUEST_TIMEOUT)
+    response_headers = {
+        "url": response.url,
+        "etag": response.headers.get('ETag'),
+        "last_modified": response.headers.get('Last-Modified'),
+        "content_type": response.headers.get('Content-Type', 'application/xml')
+    }
+    return response.status_code, response_headers, response.content
+
+def fetch_feed(feed_name, feed_url):
+    """
+    使用条件请求 (If-None-Match / If-Modified-Since) 下载并解析单个 RSS Feed。
+    返回 (feed_name, feed, error)。如果服务器返回 304 或正文哈希与上次相同，
+    则不解析、返回的 feed 为 None，表示没有新条目。错误不会向外抛出 (回放缺少记录除外)。
+    记录/回放模式下不发送条件请求头，也不按正文哈希跳过，记录中总是完整的正文。
+    """
+    try:
+        cached = {}
+        if get_llm_replay_mode() == "live":
+            with _FEED_HTTP_CACHE_LOCK:
+                cached = dict(FEED_HTTP_CACHE.get(feed_url, {}))
+
+        headers = {'User-Agent': FEED_USER_AGENT}
+        if cached.get('etag'):
+            headers['If-None-Match'] = cached['etag']
+        if cached.get('last_modified'):
+            headers['If-Modified-Since'] = cached['last_modified']
+
+        status_code, response_headers, content = fetch_http_with_replay(feed_url, lambda: _get_feed_response(feed_url, headers))
+        if status_code == 304:
+            return feed_name, None, None
+        if status_code >= 400:
+            raise requests.HTTPError(f"{status_code} Error for url: {response_headers['url']}")
+
+        body_hash = hashlib.sha256(content).hexdigest()
+        validators = {
+            "etag": response_headers['etag'] or cached.get('etag'),
+            "last_modified": response_headers['last_modified'] or cached.get('last_modified'),
+            "body_hash": body_hash
+        }
+        if body_hash == cached.get('body_hash'):
+            # 正文未变化：只更新验证头，跳过解析
+            with _FEED_HTTP_CACHE_LOCK:
+                FEED_HTTP_CACHE[feed_url] = validators
+            return feed_name, None, None
+
+        with _FEED_HTTP_CACHE_LOCK:
+            PENDING_FEED_HTTP_CACHE[feed_url] = validators
+
+        feed = feedparser.parse(
+            content,
+            response_headers={
+                'content-location': response_headers['url'],
+                'content-type': response_headers['content_type']
+            }
+        )
+        return feed_name, feed, None
+    except LLMReplayMissError:
+        raise
+    except Exception as e:
+        return feed_name, None, e
+
+# --- 并发抓取所有 RSS Feed ---
+def fetch_feeds_concurrently(rss_feeds, max_workers=DEFAULT_FEED_FETCH_CONCURRENCY):
+    """
+    使用线程池并发抓取 config['rss_feeds'] 中的所有 Feed。
+    返回按配置顺序排列的 [(feed_name, feed, error)] 列表，单个 Feed 的错误互不影响。
+    feed 为 None 且 error 为 None 表示该 Feed 自上次处理后没有变化。
+    """
+    if not rss_feeds:
+        return []
+
+    max_workers = max(1, min(int(max_workers or 1), len(rss_feeds)))
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = [executor.submit(fetch_feed, feed_name, feed_url) for feed_name, feed_url in rss_feeds.items()]
+        results = [future.result() for future in futures]
+
+    # 304/哈希命中时可能刷新了验证头，统一保存一次
+    save_feed_http_cache()
+    return results
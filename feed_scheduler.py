@@ -0,0 +1,230 @@
+# -*- coding: utf-8 -*-
+import calendar
+import heapq
+import json
+import os
+import statistics
+import threading
+import time
+from urllib.parse import urlparse
+from entry_store import open_entry_store, load_entries, ENTRY_STORE_FILE, LEGACY_ENTRIES_FILE
+
+# --- 配置 ---
+DEFAULT_FEED_POLL_INTERVAL = 300 # 常驻模式下每个 Feed 的默认轮询间隔 (秒)
+MIN_FEED_POLL_INTERVAL = 30 # 轮询间隔下限，防止配置过小时频繁请求
+DEFAULT_HOST_MIN_INTERVAL = 3 # 同一站点两次请求之间的最小间隔 (秒)
+DEFAULT_MAX_FEED_POLL_INTERVAL = 6 * 3600 # 自适应轮询时安静 Feed 的最长间隔 (秒)
+POLLS_PER_PUBLISH_GAP = 4 # 自适应轮询：在典型发布间隔内轮询几次
+PUBLISH_HISTORY_SIZE = 50 # 每个 Feed 保留最近多少个发布时间用于估计发布节奏
+
+# --- 全局变量 ---
+FEED_SCHEDULE_HEAP = [] # 最小堆: (到期时间, 序号, feed_name)
+FEED_NEXT_POLL_TIME = {} # {feed_name: 下次轮询时间 (time.time())}，堆中与之不一致的项视为已作废
+FEED_POLL_INTERVALS = {} # {feed_name: 轮询间隔秒数}
+FIXED_POLL_FEEDS = set() # 在配置中单独指定了间隔的 Feed，不参与自适应调整
+FEED_PUBLISH_HISTORY = {} # {feed_name: 升序的发布时间戳列表 (UTC 秒，已去重)}
+FEED_TTL_SECONDS = {} # {feed_name: RSS <ttl> 换算成的秒数}
+_SCHEDULE_SEQUENCE = 0
+
+RATE_LIMIT_NEXT_ALLOWED = {} # {限速键 (站点/接口名): 下次允许请求的 time.monotonic()}
+_RATE_LIMIT_LOCK = threading.Lock()
+
+
+# --- Feed 轮询调度 (最小堆) ---
+def schedule_feed(feed_name, due_time):
+    """把 Feed 安排在 due_time 轮询，覆盖之前的安排 (旧的堆项在弹出时被丢弃)。"""
+    global _SCHEDULE_SEQUENCE
+    _SCHEDULE_SEQUENCE += 1
+    FEED_NEXT_POLL_TIME[feed_name] = due_time
+    heapq.heappush(FEED_SCHEDULE_HEAP, (due_time, _SCHEDULE_SEQUENCE, feed_name))
+
+def init_feed_schedule(rss_feeds, default_interval=DEFAULT_FEED_POLL_INTERVAL, feed_intervals=None):
+    """
+    为 config['rss_feeds'] 中的每个 Feed 设置轮询间隔，并全部安排为立即轮询。
+    feed_intervals 可为个别 Feed 单独指定间隔: {feed_name: 秒数}。
+    """
+    global FEED_SCHEDULE_HEAP
+    FEED_SCHEDULE_HEAP = []
+    FEED_NEXT_POLL_TIME.clear()
+    FEED_POLL_INTERVALS.clear()
+    FIXED_POLL_FEEDS.clear()
+    feed_intervals = feed_intervals or {}
+    FIXED_POLL_FEEDS.update(name for name in feed_intervals if name in rss_feeds)
+    now = time.time()
+    for feed_name in rss_feeds:
+        interval = feed_intervals.get(feed_name, default_interval)
+        FEED_POLL_INTERVALS[feed_name] = max(MIN_FEED_POLL_INTERVAL, float(interval))
+        schedule_feed(feed_name, now)
+
+def reschedule_feed(feed_name, interval=None):
+    """Feed 处理完后调用，按其轮询间隔 (或给定的 interval) 安排下一次轮询，返回下次轮询时间。"""
+    if interval is None:
+        interval = FEED_POLL_INTERVALS.get(feed_name, DEFAULT_FEED_POLL_INTERVAL)
+    due_time = time.time() + max(MIN_FEED_POLL_INTERVAL, float(interval))
+    schedule_feed(feed_name, due_time)
+    return due_time
+
+def get_next_poll_time(feed_name):
+    return FEED_NEXT_POLL_TIME.get(feed_name)
+
+def get_feed_poll_schedule():
+    """返回每个 Feed 当前的轮询间隔和下次轮询时间: {feed_name: {"interval", "next_poll", "adaptive"}}。"""
+    return {
+        feed_name: {
+            "interval": interval,
+            "next_poll": FEED_NEXT_POLL_TIME.get(feed_name),
+            "adaptive": feed_name not in FIXED_POLL_FEEDS
+        }
+        for feed_name, interval in FEED_POLL_INTERVALS.items()
+    }
+
+def save_feed_poll_schedule(file_path):
+    """把各 Feed 的轮询间隔和下次轮询时间写入文件，方便在常驻进程外查看。"""
+    schedule = {}
+    for feed_name, info in get_feed_poll_schedule().items():
+        next_poll = info['next_poll']
+        schedule[feed_name] = {
+            "interval_seconds": round(info['interval']),
+            "next_poll": time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(next_poll)) if next_poll else None,
+            "adaptive": info['adaptive'],
+            "ttl_seconds": FEED_TTL_SECONDS.get(feed_name)
+        }
+    temp_file = file_path + '.tmp'
+    with open(temp_file, 'w', encoding='utf-8') as f:
+        json.dump(schedule, f, ensure_ascii=False, indent=4)
+    os.replace(temp_file, file_path)
+
+def wait_for_next_feed():
+    """
+    阻塞到最早到期的 Feed，返回其 feed_name；没有任何已安排的 Feed 时返回 None。
+    只睡到下一个到期时间，不做固定间隔的轮询。
+    """
+    while FEED_SCHEDULE_HEAP:
+        due_time, _, feed_name = FEED_SCHEDULE_HEAP[0]
+        if FEED_NEXT_POLL_TIME.get(feed_name) != due_time:
+            heapq.heappop(FEED_SCHEDULE_HEAP) # 已被重新安排，丢弃旧项
+            continue
+        remaining = due_time - time.time()
+        if remaining > 0:
+            time.sleep(remaining)
+            continue
+        heapq.heappop(FEED_SCHEDULE_HEAP)
+        return feed_name
+    return None
+
+
+# --- 自适应轮询：根据发布节奏估计轮询间隔 ---
+def record_feed_publish_times(feed_name, publish_times, ttl_seconds=None):
+    """合并新观察到的发布时间 (UTC 秒)，只保留最近 PUBLISH_HISTORY_SIZE 个。"""
+    history = set(FEED_PUBLISH_HISTORY.get(feed_name, []))
+    history.update(int(t) for t in publish_times if t)
+    FEED_PUBLISH_HISTORY[feed_name] = sorted(history)[-PUBLISH_HISTORY_SIZE:]
+    if ttl_seconds:
+        FEED_TTL_SECONDS[feed_name] = ttl_seconds
+
+def observe_feed(feed_name, feed):
+    """从刚抓取的 feedparser 结果中记录条目的 published_parsed 和频道的 <ttl> (分钟)。"""
+    publish_times = [calendar.timegm(entry.published_parsed) for entry in feed.entries if entry.get('published_parsed')]
+    ttl_seconds = None
+    try:
+        ttl_seconds = int(feed.feed.get('ttl')) * 60
+    except (TypeError, ValueError):
+        pass
+    record_feed_publish_times(feed_name, publish_times, ttl_seconds)
+
+def _load_analyzed_publish_records():
+    """读取已分析条目的 (原始链接, 发布时间元组)。优先读条目库，尚未迁移时读旧的 JSON 文件。"""
+    if os.path.exists(ENTRY_STORE_FILE):
+        open_entry_store(ENTRY_STORE_FILE)
+        return [
+            (entry['original_link'], entry['published_parsed'].timetuple()[:6])
+            for entry in load_entries() if entry.get('published_parsed')
+        ]
+    if not os.path.exists(LEGACY_ENTRIES_FILE):
+        return []
+    with open(LEGACY_ENTRIES_FILE, 'r', encoding='utf-8') as f:
+        entries = json.load(f)
+    return [
+        (entry.get('original_link'), entry.get('published_parsed'))
+        for entry in (entries if isinstance(entries, list) else []) if isinstance(entry, dict)
+    ]
+
+def seed_publish_history_from_analyzed_entries(rss_feeds):
+    """
+    用已分析条目中保存的发布时间预热发布历史，
+    这样常驻模式启动后第一轮就能用上学到的节奏。条目没有记录来源 Feed，
+    因此按原始链接的站点归属；多个 Feed 共用同一站点时无法区分，这些 Feed 只从实际抓取中学习。
+    """
+    feeds_by_host = {}
+    for feed_name, feed_url in rss_feeds.items():
+        feeds_by_host.setdefault(urlparse(feed_url).netloc, []).append(feed_name)
+    try:
+        publish_records = _load_analyzed_publish_records()
+    except Exception as e:
+        print(f"警告: 读取已分析条目发生错误: {e}。发布历史将从实际抓取中学习。")
+        return
+
+    publish_times_by_feed = {}
+    for original_link, published in publish_records:
+        feed_names = feeds_by_host.get(urlparse(original_link or '').netloc) if published else None
+        if not feed_names or len(feed_names) != 1:
+            continue
+        try:
+            publish_times_by_feed.setdefault(feed_names[0], []).append(calendar.timegm(tuple(published[:6]) + (0, 0, 0)))
+        except (TypeError, ValueError):
+            continue
+    for feed_name, publish_times in publish_times_by_feed.items():
+        record_feed_publish_times(feed_name, publish_times)
+
+def compute_adaptive_interval(publish_times, ttl_seconds=None, now=None,
+                              min_interval=MIN_FEED_POLL_INTERVAL, max_interval=DEFAULT_MAX_FEED_POLL_INTERVAL):
+    """
+    用相邻发布时间间隔的中位数估计发布节奏，每个典型间隔内轮询 POLLS_PER_PUBLISH_GAP 次；
+    距上次发布已超过典型间隔时按比例放慢。结果不小于 <ttl>，并限制在 [min_interval, max_interval]。
+    历史不足两条时返回 None (沿用默认间隔)。
+    """
+    if len(publish_times) < 2:
+        return None
+    gaps = [b - a for a, b in zip(publish_times, publish_times[1:]) if b > a]
+    if not gaps:
+        return None
+    typical_gap = statistics.median(gaps)
+    interval = typical_gap / POLLS_PER_PUBLISH_GAP
+
+    quiet_for = (now or time.time()) - publish_times[-1]
+    if quiet_for > typical_gap:
+        interval *= quiet_for / typical_gap
+    if ttl_seconds:
+        interval = max(interval, ttl_seconds)
+    return min(max(interval, min_interval), max_interval)
+
+def update_feed_poll_interval(feed_name, max_interval=DEFAULT_MAX_FEED_POLL_INTERVAL):
+    """按已记录的发布历史重新计算 Feed 的轮询间隔 (配置中固定了间隔的 Feed 不变)，返回当前间隔。"""
+    if feed_name not in FIXED_POLL_FEEDS:
+        interval = compute_adaptive_interval(
+            FEED_PUBLISH_HISTORY.get(feed_name, []),
+            FEED_TTL_SECONDS.get(feed_name),
+            max_interval=max_interval
+        )
+        if interval is None and FEED_TTL_SECONDS.get(feed_name):
+            interval = max(FEED_TTL_SECONDS[feed_name], FEED_POLL_INTERVALS.get(feed_name, DEFAULT_FEED_POLL_INTERVAL))
+        if interval is not None:
+            FEED_POLL_INTERVALS[feed_name] = interval
+    return FEED_POLL_INTERVALS.get(feed_name, DEFAULT_FEED_POLL_INTERVAL)
+
+
+# --- 限速：同一个键两次请求之间至少间隔 min_interval 秒 ---
+def wait_for_rate_limit(key, min_interval):
+    """
+    按键 (站点域名、API 名称等) 限速。只在距上次请求不足 min_interval 秒时才等待，
+    等待时间恰好补足差额，取代固定的 time.sleep()。可在多个线程中调用。
+    """
+    if not min_interval or min_interval <= 0:
+        return
+    with _RATE_LIMIT_LOCK:
+        now = time.monotonic()
+        allowed_at = max(now, RATE_LIMIT_NEXT_ALLOWED.get(key, now))
+        RATE_LIMIT_NEXT_ALLOWED[key] = allowed_at + min_interval
+    delay = allowed_at - now
+    if delay > 0:
+        time.sleep(delay)
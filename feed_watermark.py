@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+import json
+import os
+import threading
+from datetime import datetime
+from json.decoder import JSONDecodeError
+
+# --- 配置及文件路径 ---
+FEED_WATERMARK_FILE = 'feed_watermarks.json'
+
+# --- 全局变量 ---
+FEED_WATERMARK_PATH = FEED_WATERMARK_FILE # 当前脚本使用的水位线文件，各脚本各自独立
+FEED_WATERMARKS = {} # 已确认处理完毕的水位线: {feed_name: {"published": datetime, "boundary_ids": set}}
+PENDING_FEED_WATERMARKS = {} # 本次抓取得到、尚未确认处理完毕的水位线
+_FEED_WATERMARK_LOCK = threading.Lock()
+
+
+# --- 加载/保存水位线 ---
+def load_feed_watermarks(file_path=FEED_WATERMARK_FILE):
+    """
+    加载各 Feed 的水位线 (最新发布时间 + 该时间点上的条目 ID)。
+    兼容旧版 rss_last_update.json 的 {feed_name: "ISO 时间"} 格式，旧格式没有边界 ID。
+    """
+    global FEED_WATERMARKS, FEED_WATERMARK_PATH
+    FEED_WATERMARK_PATH = file_path
+    FEED_WATERMARKS = {}
+    PENDING_FEED_WATERMARKS.clear()
+    if not os.path.exists(FEED_WATERMARK_PATH):
+        return
+    try:
+        with open(FEED_WATERMARK_PATH, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        for feed_name, value in (data if isinstance(data, dict) else {}).items():
+            if isinstance(value, str):
+                value = {"published": value, "boundary_ids": []}
+            if not isinstance(value, dict) or not value.get('published'):
+                continue
+            try:
+                published = datetime.fromisoformat(value['published'])
+            except ValueError:
+                continue
+            FEED_WATERMARKS[feed_name] = {"published": published, "boundary_ids": set(value.get('boundary_ids') or [])}
+    except JSONDecodeError:
+        print(f"警告: 无法解析文件 '{FEED_WATERMARK_PATH}' (文件为空或JSON格式错误)。将重新处理所有条目。")
+        FEED_WATERMARKS = {}
+    except Exception as e:
+        print(f"警告: 读取文件 '{FEED_WATERMARK_PATH}' 发生错误: {e}。将重新处理所有条目。")
+        FEED_WATERMARKS = {}
+
+def save_feed_watermarks():
+    with _FEED_WATERMARK_LOCK:
+        watermarks_to_save = {
+            feed_name: {"published": watermark['published'].isoformat(), "boundary_ids": sorted(watermark['boundary_ids'])}
+            for feed_name, watermark in FEED_WATERMARKS.items()
+        }
+    temp_file = FEED_WATERMARK_PATH + '.tmp'
+    with open(temp_file, 'w', encoding='utf-8') as f:
+        json.dump(watermarks_to_save, f, ensure_ascii=False, indent=4)
+    os.replace(temp_file, FEED_WATERMARK_PATH)
+
+
+# --- 判断与推进 ---
+def get_entry_watermark_id(entry):
+    """条目在 Feed 内的稳定标识 (guid，缺失时用原始链接)，不需要任何网络请求。"""
+    return entry.get('id') or entry.get('link')
+
+def get_entry_published(entry):
+    published_parsed = entry.get('published_parsed')
+    if not published_parsed:
+        return None
+    try:
+        return datetime(*published_parsed[:6])
+    except (TypeError, ValueError):
+        return None
+
+def is_below_watermark(feed_name, entry):
+    """
+    条目发布时间早于水位线，或与水位线同一秒且 ID 已记录在边界集合中时返回 True，
+    表示之前已完整处理过。没有发布时间的条目无法判断，一律返回 False。
+    """
+    published = get_entry_published(entry)
+    watermark = FEED_WATERMARKS.get(feed_name)
+    if published is None or watermark is None:
+        return False
+    if published < watermark['published']:
+        return True
+    return published == watermark['published'] and get_entry_watermark_id(entry) in watermark['boundary_ids']
+
+def filter_entries_above_watermark(feed_name, entries):
+    """返回水位线之上的条目 (保持原顺序)，并根据本次看到的全部条目计算待确认的新水位线。"""
+    advance_feed_watermark(feed_name, entries)
+    return [entry for entry in entries if not is_below_watermark(feed_name, entry)]
+
+def advance_feed_watermark(feed_name, entries):
+    """
+    计算新的水位线 (最大发布时间 + 该秒内所有条目的 ID) 并暂存，
+    调用 commit_feed_watermark() 后才生效，处理中途失败时不会跳过未处理的条目。
+    """
+    with _FEED_WATERMARK_LOCK:
+        current = FEED_WATERMARKS.get(feed_name)
+        new_published = current['published'] if current else None
+        new_boundary_ids = set(current['boundary_ids']) if current else set()
+        for entry in entries:
+            published = get_entry_published(entry)
+            entry_id = get_entry_watermark_id(entry)
+            if published is None or not entry_id:
+                continue
+            if new_published is None or published > new_published:
+                new_published = published
+                new_boundary_ids = {entry_id}
+            elif published == new_published:
+                new_boundary_ids.add(entry_id)
+        if new_published is not None:
+            PENDING_FEED_WATERMARKS[feed_name] = {"published": new_published, "boundary_ids": new_boundary_ids}
+
+def commit_feed_watermark(feed_name):
+    """在某个 Feed 的条目全部处理完后调用，把暂存的水位线写入文件。"""
+    with _FEED_WATERMARK_LOCK:
+        watermark = PENDING_FEED_WATERMARKS.pop(feed_name, None)
+        if not watermark:
+            return
+        FEED_WATERMARKS[feed_name] = watermark
+    save_feed_watermarks()
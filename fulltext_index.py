@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+"""
+interactive_qb_ai.py 的 search_rss_items 使用的全文索引 (标题 + 去掉 HTML 的描述)，加载 Feed 时一次建立。
+
+  - 规范化只做一次 (text_normalizer): 去掉 HTML 标签、反转义实体、NFKC (全角 -> 半角)、casefold、合并空白
+  - 2-gram -> 文档编号集合，关键词查询取各 gram 集合的交集，再用规范化后的文本确认
+  - 关键词列表为“任一匹配”，结果是各关键词编号集合的并集
+
+文档编号即条目在 ALL_RSS_ENTRIES 中的下标 (只追加)。
+"""
+from text_normalizer import normalize_text
+
+# --- 全局变量 ---
+FULLTEXT_DOCUMENTS = [] # 文档编号 -> 规范化后的 "标题 描述"
+FULLTEXT_GRAM_POSTINGS = {} # {2-gram: {文档编号}}
+
+
+# --- 分词 ---
+def _grams(text):
+    return {text[i:i + 2] for i in range(len(text) - 1)}
+
+
+# --- 建立索引 ---
+def reset_fulltext_index():
+    FULLTEXT_DOCUMENTS.clear()
+    FULLTEXT_GRAM_POSTINGS.clear()
+
+def add_fulltext_document(doc_id, title, description):
+    """把 ALL_RSS_ENTRIES[doc_id] 加入索引，必须按编号顺序调用。"""
+    text = normalize_text(f"{title or ''} {description or ''}")
+    FULLTEXT_DOCUMENTS.append(text)
+    for gram in _grams(text):
+        FULLTEXT_GRAM_POSTINGS.setdefault(gram, set()).add(doc_id)
+
+
+# --- 查询 ---
+def find_documents_containing(keyword):
+    """规范化后的文本包含 keyword 的文档编号集合。"""
+    keyword = normalize_text(keyword)
+    if not keyword:
+        return set(range(len(FULLTEXT_DOCUMENTS)))
+    if len(keyword) < 2:
+        # 单字关键词没有 2-gram 可用，直接扫描规范化后的文本
+        return {doc_id for doc_id, text in enumerate(FULLTEXT_DOCUMENTS) if keyword in text}
+    gram_sets = sorted((FULLTEXT_GRAM_POSTINGS.get(gram, set()) for gram in _grams(keyword)), key=len)
+    candidates = set(gram_sets[0])
+    for other in gram_sets[1:]:
+        if not candidates:
+            break
+        candidates &= other
+    return {doc_id for doc_id in candidates if keyword in FULLTEXT_DOCUMENTS[doc_id]}
+
+def find_documents_containing_any(keywords):
+    """包含任一关键词的文档编号集合。"""
+    matched_ids = set()
+    for keyword in keywords:
+        matched_ids |= find_documents_containing(keyword)
+    return matched_ids
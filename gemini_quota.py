@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+"""
+Gemini 请求配额 (令牌桶)，供并发的元数据提取线程共享。
+
+  - 请求桶: 容量 RPM，每秒补充 RPM/60
+  - token 桶: 容量 TPM，每秒补充 TPM/60，按估算的 prompt + 输出 token 数扣除
+  - 服务器返回 429 并给出 retry-after / retry_delay 时，所有线程暂停到该时间点之后
+"""
+import re
+import threading
+import time
+
+# --- 配置 ---
+DEFAULT_GEMINI_RPM = 10
+DEFAULT_GEMINI_TPM = 250000
+DEFAULT_RETRY_AFTER_SECONDS = 10
+
+# --- 全局变量 ---
+GEMINI_QUOTA_BUCKETS = {} # {"requests" / "tokens": {"capacity": 容量, "available": 当前余量, "refill_per_second": 每秒补充}}
+GEMINI_PAUSED_UNTIL = 0.0 # time.monotonic() 时间点，之前不发出新请求
+GEMINI_REQUEST_COUNT = 0 # 已放行的请求总数，用于统计各用途的请求预算
+_GEMINI_QUOTA_UPDATED_AT = 0.0
+_GEMINI_QUOTA_LOCK = threading.Lock()
+
+_CJK_CHAR_PATTERN = re.compile(r'[぀-ヿ㐀-鿿가-힯＀-￯]')
+_RETRY_AFTER_PATTERNS = (
+    re.compile(r'retry_delay\s*\{\s*seconds:\s*(\d+)', re.IGNORECASE),
+    re.compile(r'retry[- ]after["\':\s]*(\d+(?:\.\d+)?)', re.IGNORECASE),
+    re.compile(r'retry in\s*(\d+(?:\.\d+)?)\s*s', re.IGNORECASE),
+)
+
+
+# --- 配置配额 ---
+def configure_gemini_quota(rpm=DEFAULT_GEMINI_RPM, tpm=DEFAULT_GEMINI_TPM):
+    """设置每分钟请求数和 token 数上限，两个桶初始为满。"""
+    global _GEMINI_QUOTA_UPDATED_AT, GEMINI_PAUSED_UNTIL
+    with _GEMINI_QUOTA_LOCK:
+        GEMINI_QUOTA_BUCKETS.clear()
+        for bucket_name, per_minute in (("requests", rpm), ("tokens", tpm)):
+            if per_minute and per_minute > 0:
+                GEMINI_QUOTA_BUCKETS[bucket_name] = {
+                    "capacity": float(per_minute),
+                    "available": float(per_minute),
+                    "refill_per_second": per_minute / 60.0
+                }
+        _GEMINI_QUOTA_UPDATED_AT = time.monotonic()
+        GEMINI_PAUSED_UNTIL = 0.0
+
+def estimate_token_count(text):
+    """粗略估算 token 数: 中日韩字符约每字 1 个 token，其余约每 4 个字符 1 个 token。"""
+    if not text:
+        return 0
+    cjk_count = len(_CJK_CHAR_PATTERN.findall(text))
+    return cjk_count + (len(text) - cjk_count + 3) // 4
+
+
+# --- 获取配额 ---
+def _refill_buckets(now):
+    global _GEMINI_QUOTA_UPDATED_AT
+    elapsed = max(0.0, now - _GEMINI_QUOTA_UPDATED_AT)
+    _GEMINI_QUOTA_UPDATED_AT = now
+    for bucket in GEMINI_QUOTA_BUCKETS.values():
+        bucket['available'] = min(bucket['capacity'], bucket['available'] + elapsed * bucket['refill_per_second'])
+
+def acquire_gemini_quota(token_cost=0):
+    """阻塞直到请求桶和 token 桶都有余量 (且不在 retry-after 暂停期内)，然后扣除。"""
+    global GEMINI_REQUEST_COUNT
+    while True:
+        with _GEMINI_QUOTA_LOCK:
+            now = time.monotonic()
+            _refill_buckets(now)
+            wait_seconds = GEMINI_PAUSED_UNTIL - now
+            if wait_seconds <= 0:
+                costs = {"requests": 1.0, "tokens": float(token_cost)}
+                wait_seconds = 0.0
+                for bucket_name, bucket in GEMINI_QUOTA_BUCKETS.items():
+                    # 单次消耗超过容量时按容量计，否则永远等不到
+                    cost = min(costs[bucket_name], bucket['capacity'])
+                    if bucket['available'] < cost:
+                        wait_seconds = max(wait_seconds, (cost - bucket['available']) / bucket['refill_per_second'])
+                if wait_seconds <= 0:
+                    for bucket_name, bucket in GEMINI_QUOTA_BUCKETS.items():
+                        bucket['available'] -= min(costs[bucket_name], bucket['capacity'])
+                    GEMINI_REQUEST_COUNT += 1
+                    return
+        time.sleep(wait_seconds)
+
+def get_gemini_request_count():
+    with _GEMINI_QUOTA_LOCK:
+        return GEMINI_REQUEST_COUNT
+
+def pause_gemini_requests(seconds):
+    """服务器要求稍后重试时调用，所有线程在 seconds 秒内都不再发出请求。"""
+    global GEMINI_PAUSED_UNTIL
+    with _GEMINI_QUOTA_LOCK:
+        GEMINI_PAUSED_UNTIL = max(GEMINI_PAUSED_UNTIL, time.monotonic() + seconds)
+
+def get_retry_after_seconds(error, default=DEFAULT_RETRY_AFTER_SECONDS):
+    """从 429 错误中读取服务器建议的等待秒数 (retry_delay / Retry-After)，没有时返回 default。"""
+    text = str(error)
+    for pattern in _RETRY_AFTER_PATTERNS:
+        match = pattern.search(text)
+        if match:
+            return float(match.group(1))
+    return default
+
+
+configure_gemini_quota()
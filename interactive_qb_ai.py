@@ -4,18 +4,18 @@ import json
 import os
 from qbittorrent import Client
 import google.generativeai as genai
-import time
 import re
 from json.decoder import JSONDecodeError
-import requests
-from bs4 import BeautifulSoup
-from urllib.parse import urljoin, urlparse, parse_qs 
+from urllib.parse import urlparse, parse_qs 
 import base64
 from datetime import datetime, timedelta
+from qb_sync import sync_qb_torrents, is_torrent_in_client, wait_for_torrent
+from seen_journal import load_seen_torrent_set, record_seen_torrent, compact_seen_torrents
+from dmhy_resolver import resolve_download_links, load_link_resolution_cache, DEFAULT_RESOLVE_CONCURRENCY
+from fulltext_index import add_fulltext_document, find_documents_containing_any
 
 # --- 配置及文件路径 ---
 CONFIG_FILE = 'config.json'
-SEEN_TORRENTS_FILE = 'seen_torrents.json'
 
 # --- 全局变量和客户端实例 ---
 CONFIG = {}
@@ -44,32 +44,13 @@ def load_config():
             exit()
 
 def load_seen_torrents():
-    """从 seen_torrents.json 加载已处理的种子链接, 并处理空文件或无效JSON"""
+    """从 seen_torrents.json 快照和追加日志中加载已处理的种子"""
     global SEEN_TORRENTS
-    if not os.path.exists(SEEN_TORRENTS_FILE):
-        SEEN_TORRENTS = set()
-        return
-
-    try:
-        if os.path.getsize(SEEN_TORRENTS_FILE) == 0:
-             SEEN_TORRENTS = set()
-             return
-             
-        with open(SEEN_TORRENTS_FILE, 'r', encoding='utf-8') as f:
-           data = json.load(f)
-           SEEN_TORRENTS = set(data) if isinstance(data, list) else set()
-           
-    except JSONDecodeError:
-        print(f"警告: 无法解析文件 '{SEEN_TORRENTS_FILE}' (文件为空或JSON格式错误)。将返回空集合并继续。")
-        SEEN_TORRENTS = set()
-    except Exception as e:
-         print(f"警告: 读取文件 '{SEEN_TORRENTS_FILE}' 发生错误: {e}。将返回空集合并继续。")
-         SEEN_TORRENTS = set()
+    SEEN_TORRENTS = load_seen_torrent_set()
 
 def save_seen_torrents():
-    """将已处理的种子链接保存到 seen_torrents.json"""
-    with open(SEEN_TORRENTS_FILE, 'w', encoding='utf-8') as f:
-        json.dump(list(SEEN_TORRENTS), f, ensure_ascii=False, indent=4)
+    """把追加日志合并回 seen_torrents.json 快照"""
+    compact_seen_torrents(SEEN_TORRENTS)
 
 # --- 健壮地提取 Infohash ---
 def extract_infohash(link_candidate):
@@ -101,46 +82,6 @@ def extract_infohash(link_candidate):
                         return None
     return None
 
-# --- 从 RSS entry 或网页中提取实际下载链接 ---
-def get_actual_download_link(entry):
-    original_link = entry.link
-    
-    # 1. 优先检查 enclosure 标签
-    if hasattr(entry, 'enclosures') and entry.enclosures:
-        for enc in entry.enclosures:
-            if enc.href:
-                if enc.type == 'application/x-bittorrent' or enc.href.startswith('magnet:'):
-                    return enc.href
-    
-    # 2. 尝试解析原始链接 (网页或直接磁力)
-    if original_link and original_link.startswith('magnet:'):
-        return original_link
-    elif original_link and "share.dmhy.org/topics/view/" in original_link:
-        try:
-            headers = {
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari=537.36'
-            }
-            response = requests.get(original_link, headers=headers, timeout=15)
-            response.raise_for_status()
-            soup = BeautifulSoup(response.text, 'html.parser')
-
-            magnet_links_on_page = soup.find_all('a', href=re.compile(r'^magnet:'))
-            if magnet_links_on_page:
-                return magnet_links_on_page[0]['href']
-            else:
-                torrent_links_on_page = soup.find_all('a', href=re.compile(r'\.torrent$'))
-                if torrent_links_on_page:
-                    relative_path = torrent_links_on_page[0]['href']
-                    return urljoin(original_link, relative_path)
-        except requests.exceptions.RequestException as req_e:
-            # print(f"  访问网页 '{original_link}' 失败: {req_e}") # 减少冗余日志
-            pass # 失败则静默
-        except Exception as parse_e:
-            # print(f"  解析网页 '{original_link}' 内容失败: {parse_e}") # 减少冗余日志
-            pass # 失败则静默
-    
-    return original_link
-
 # --- qBittorrent 任务添加与验证 ---
 def add_and_verify_torrent(link, save_path, tags, title, unique_id):
     """
@@ -152,6 +93,11 @@ def add_and_verify_torrent(link, save_path, tags, title, unique_id):
         return True
 
     try:
+        torrent_infohash = extract_infohash(link)
+        if torrent_infohash and is_torrent_in_client(QB_CLIENT, torrent_infohash, refresh=True):
+            print(f"  资源 '{title}' 已在 qBittorrent 中，无需重复添加。")
+            return True
+
         print(f"  发送下载任务到qBittorrent: {title}")
         QB_CLIENT.download_from_link(
             link,
@@ -160,16 +106,10 @@ def add_and_verify_torrent(link, save_path, tags, title, unique_id):
         )
         
         added_successfully = False
-        time.sleep(2) 
-
-        all_torrents = QB_CLIENT.torrents()
-        torrent_infohash = extract_infohash(link)
 
         if torrent_infohash:
-            for torrent in all_torrents:
-                if torrent['hash'] == torrent_infohash:
-                    added_successfully = True
-                    break
+            # 通过增量同步等待新任务出现，出现即确认，不再固定等待并拉取完整列表
+            added_successfully = wait_for_torrent(QB_CLIENT, torrent_infohash)
             
             if added_successfully:
                 print(f"  任务添加成功: {title}")
@@ -214,13 +154,16 @@ def search_rss_items(keywords=None, quality=None, date_range=None, media_type=No
                 if feed.bozo:
                     print(f"  警告: RSS Feed '{feed_name}' 解析错误: {feed.bozo_exception}")
                 
+                # 通过共享连接池并发解析本 Feed 所有条目的下载链接
+                resolved_links = resolve_download_links(feed.entries, CONFIG.get('dmhy_resolve_concurrency', DEFAULT_RESOLVE_CONCURRENCY))
+
                 feed_entries_processed = 0 
-                for entry in feed.entries:
+                for entry, resolved_link in zip(feed.entries, resolved_links):
                     feed_entries_processed += 1
                     if feed_entries_processed % 50 == 0:
                         print(f"    - '{feed_name}' 已处理 {feed_entries_processed} / {len(feed.entries)} 条目")
 
-                    actual_download_link = get_actual_download_link(entry)
+                    actual_download_link = resolved_link or entry.link
                     infohash = extract_infohash(actual_download_link)
                     
                     entry_unique_id = infohash if infohash else entry.link
@@ -236,17 +179,14 @@ def search_rss_items(keywords=None, quality=None, date_range=None, media_type=No
                         "infohash": infohash,
                         "published_parsed": entry.get('published_parsed')
                     })
+                    # 标题和描述只在加载时规范化一次并建立全文索引
+                    add_fulltext_document(len(ALL_RSS_ENTRIES) - 1, entry.title, entry.get('description', ''))
                 print(f"  '{feed_name}' 加载完成，共 {len(feed.entries)} 条。")
             except Exception as e:
                 print(f"  错误：加载 RSS Feed '{feed_name}' 失败: {e}")
         print(f"--- 所有 RSS Feed 加载完成，共 {len(ALL_RSS_ENTRIES)} 个有效条目可供搜索。---")
 
     filtered_results = []
-    
-    # 辅助函数：检查文本是否包含关键词（只要包含一个就匹配）
-    def contains_any_keywords(text, kws):
-        if not kws: return True # 如果关键词列表为空，则视为匹配
-        return any(kw.lower() in text.lower() for kw in kws)
 
     start_date = None
     if date_range:
@@ -262,30 +202,36 @@ def search_rss_items(keywords=None, quality=None, date_range=None, media_type=No
             start_date = datetime(today.year, today.month, today.day)
         # 可以添加更多日期范围逻辑，或让AI返回精确日期
 
-    for entry_data in ALL_RSS_ENTRIES: 
-        text_to_search = entry_data["title"] + " " + entry_data["description"]
-        
-        # 关键词过滤（使用 any_keywords）
-        if keywords and not contains_any_keywords(text_to_search, keywords):
-            continue
-        if quality and not contains_any_keywords(text_to_search, quality):
-            continue
-        
-        # 媒体类型过滤
-        if media_type:
-            media_type_lower = media_type.lower()
-            type_keywords = []
-            if media_type_lower == "music":
-                type_keywords = ["音乐", "song", "album", "single", "ost", "vgm", "原声"]
-            elif media_type_lower == "anime":
-                type_keywords = ["动漫", "动画", "anime", "番剧", "剧场版"]
-            elif media_type_lower == "game_music":
-                type_keywords = ["游戏音乐", "game music", "vgm"]
-            # 可以添加更多类型及其关键词
-            if not type_keywords or not contains_any_keywords(text_to_search, type_keywords):
-                continue
-
+    # 各条件在全文索引中查出编号集合后求交集 (每个条件内部只要包含一个关键词就匹配)
+    candidate_ids = None
+    def restrict_to(kws):
+        nonlocal candidate_ids
+        matched_ids = find_documents_containing_any(kws)
+        candidate_ids = matched_ids if candidate_ids is None else candidate_ids & matched_ids
+
+    if keywords:
+        restrict_to(keywords)
+    if quality:
+        restrict_to(quality)
+
+    # 媒体类型过滤
+    if media_type:
+        media_type_lower = media_type.lower()
+        type_keywords = []
+        if media_type_lower == "music":
+            type_keywords = ["音乐", "song", "album", "single", "ost", "vgm", "原声"]
+        elif media_type_lower == "anime":
+            type_keywords = ["动漫", "动画", "anime", "番剧", "剧场版"]
+        elif media_type_lower == "game_music":
+            type_keywords = ["游戏音乐", "game music", "vgm"]
+        # 可以添加更多类型及其关键词
+        if type_keywords:
+            restrict_to(type_keywords)
+        else:
+            candidate_ids = set()
 
+    matched_entries = ALL_RSS_ENTRIES if candidate_ids is None else [ALL_RSS_ENTRIES[doc_id] for doc_id in sorted(candidate_ids)]
+    for entry_data in matched_entries: 
         if start_date and entry_data.get('published_parsed'):
             entry_date = datetime(*entry_data['published_parsed'][:6])
             if entry_date < start_date:
@@ -316,6 +262,7 @@ def main():
 
     load_config()
     load_seen_torrents()
+    load_link_resolution_cache()
     
     qb_config = CONFIG['qbittorrent']
     gemini_config = CONFIG['gemini']
@@ -327,6 +274,7 @@ def main():
         QB_CLIENT = Client(qb_config['url'])
         QB_CLIENT.login(qb_config['username'], qb_config['password'])
         print(f"成功连接到 qBittorrent ({qb_config['url']}).")
+        sync_qb_torrents(QB_CLIENT) # 建立本地种子 hash 镜像，之后只做增量同步
     except Exception as e:
         print(f"连接或登录 qBittorrent 失败: {e}")
         print("请检查 qBittorrent Web UI 是否开启，以及配置文件中的 URL、用户名和密码是否正确。")
@@ -395,8 +343,7 @@ def main():
 
                             print(f"\nAI: 准备下载 '{title}'...")
                             if add_and_verify_torrent(actual_download_link, default_path, default_tags, title, unique_id):
-                                SEEN_TORRENTS.add(unique_id) 
-                                save_seen_torrents()
+                                record_seen_torrent(SEEN_TORRENTS, unique_id)
                             else:
                                 print(f"AI: 下载 '{title}' 失败。请检查日志或手动下载。")
                         else:
@@ -460,6 +407,8 @@ def main():
             print(f"AI: 发生未知错误: {e}")
             print("AI: 请尝试重新开始对话。")
 
+    save_seen_torrents()
+
     if QB_CLIENT:
         try:
             pass 
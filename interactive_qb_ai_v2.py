@@ -1,28 +1,51 @@
 # -*- coding: utf-8 -*-
-import feedparser
 import json
 import os
 from qbittorrent import Client
 import google.generativeai as genai
 import time
 import re
+import queue
+import threading
 from json.decoder import JSONDecodeError
-import requests
-from bs4 import BeautifulSoup
-from urllib.parse import urljoin, urlparse, parse_qs 
+from urllib.parse import urlparse, parse_qs 
 import base64
-from datetime import datetime, timedelta, timezone 
+from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
+from qb_sync import sync_qb_torrents, is_torrent_in_client, wait_for_torrent
+from seen_journal import load_seen_torrent_set, record_seen_torrent, compact_seen_torrents, SEEN_TORRENTS_FILE, SEEN_TORRENTS_JOURNAL_FILE
+from dmhy_resolver import resolve_download_links, load_link_resolution_cache, seed_link_resolution_cache, save_link_resolution_cache, LINK_RESOLUTION_CACHE_FILE, DEFAULT_RESOLVE_CONCURRENCY
+from anime_alias import load_anime_aliases, build_anime_title_index, add_anime_title, resolve_anime_titles
+from entry_aggregates import build_entry_aggregates, add_entry_to_aggregates, update_entry_metadata_aggregates, get_entry_id, mark_entry_seen, get_total_entry_count, sample_unseen_entries, get_recent_anime_music
+from entry_index import build_entry_index, index_entry, reindex_entry_metadata, find_matching_entry_ids, page_entries_by_time
+from entry_store import open_entry_store, migrate_legacy_entries_if_needed, load_entries, insert_entries, get_entry_description, is_metadata_incomplete, enqueue_reenrichment, next_reenrichment_ids, count_pending_reenrichment, record_reenrichment_attempt, complete_reenrichment
+from feed_watermark import load_feed_watermarks, save_feed_watermarks, filter_entries_above_watermark, commit_feed_watermark
+from text_normalizer import normalize_text
+from title_parser import parse_release_title, DEFAULT_MIN_PARSE_CONFIDENCE
+from description_compactor import compact_description, load_description_boilerplate, DEFAULT_DESCRIPTION_TOKEN_CAP
+from llm_replay import configure_llm_replay, prepare_llm_replay_state, generate_content_with_replay, get_llm_replay_mode, get_llm_replay_stats, make_function_response_part, LLMReplayMissError, ReplayChatSession, DEFAULT_LLM_REPLAY_MODE, DEFAULT_LLM_REPLAY_STORE_DIR
+from gemini_quota import configure_gemini_quota, acquire_gemini_quota, get_gemini_request_count, pause_gemini_requests, get_retry_after_seconds, estimate_token_count, DEFAULT_GEMINI_RPM, DEFAULT_GEMINI_TPM
+from feed_fetcher import fetch_feed, load_feed_http_cache, commit_feed_http_cache, save_feed_http_cache
 
 # --- 配置及文件路径 ---
 CONFIG_FILE = 'config.json'
-SEEN_TORRENTS_FILE = 'seen_torrents.json'
 RSS_LAST_UPDATE_FILE = 'rss_last_update.json' 
-AI_ANALYZED_ENTRIES_FILE = 'ai_analyzed_entries.json' 
+AI_ANALYZED_ENTRIES_FILE = 'ai_analyzed_entries.json' # 旧格式，仅在首次运行时导入条目库
+ENTRY_STORE_FILE = 'ai_analyzed_entries.db'
+FEED_HTTP_CACHE_FILE = 'feed_http_cache_v2.json' # 与 auto_torrent_downloader 分开，两边各自判断 Feed 是否有变化
+DEFAULT_METADATA_BATCH_TOKEN_BUDGET = 8000 # 每个元数据提取批次的估算 token 上限 (prompt + 输出)
+MAX_METADATA_BATCH_ENTRIES = 40 # 每批条目数上限，避免输出过长被截断
+METADATA_SINGLE_ENTRY_ATTEMPTS = 3 # 单个条目的结果仍对不上时最多请求的次数
+DEFAULT_EXTRACTION_CONCURRENCY = 4 # 同时进行中的元数据提取批次数
+ESTIMATED_OUTPUT_TOKENS_PER_ENTRY = 80 # 估算 token 消耗时每个条目的输出 token 数
+DEFAULT_REENRICH_IDLE_SECONDS = 30 # 距上次输入超过这个时间才在后台补全元数据
+DEFAULT_REENRICH_MAX_REQUESTS = 20 # 每次运行后台补全最多发出的 Gemini 请求数
+REENRICH_MAX_ATTEMPTS = 5 # 补全失败达到这个次数的条目不再重试
+REENRICH_POLL_SECONDS = 5
 
 # --- 全局变量和客户端实例 ---
 CONFIG = {}
 SEEN_TORRENTS = set()
-RSS_LAST_UPDATE_TIMES = {} 
 QB_CLIENT = None
 GEMINI_MODEL = None        
 GEMINI_METADATA_MODEL = None 
@@ -30,6 +53,9 @@ CHAT_SESSION = None
 ALL_AI_SEARCHABLE_ENTRIES = [] # 存储AI搜索所需信息的轻量级列表: [{unique_id, title, published_parsed, metadata}]
 FULL_ENTRY_DETAILS_MAP = {} # 存储完整条目信息（包括actual_download_link等），以unique_id为键，供按需查询
 LAST_SEARCH_RESULTS = [] # 存储上次搜索结果的 unique_id 列表，用于分页和下载
+LAST_SEARCH_START_INDEX = 0 # 上次搜索结果第一条的偏移量，序号 = 偏移量 + 页内位置 + 1
+LAST_USER_ACTIVITY_TIME = time.monotonic() # 上次用户输入的时间，后台补全据此判断是否空闲
+REENRICHED_METADATA_QUEUE = queue.Queue() # 后台补全得到的 (unique_id, metadata)，由对话主线程应用到内存结构
 
 
 # --- 辅助函数：加载/保存配置和已处理的种子 ---
@@ -50,109 +76,55 @@ def load_config():
 
 def load_seen_torrents():
     global SEEN_TORRENTS
-    if not os.path.exists(SEEN_TORRENTS_FILE):
-        SEEN_TORRENTS = set()
-        return
-
-    try:
-        if os.path.getsize(SEEN_TORRENTS_FILE) == 0:
-             SEEN_TORRENTS = set()
-             return
-             
-        with open(SEEN_TORRENTS_FILE, 'r', encoding='utf-8') as f:
-           data = json.load(f)
-           SEEN_TORRENTS = set(data) if isinstance(data, list) else set()
-           
-    except JSONDecodeError:
-        print(f"警告: 无法解析文件 '{SEEN_TORRENTS_FILE}' (文件为空或JSON格式错误)。将返回空集合并继续。")
-        SEEN_TORRENTS = set()
-    except Exception as e:
-         print(f"警告: 读取文件 '{SEEN_TORRENTS_FILE}' 发生错误: {e}。将返回空集合并继续。")
-         SEEN_TORRENTS = set()
+    SEEN_TORRENTS = load_seen_torrent_set()
 
 def save_seen_torrents():
-    with open(SEEN_TORRENTS_FILE, 'w', encoding='utf-8') as f:
-        json.dump(list(SEEN_TORRENTS), f, ensure_ascii=False, indent=4)
+    compact_seen_torrents(SEEN_TORRENTS)
 
 def load_rss_last_update_times():
-    global RSS_LAST_UPDATE_TIMES
-    if not os.path.exists(RSS_LAST_UPDATE_FILE):
-        RSS_LAST_UPDATE_TIMES = {}
-        return
-    try:
-        with open(RSS_LAST_UPDATE_FILE, 'r', encoding='utf-8') as f:
-            RSS_LAST_UPDATE_TIMES = json.load(f)
-            for feed_name, timestamp_str in RSS_LAST_UPDATE_TIMES.items():
-                if isinstance(timestamp_str, str):
-                    RSS_LAST_UPDATE_TIMES[feed_name] = datetime.fromisoformat(timestamp_str)
-    except JSONDecodeError:
-        print(f"警告: 无法解析文件 '{RSS_LAST_UPDATE_FILE}' (文件为空或JSON格式错误)。将返回空字典。")
-        RSS_LAST_UPDATE_TIMES = {}
-    except Exception as e:
-        print(f"警告: 读取文件 '{RSS_LAST_UPDATE_FILE}'发生错误: {e}。将返回空字典。")
-        RSS_LAST_UPDATE_TIMES = {}
+    load_feed_watermarks(RSS_LAST_UPDATE_FILE) # 每个 Feed 的水位线: 最新发布时间 + 同一秒内的条目 ID
 
 def save_rss_last_update_times():
-    times_to_save = {k: v.isoformat() if isinstance(v, datetime) else v for k, v in RSS_LAST_UPDATE_TIMES.items()}
-    with open(RSS_LAST_UPDATE_FILE, 'w', encoding='utf-8') as f:
-        json.dump(times_to_save, f, ensure_ascii=False, indent=4)
+    save_feed_watermarks()
 
-# --- 修正：加载/保存AI分析过的条目，并构建内存中的数据结构 ---
+# --- 加载/保存AI分析过的条目 (SQLite 条目库)，并构建内存中的数据结构 ---
 def load_ai_analyzed_entries():
+    """从条目库加载检索所需的字段 (不含描述)。首次运行时自动导入旧的 ai_analyzed_entries.json。"""
     global ALL_AI_SEARCHABLE_ENTRIES, FULL_ENTRY_DETAILS_MAP
     ALL_AI_SEARCHABLE_ENTRIES = []
     FULL_ENTRY_DETAILS_MAP = {} 
 
-    if not os.path.exists(AI_ANALYZED_ENTRIES_FILE):
-        return
     try:
-        with open(AI_ANALYZED_ENTRIES_FILE, 'r', encoding='utf-8') as f:
-            loaded_entries = json.load(f)
-            for entry_data in loaded_entries:
-                # 转换 published_parsed 为 datetime 对象
-                if entry_data.get('published_parsed') and isinstance(entry_data['published_parsed'], list):
-                    try: 
-                        entry_data['published_parsed'] = datetime(*entry_data['published_parsed'][:6])
-                    except: 
-                        entry_data['published_parsed'] = None
-                
-                entry_unique_id = entry_data.get('infohash')
-                if not entry_unique_id:
-                    entry_unique_id = entry_data.get('original_link')
-                if not entry_unique_id: 
-                    continue
-
-                # 存储完整数据到映射表
-                FULL_ENTRY_DETAILS_MAP[entry_unique_id] = entry_data 
-
-                # 存储轻量级数据到 AI 可搜索列表
-                ALL_AI_SEARCHABLE_ENTRIES.append({
-                    "unique_id": entry_unique_id, 
-                    "title": entry_data.get('title'),
-                    "published_parsed": entry_data.get('published_parsed'),
-                    "metadata": entry_data.get('metadata', {})
-                })
-    except JSONDecodeError:
-        print(f"警告: 无法解析文件 '{AI_ANALYZED_ENTRIES_FILE}' (文件为空或JSON格式错误)。将返回空列表。")
-        ALL_AI_SEARCHABLE_ENTRIES = []
-        FULL_ENTRY_DETAILS_MAP = {}
+        open_entry_store(ENTRY_STORE_FILE)
+        migrate_legacy_entries_if_needed(AI_ANALYZED_ENTRIES_FILE)
+        for entry_data in load_entries():
+            entry_unique_id = entry_data.pop('unique_id')
+
+            # 存储完整数据到映射表 (描述按需通过 get_entry_description 读取)
+            FULL_ENTRY_DETAILS_MAP[entry_unique_id] = entry_data 
+
+            # 存储轻量级数据到 AI 可搜索列表
+            ALL_AI_SEARCHABLE_ENTRIES.append({
+                "unique_id": entry_unique_id, 
+                "title": entry_data.get('title'),
+                "published_parsed": entry_data.get('published_parsed'),
+                "metadata": entry_data.get('metadata', {})
+            })
     except Exception as e:
-        print(f"警告: 读取文件 '{AI_ANALYZED_ENTRIES_FILE}' 发生错误: {e}。将返回空列表。")
+        print(f"警告: 读取条目库 '{ENTRY_STORE_FILE}' 发生错误: {e}。将返回空列表。")
         ALL_AI_SEARCHABLE_ENTRIES = []
         FULL_ENTRY_DETAILS_MAP = {}
 
-def save_ai_analyzed_entries():
-    # 修正：在保存前，对 FULL_ENTRY_DETAILS_MAP 中的每个条目进行深拷贝并转换 published_parsed
-    entries_to_save_processed = []
-    for entry in FULL_ENTRY_DETAILS_MAP.values():
-        saved_entry_copy = entry.copy() # 创建副本，不修改原始数据
-        if isinstance(saved_entry_copy.get('published_parsed'), datetime):
-            # 转换为 time.struct_time 的形式，它是可JSON序列化的列表
-            saved_entry_copy['published_parsed'] = saved_entry_copy['published_parsed'].timetuple()[:6] 
-        entries_to_save_processed.append(saved_entry_copy)
+    build_entry_index(ALL_AI_SEARCHABLE_ENTRIES)
+    build_anime_title_index(entry['metadata'].get('anime_title') for entry in ALL_AI_SEARCHABLE_ENTRIES if entry.get('metadata'))
+    build_entry_aggregates(ALL_AI_SEARCHABLE_ENTRIES, SEEN_TORRENTS)
 
-    with open(AI_ANALYZED_ENTRIES_FILE, 'w', encoding='utf-8') as f:
-        json.dump(entries_to_save_processed, f, ensure_ascii=False, indent=4)
+def save_ai_analyzed_entries(new_entries):
+    """只把本次新分析的条目增量写入条目库，new_entries 为 [{unique_id, ...完整条目字段}]。"""
+    try:
+        insert_entries(new_entries)
+    except Exception as e:
+        print(f"警告: 写入条目库 '{ENTRY_STORE_FILE}' 发生错误: {e}")
 
 
 # --- 健壮地提取 Infohash ---
@@ -180,42 +152,6 @@ def extract_infohash(link_candidate):
                         return None
     return None
 
-# --- 从 RSS entry 或网页中提取实际下载链接 ---
-def get_actual_download_link(entry):
-    original_link = entry.link
-    
-    if hasattr(entry, 'enclosures') and entry.enclosures:
-        for enc in entry.enclosures:
-            if enc.href:
-                if enc.type == 'application/x-bittorrent' or enc.href.startswith('magnet:'):
-                    return enc.href
-    
-    if original_link and original_link.startswith('magnet:'):
-        return original_link
-    elif original_link and "share.dmhy.org/topics/view/" in original_link:
-        try:
-            headers = {
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari=537.36'
-            }
-            response = requests.get(original_link, headers=headers, timeout=15)
-            response.raise_for_status()
-            soup = BeautifulSoup(response.text, 'html.parser')
-
-            magnet_links_on_page = soup.find_all('a', href=re.compile(r'^magnet:'))
-            if magnet_links_on_page:
-                return magnet_links_on_page[0]['href']
-            else:
-                torrent_links_on_page = soup.find_all('a', href=re.compile(r'\.torrent$'))
-                if torrent_links_on_page:
-                    relative_path = torrent_links_on_page[0]['href']
-                    return urljoin(original_link, relative_path)
-        except requests.exceptions.RequestException as req_e:
-            pass 
-        except Exception as parse_e:
-            pass 
-    
-    return original_link
-
 # --- qBittorrent 任务添加与验证 ---
 def add_and_verify_torrent(link, save_path, tags, title, unique_id):
     """
@@ -227,6 +163,11 @@ def add_and_verify_torrent(link, save_path, tags, title, unique_id):
         return True
 
     try:
+        torrent_infohash = extract_infohash(link)
+        if torrent_infohash and is_torrent_in_client(QB_CLIENT, torrent_infohash, refresh=True):
+            print(f"  资源 '{title}' 已在 qBittorrent 中，无需重复添加。")
+            return True
+
         print(f"  发送下载任务到qBittorrent: {title}")
         QB_CLIENT.download_from_link(
             link,
@@ -235,16 +176,10 @@ def add_and_verify_torrent(link, save_path, tags, title, unique_id):
         )
         
         added_successfully = False
-        time.sleep(2) 
-
-        all_torrents = QB_CLIENT.torrents()
-        torrent_infohash = extract_infohash(link)
 
         if torrent_infohash:
-            for torrent in all_torrents:
-                if torrent['hash'] == torrent_infohash:
-                    added_successfully = True
-                    break
+            # 通过增量同步等待新任务出现，出现即确认，不再固定等待并拉取完整列表
+            added_successfully = wait_for_torrent(QB_CLIENT, torrent_infohash)
             
             if added_successfully:
                 print(f"  任务添加成功: {title}")
@@ -265,11 +200,8 @@ def add_and_verify_torrent(link, save_path, tags, title, unique_id):
 
 # --- Gemini AI 交互函数及工具定义 ---
 
-# AI 辅助信息提取函数 (使用独立的模型实例，并引入批量处理和速率限制)
-def extract_metadata_with_gemini_batch(entries_data_batch): 
-    if not entries_data_batch:
-        return []
-
+# 元数据提取的 prompt (说明 + 各资源的标题和描述)
+def build_metadata_prompt(entries_data_batch):
     prompt_parts = []
     prompt_parts.append(f"""
 你是一个智能的元数据提取助手。你的任务是从以下给定的多个资源标题和描述中，逐一提取结构化信息，并输出一个 JSON 数组。数组的每个元素对应一个资源，包含以下字段：
@@ -317,59 +249,287 @@ def extract_metadata_with_gemini_batch(entries_data_batch):
 """)
 
     for i, entry_data in enumerate(entries_data_batch):
-        prompt_parts.append(f"""
+        prompt_parts.append(format_metadata_prompt_entry(i, entry_data))
+
+    return "".join(prompt_parts)
+
+def format_metadata_prompt_entry(i, entry_data):
+    return f"""
 ----- 资源 {i+1} -----
 资源标题: {entry_data['title']}
-资源描述: {entry_data.get('description', '无描述')}
-""")
-
-    full_prompt = "".join(prompt_parts)
+资源描述: {compact_entry_description(entry_data) or '无描述'}
+"""
+
+def compact_entry_description(entry_data):
+    """prompt 中使用的描述: 去掉 HTML 和发布组宣传文字并截断到 token 上限 (description_compaction.enabled 为 false 时原样使用)。"""
+    compaction_config = CONFIG.get('description_compaction', {})
+    if not compaction_config.get('enabled', True):
+        return entry_data.get('description', '')
+    return compact_description(entry_data.get('description'), entry_data.get('title'), compaction_config.get('token_cap', DEFAULT_DESCRIPTION_TOKEN_CAP))
+
+def estimate_metadata_batch_tokens(entries_data_batch):
+    """一次提取请求的估算 token 数 (prompt + 输出)。"""
+    return estimate_token_count(build_metadata_prompt(entries_data_batch)) + ESTIMATED_OUTPUT_TOKENS_PER_ENTRY * len(entries_data_batch)
+
+def split_into_metadata_batches(entries, token_budget=DEFAULT_METADATA_BATCH_TOKEN_BUDGET, max_entries=MAX_METADATA_BATCH_ENTRIES):
+    """按估算的 token 数 (prompt + 输出) 分批，短条目多的批次可以装更多条目；单个超出预算的条目独占一批。"""
+    header_tokens = estimate_token_count(build_metadata_prompt([]))
+    batches = []
+    current_batch, current_tokens = [], header_tokens
+    for entry_data in entries:
+        entry_tokens = estimate_token_count(format_metadata_prompt_entry(len(current_batch), entry_data)) + ESTIMATED_OUTPUT_TOKENS_PER_ENTRY
+        if current_batch and (current_tokens + entry_tokens > token_budget or len(current_batch) >= max_entries):
+            batches.append(current_batch)
+            current_batch, current_tokens = [], header_tokens
+        current_batch.append(entry_data)
+        current_tokens += entry_tokens
+    if current_batch:
+        batches.append(current_batch)
+    return batches
+
+def request_metadata_from_gemini(entries_data_batch, request_limit=None):
+    """
+    发送一次提取请求 (429 时按 retry-after 等待后重试)。
+    返回解析出的结果列表 (数量可能与输入不符，无法解析时为空列表)；请求失败时返回 None。
+    request_limit 不为 None 时，请求总数 (get_gemini_request_count) 达到该值后不再重试。
+    """
+    full_prompt = build_metadata_prompt(entries_data_batch)
+    estimated_tokens = estimate_token_count(full_prompt) + ESTIMATED_OUTPUT_TOKENS_PER_ENTRY * len(entries_data_batch)
 
     retries = 3 
     for attempt in range(retries):
+        if attempt and request_limit is not None and get_gemini_request_count() >= request_limit:
+            return None
         try:
-            response = GEMINI_METADATA_MODEL.generate_content(
-                full_prompt,
-                generation_config=genai.GenerationConfig(response_mime_type="application/json")
+            # 与其他提取线程共享 RPM/TPM 配额，没有余量时在这里等待 (回放命中时不等待)
+            response = generate_content_with_replay(
+                GEMINI_METADATA_MODEL, CONFIG['gemini']['model_name'], full_prompt,
+                generation_config={"response_mime_type": "application/json"},
+                before_live_call=lambda: acquire_gemini_quota(estimated_tokens)
             )
-            parsed_results = json.loads(response.text)
-            
-            if isinstance(parsed_results, list) and len(parsed_results) == len(entries_data_batch):
-                return parsed_results
-            else:
-                print(f"  警告: Gemini 返回的JSON格式不符合预期，批次中首条标题: {entries_data_batch[0]['title'][:30]}... 尝试 {attempt + 1}/{retries}。返回: {response.text[:100]}...")
-                if "429" not in response.text: 
-                    time.sleep(2) 
-                continue 
-
+        except LLMReplayMissError:
+            raise # 回放缺少记录时让本次运行失败，而不是当作提取失败跳过
         except Exception as e:
             if "429" in str(e): 
-                retry_delay_for_429 = 5 * (attempt + 1) 
-                print(f"  警告: Gemini 提取元数据速率限制，批次中首条标题: {entries_data_batch[0]['title'][:30]}... 尝试 {attempt + 1}/{retries}。等待 {retry_delay_for_429} 秒后重试。")
-                time.sleep(retry_delay_for_429) 
+                # 按服务器给出的 retry-after 暂停所有提取线程
+                retry_delay_for_429 = get_retry_after_seconds(e, default=5 * (attempt + 1))
+                print(f"  警告: Gemini 提取元数据速率限制，批次中首条标题: {entries_data_batch[0]['title'][:30]}... 尝试 {attempt + 1}/{retries}。等待 {retry_delay_for_429:g} 秒后重试。")
+                pause_gemini_requests(retry_delay_for_429)
+                continue
+            print(f"  警告: Gemini 提取元数据失败，批次中首条标题: {entries_data_batch[0]['title'][:30]}... 错误: {type(e).__name__}: {e}")
+            return None
+
+        try:
+            parsed_results = json.loads(response.text)
+        except (ValueError, TypeError):
+            print(f"  警告: Gemini 返回的内容无法解析为JSON，批次中首条标题: {entries_data_batch[0]['title'][:30]}... 返回: {str(getattr(response, 'text', ''))[:100]}...")
+            return []
+        if isinstance(parsed_results, dict):
+            parsed_results = [parsed_results]
+        return parsed_results if isinstance(parsed_results, list) else []
+    return None
+
+def _normalize_title_for_matching(title):
+    return normalize_text(str(title or '')).replace(' ', '')
+
+def match_metadata_by_title(entries_data_batch, parsed_results):
+    """按标题把返回的结果对应到输入条目 (先完全相同，再互相包含)，对应不上的位置为 None。"""
+    input_titles = [_normalize_title_for_matching(entry_data.get('title')) for entry_data in entries_data_batch]
+    matched = [None] * len(entries_data_batch)
+    leftover_results = []
+    for metadata in parsed_results:
+        if not isinstance(metadata, dict) or not metadata.get('title'):
+            continue
+        result_title = _normalize_title_for_matching(metadata['title'])
+        position = next((k for k, title in enumerate(input_titles) if matched[k] is None and title == result_title), None)
+        if position is None:
+            leftover_results.append((result_title, metadata))
+        else:
+            matched[position] = metadata
+    for result_title, metadata in leftover_results:
+        position = next((k for k, title in enumerate(input_titles)
+                         if matched[k] is None and title and result_title and (title in result_title or result_title in title)), None)
+        if position is not None:
+            matched[position] = metadata
+    return matched
+
+def parse_metadata_locally(entries_data, min_confidence):
+    """用本地标题解析器提取元数据，置信度低于 min_confidence 的位置为 None (需要交给 Gemini)。min_confidence 为 None 时不解析。"""
+    local_metadata = []
+    for entry_data in entries_data:
+        metadata, confidence = parse_release_title(entry_data.get('title')) if min_confidence is not None else ({}, 0.0)
+        local_metadata.append(metadata if metadata and confidence >= min_confidence else None)
+    return local_metadata
+
+# AI 辅助信息提取函数 (使用独立的模型实例，按 token 预算分批，结果数量不符时对半拆分重试)
+# request_limit 不为 None 时，请求总数达到该值后不再发出请求 (包括拆分重试)，未请求的条目对应 None
+def extract_metadata_with_gemini_batch(entries_data_batch, attempts_left=METADATA_SINGLE_ENTRY_ATTEMPTS, request_limit=None):
+    if not entries_data_batch:
+        return []
+    if request_limit is not None and get_gemini_request_count() >= request_limit:
+        return [None] * len(entries_data_batch)
+
+    parsed_results = request_metadata_from_gemini(entries_data_batch, request_limit)
+    if parsed_results is None:
+        return [{}] * len(entries_data_batch)
+    if len(parsed_results) == len(entries_data_batch):
+        return parsed_results
+
+    # 数量不符: 先按标题认领已返回的结果，只对剩下的条目拆分重试，已消耗的 token 不整批浪费
+    matched = match_metadata_by_title(entries_data_batch, parsed_results)
+    unmatched_positions = [k for k, metadata in enumerate(matched) if metadata is None]
+    print(f"  警告: Gemini 返回 {len(parsed_results)} 条结果，批次共 {len(entries_data_batch)} 条 (首条标题: {entries_data_batch[0]['title'][:30]}...)，按标题对应上 {len(entries_data_batch) - len(unmatched_positions)} 条。")
+    if not unmatched_positions:
+        return matched
+
+    unmatched_entries = [entries_data_batch[k] for k in unmatched_positions]
+    if len(unmatched_entries) > 1:
+        half = len(unmatched_entries) // 2
+        retry_results = (extract_metadata_with_gemini_batch(unmatched_entries[:half], request_limit=request_limit)
+                         + extract_metadata_with_gemini_batch(unmatched_entries[half:], request_limit=request_limit))
+    elif len(entries_data_batch) > 1:
+        retry_results = extract_metadata_with_gemini_batch(unmatched_entries, request_limit=request_limit)
+    elif attempts_left > 1:
+        retry_results = extract_metadata_with_gemini_batch(unmatched_entries, attempts_left - 1, request_limit)
+    else:
+        retry_results = [{}]
+    for k, metadata in zip(unmatched_positions, retry_results):
+        matched[k] = metadata
+    return matched
+
+
+# --- 后台补全元数据 ---
+def reenrich_entries_in_background(stop_event, reenrich_config):
+    """
+    对话空闲时 (距上次输入超过 idle_seconds) 从补全队列取出元数据缺失的条目重新提取，
+    本次运行发出的请求数不超过 max_requests。结果先写入条目库，再交给主线程更新内存中的检索结构。
+    """
+    idle_seconds = reenrich_config.get('idle_seconds', DEFAULT_REENRICH_IDLE_SECONDS)
+    max_requests = reenrich_config.get('max_requests', DEFAULT_REENRICH_MAX_REQUESTS)
+    token_budget = CONFIG['gemini'].get('extraction_batch_token_budget', DEFAULT_METADATA_BATCH_TOKEN_BUDGET)
+    local_parser_min_confidence = CONFIG.get('local_title_parser_min_confidence', DEFAULT_MIN_PARSE_CONFIDENCE) if CONFIG.get('local_title_parser_enabled', True) else None
+    requests_used = 0
+
+    while not stop_event.wait(REENRICH_POLL_SECONDS):
+        if time.monotonic() - LAST_USER_ACTIVITY_TIME < idle_seconds:
+            continue
+        if requests_used >= max_requests:
+            return
+
+        unique_ids = next_reenrichment_ids(MAX_METADATA_BATCH_ENTRIES, REENRICH_MAX_ATTEMPTS)
+        if not unique_ids:
+            return
+        missing_ids = [unique_id for unique_id in unique_ids if unique_id not in FULL_ENTRY_DETAILS_MAP]
+        if missing_ids:
+            record_reenrichment_attempt(missing_ids)
+        entries = [
+            {**FULL_ENTRY_DETAILS_MAP[unique_id], "unique_id": unique_id,
+             "description": FULL_ENTRY_DETAILS_MAP[unique_id].get('description') or get_entry_description(unique_id) or ''}
+            for unique_id in unique_ids if unique_id in FULL_ENTRY_DETAILS_MAP
+        ]
+        if not entries:
+            continue
+
+        # 本地解析器能可靠识别的条目不消耗请求预算
+        completed_metadata = {}
+        for entry_data, metadata in zip(entries, parse_metadata_locally(entries, local_parser_min_confidence)):
+            if metadata is not None and not is_metadata_incomplete(metadata):
+                completed_metadata[entry_data['unique_id']] = metadata
+        entries = [entry_data for entry_data in entries if entry_data['unique_id'] not in completed_metadata]
+
+        batch = split_into_metadata_batches(entries, token_budget)[0] if entries else []
+        extracted_metadata_batch = []
+        if batch:
+            requests_before = get_gemini_request_count()
+            # 拆分重试也计入本次运行的请求预算
+            extracted_metadata_batch = extract_metadata_with_gemini_batch(batch, request_limit=requests_before + max_requests - requests_used)
+            requests_used += get_gemini_request_count() - requests_before
+
+        failed_ids = []
+        for entry_data, metadata in zip(batch, extracted_metadata_batch):
+            if metadata is None: # 预算用完，没有发出请求，不计入尝试次数
+                continue
+            if is_metadata_incomplete(metadata):
+                failed_ids.append(entry_data['unique_id'])
             else:
-                print(f"  警告: Gemini 提取元数据失败，批次中首条标题: {entries_data_batch[0]['title'][:30]}... 错误: {type(e).__name__}: {e}")
-                break 
-    return [{}] * len(entries_data_batch) 
+                completed_metadata[entry_data['unique_id']] = metadata
+        complete_reenrichment(completed_metadata)
+        record_reenrichment_attempt(failed_ids)
+        for unique_id, metadata in completed_metadata.items():
+            REENRICHED_METADATA_QUEUE.put((unique_id, metadata))
+
+def apply_reenriched_metadata():
+    """在对话主线程中把后台补全的元数据原地更新到条目、倒排索引、别名索引和汇总。返回更新的条目数。"""
+    applied_count = 0
+    while True:
+        try:
+            unique_id, metadata = REENRICHED_METADATA_QUEUE.get_nowait()
+        except queue.Empty:
+            return applied_count
+        entry_id = get_entry_id(unique_id)
+        if entry_id is None:
+            continue
+        entry_data = ALL_AI_SEARCHABLE_ENTRIES[entry_id]
+        reindex_entry_metadata(entry_id, entry_data.get('metadata'), metadata)
+        entry_data['metadata'] = metadata
+        if unique_id in FULL_ENTRY_DETAILS_MAP:
+            FULL_ENTRY_DETAILS_MAP[unique_id]['metadata'] = metadata
+        add_anime_title(metadata.get('anime_title'))
+        update_entry_metadata_aggregates(entry_id, entry_data)
+        applied_count += 1
+
+
+# --- 搜索的日期条件 ---
+def resolve_date_range(date_range=None, start_date=None, end_date=None):
+    """
+    把日期条件转换为 (起始时间, 结束时间)，两端都包含，未指定的一端为 None。
+    date_range 与 v1 相同，支持 "this quarter" / "this month" / "this week" / "today"；
+    start_date / end_date 为 "YYYY-MM-DD"，end_date 包含当天。
+    """
+    range_start, range_end = None, None
+    if date_range:
+        today = datetime.now()
+        if "quarter" in date_range.lower(): # 本季度
+            range_start = datetime(today.year, 3 * ((today.month - 1) // 3) + 1, 1)
+        elif "month" in date_range.lower(): # 本月
+            range_start = datetime(today.year, today.month, 1)
+        elif "week" in date_range.lower(): # 本周 (假设周一为一周开始)
+            range_start = datetime(today.year, today.month, today.day) - timedelta(days=today.weekday())
+        elif "today" in date_range.lower(): # 今天
+            range_start = datetime(today.year, today.month, today.day)
+    try:
+        if start_date:
+            range_start = datetime.fromisoformat(str(start_date)[:10])
+        if end_date:
+            range_end = datetime.fromisoformat(str(end_date)[:10]) + timedelta(days=1, seconds=-1)
+    except ValueError:
+        print(f"AI: 无法识别的日期 '{start_date or ''}' / '{end_date or ''}'，已忽略。")
+    return range_start, range_end
 
 # RSS 搜索工具的实现
-def search_rss_items(anime_title=None, artist=None, song_type=None, quality=None, media_type=None, limit=20, only_unseen=False, random_recommend=False, offset=0): 
+def search_rss_items(anime_title=None, artist=None, song_type=None, quality=None, media_type=None, limit=20, only_unseen=False, random_recommend=False, offset=0, cursor=None, date_range=None, start_date=None, end_date=None): 
     """
-    在已加载的所有资源中搜索匹配条件的条目。
+    在已加载的所有资源中搜索匹配条件的条目，结果按发布时间从新到旧排列。
     Args:
-        anime_title (str): 动漫标题，支持部分匹配和别名理解。
+        anime_title (str): 动漫标题，支持部分匹配、别名 (中/日/英) 和繁简/日文汉字写法的模糊匹配。
         artist (str): 艺术家或歌手的名称。
         song_type (str): 歌曲类型，如 "OP", "ED", "插入歌", "OST", "专辑", "单曲", "VGM"。
         quality (str): 音质，如 "FLAC", "320K", "Hi-Res"。
         media_type (str): 媒体类型，如 "动漫剧集", "动漫电影", "动漫音乐", "游戏", "软件", "其他"。
         limit (int): 返回结果的最大数量。
         only_unseen (bool): 是否只返回未曾处理过的资源。默认为 False。
-        random_recommend (bool): 如果为 True，则忽略其他条件，随机推荐。默认为 False。
-        offset (int): 搜索结果的起始偏移量，用于分页。默认为 0。
+        random_recommend (bool): 如果为 True，则忽略排序，随机推荐。默认为 False。
+        offset (int): 搜索结果的起始偏移量。翻页时请优先使用 cursor。默认为 0。
+        cursor (str): 上一次搜索返回的 next_cursor，传入后返回下一页 (其余条件需保持不变)。
+        date_range (str): 日期范围，如 "this quarter", "this month", "this week", "today"。
+        start_date (str): 起始日期 (含)，格式 "YYYY-MM-DD"。
+        end_date (str): 结束日期 (含)，格式 "YYYY-MM-DD"。
     Returns:
-        dict: 包含 "results" (匹配的资源列表), "total_results" (总数), "offset" (当前偏移量) 和 "limit" (当前限制)。
+        dict: 包含 "results" (匹配的资源列表), "total_results" (总数), "offset" (本页第一条的偏移量),
+              "limit" (当前限制)、"next_cursor" (下一页游标，没有更多结果时为 None)，
+              以及按别名/模糊匹配解析出的 "matched_anime_titles"。
     """
-    global LAST_SEARCH_RESULTS
+    global LAST_SEARCH_RESULTS, LAST_SEARCH_START_INDEX
 
     print("AI: 正在从已加载的资源中筛选结果...")
 
@@ -377,71 +537,31 @@ def search_rss_items(anime_title=None, artist=None, song_type=None, quality=None
     limit = int(limit) if limit is not None else 20
     offset = int(offset) if offset is not None else 0
 
-    all_matching_candidates = []
-    for entry_data in ALL_AI_SEARCHABLE_ENTRIES: 
-        
-        metadata = entry_data.get("metadata", {})
-        
-        if media_type:
-            extracted_media_type = metadata.get("media_type")
-            if not extracted_media_type or media_type.lower() not in extracted_media_type.lower():
-                continue
+    # 动漫名先在本地解析别名和不同写法，不需要模型换一种拼写再查一次
+    matched_anime_titles = resolve_anime_titles(anime_title) if anime_title else []
 
-        if anime_title:
-            extracted_anime_title = metadata.get("anime_title")
-            if not extracted_anime_title: 
-                continue
-            
-            user_title_lower = anime_title.lower()
-            extracted_title_lower = extracted_anime_title.lower()
-            original_title_lower = entry_data["title"].lower() 
+    # 通过倒排索引对各条件的编号集合求交集，不再逐条扫描所有条目
+    matched_entry_ids = find_matching_entry_ids(anime_title, artist, song_type, quality, media_type, matched_anime_titles)
+    range_start, range_end = resolve_date_range(date_range, start_date, end_date)
+    accept_entry = (lambda entry_id: ALL_AI_SEARCHABLE_ENTRIES[entry_id]["unique_id"] not in SEEN_TORRENTS) if only_unseen else None
 
-            if not (user_title_lower in extracted_title_lower or \
-                    extracted_title_lower in user_title_lower or \
-                    user_title_lower in original_title_lower):
-                continue
-
-        if artist:
-            extracted_artists = metadata.get("artists", [])
-            if not extracted_artists or not any(artist.lower() in a.lower() for a in extracted_artists):
-                continue
-        
-        if song_type:
-                extracted_song_type = metadata.get("song_type")
-                if not extracted_song_type or song_type.lower() not in extracted_song_type.lower():
-                    continue
-
-        if quality:
-            extracted_quality = metadata.get("quality")
-            if not extracted_quality or quality.lower() not in extracted_quality.lower():
-                continue
-        
-        if only_unseen:
-            entry_unique_id = entry_data["unique_id"] 
-            if entry_unique_id in SEEN_TORRENTS:
-                continue
-
-        all_matching_candidates.append(entry_data)
-    
-    total_results = len(all_matching_candidates) 
-
-    if random_recommend and all_matching_candidates:
+    next_cursor = None
+    if random_recommend:
+        # 随机推荐不需要排序，直接取满足条件的全部编号后打乱
+        candidate_ids, total_results, _, _ = page_entries_by_time(matched_entry_ids, range_start, range_end, limit=len(ALL_AI_SEARCHABLE_ENTRIES), accept=accept_entry)
         import random
-        random.shuffle(all_matching_candidates)
-        filtered_results = all_matching_candidates[:limit]
+        random.shuffle(candidate_ids)
+        page_ids = candidate_ids[:limit]
+        offset = 0
     else:
-        # 修正：当没有任何过滤条件（除了 offset 和 limit），并且没有要求随机推荐
-        # 则默认按时间倒序排序所有候选者，以实现“最新资源”的默认概览
-        # 如果有任何过滤条件，但没有明确排序要求，也保持按时间倒序
-        if not (anime_title or artist or song_type or quality or media_type or random_recommend):
-            all_matching_candidates.sort(key=lambda x: x['published_parsed'] if x['published_parsed'] else datetime.min, reverse=True)
-            
-        start_index = max(0, min(offset, total_results))
-        end_index = min(start_index + limit, total_results)
-        
-        filtered_results = all_matching_candidates[start_index:end_index]
-            
+        # 在按发布时间排好序的索引上定位，翻页时用游标 (上一页最后一条的时间 + 编号) 直接跳到下一页
+        page_ids, total_results, next_cursor, offset = page_entries_by_time(
+            matched_entry_ids, range_start, range_end, cursor=cursor, offset=offset, limit=limit, accept=accept_entry
+        )
+
+    filtered_results = [ALL_AI_SEARCHABLE_ENTRIES[entry_id] for entry_id in page_ids]
     LAST_SEARCH_RESULTS = filtered_results 
+    LAST_SEARCH_START_INDEX = offset
     
     return { 
         "results": [
@@ -453,7 +573,9 @@ def search_rss_items(anime_title=None, artist=None, song_type=None, quality=None
         ],
         "total_results": total_results, 
         "offset": offset, 
-        "limit": limit 
+        "limit": limit,
+        "next_cursor": next_cursor,
+        "matched_anime_titles": matched_anime_titles
     }
 
 
@@ -470,42 +592,14 @@ def list_recent_animes_with_music(limit=5):
     # 修正：将 limit 强制转换为 int 类型
     limit = int(limit) if limit is not None else 5
 
-    anime_music_map = {} 
-    for entry_data in ALL_AI_SEARCHABLE_ENTRIES: 
-        entry_unique_id = entry_data["unique_id"] 
-        if entry_unique_id in SEEN_TORRENTS: 
-            continue 
-            
-        metadata = entry_data.get("metadata", {})
-        anime_title = metadata.get("anime_title")
-        media_type = metadata.get("media_type")
-        
-        if anime_title and (media_type == "动漫音乐"): 
-            if anime_title not in anime_music_map:
-                anime_music_map[anime_title] = []
-            anime_music_map[anime_title].append(entry_data)
-    
+    # 直接读取增量维护的汇总，不再遍历和排序全部条目
     recent_animes = []
-    sorted_animes_by_date = sorted(
-        anime_music_map.items(), 
-        key=lambda item: max(e['published_parsed'] if e.get('published_parsed') else datetime.min for e in item[1]), 
-        reverse=True
-    )
-
-    for anime_title, entries in sorted_animes_by_date:
-        entries.sort(key=lambda x: x['published_parsed'] if x.get('published_parsed') else datetime.min, reverse=True)
-        
-        music_summary = []
-        for i, entry in enumerate(entries[:3]): 
-            music_summary.append(f"《{entry['title']}》")
-        
+    for anime_title, music_count, latest_entry_ids in get_recent_anime_music(limit):
         recent_animes.append({
             "anime_title": anime_title,
-            "music_count": len(entries),
-            "latest_music_summary": music_summary
+            "music_count": music_count,
+            "latest_music_summary": [f"《{ALL_AI_SEARCHABLE_ENTRIES[entry_id]['title']}》" for entry_id in latest_entry_ids]
         })
-        if len(recent_animes) >= limit:
-            break
             
     return recent_animes
 
@@ -522,19 +616,10 @@ def get_overall_resource_summary(limit_examples=5):
     # 修正：将 limit_examples 强制转换为 int 类型
     limit_examples = int(limit_examples) if limit_examples is not None else 5
 
-    total_entries = len(ALL_AI_SEARCHABLE_ENTRIES)
+    total_entries = get_total_entry_count()
     
-    examples = []
-    if total_entries > 0:
-        import random
-        unseen_candidates = [
-            entry for entry in ALL_AI_SEARCHABLE_ENTRIES 
-            if (entry['unique_id'] not in SEEN_TORRENTS)
-        ]
-        if len(unseen_candidates) > limit_examples:
-            examples = random.sample(unseen_candidates, limit_examples)
-        else:
-            examples = unseen_candidates
+    # 从未处理条目池中直接随机抽样，只需 O(k)
+    examples = [ALL_AI_SEARCHABLE_ENTRIES[entry_id] for entry_id in sample_unseen_entries(limit_examples)]
     
     return {
         "total_resources": total_entries,
@@ -552,27 +637,45 @@ TOOL_FUNCTIONS = [
 
 # --- 主逻辑函数 ---
 def main():
-    global QB_CLIENT, GEMINI_MODEL, GEMINI_METADATA_MODEL, CHAT_SESSION, ALL_AI_SEARCHABLE_ENTRIES, FULL_ENTRY_DETAILS_MAP, LAST_SEARCH_RESULTS
+    global QB_CLIENT, GEMINI_MODEL, GEMINI_METADATA_MODEL, CHAT_SESSION, ALL_AI_SEARCHABLE_ENTRIES, FULL_ENTRY_DETAILS_MAP, LAST_SEARCH_RESULTS, LAST_USER_ACTIVITY_TIME
 
     load_config()
+    load_anime_aliases(CONFIG.get('anime_aliases'))
+    llm_replay_config = CONFIG.get('llm_replay', {})
+    configure_llm_replay(llm_replay_config.get('mode', DEFAULT_LLM_REPLAY_MODE), llm_replay_config.get('store_dir', DEFAULT_LLM_REPLAY_STORE_DIR))
+    prepare_llm_replay_state('interactive_qb_ai_v2', [
+        SEEN_TORRENTS_FILE, SEEN_TORRENTS_JOURNAL_FILE, RSS_LAST_UPDATE_FILE, AI_ANALYZED_ENTRIES_FILE,
+        ENTRY_STORE_FILE, ENTRY_STORE_FILE + '-wal', FEED_HTTP_CACHE_FILE, LINK_RESOLUTION_CACHE_FILE
+    ])
+    load_description_boilerplate(CONFIG.get('description_compaction', {}).get('boilerplate'))
     load_seen_torrents()
     load_rss_last_update_times() 
     load_ai_analyzed_entries() 
+    load_feed_http_cache(FEED_HTTP_CACHE_FILE)
+    load_link_resolution_cache()
+    seed_link_resolution_cache(FULL_ENTRY_DETAILS_MAP.values())
+    save_link_resolution_cache()
     
     qb_config = CONFIG['qbittorrent']
     gemini_config = CONFIG['gemini']
 
+    if get_llm_replay_mode() == "replay":
+        CONFIG['dry_run'] = True # 回放不访问网络，也就不连接 qBittorrent，下载只模拟
     print(f"脚本以 {'模拟运行模式' if CONFIG['dry_run'] else '实际运行模式'} 启动。")
 
     # 连接 qBittorrent 客户端
-    try:
-        QB_CLIENT = Client(qb_config['url'])
-        QB_CLIENT.login(qb_config['username'], qb_config['password'])
-        print(f"成功连接到 qBittorrent ({qb_config['url']}).")
-    except Exception as e:
-        print(f"连接或登录 qBittorrent 失败: {e}")
-        print("请检查 qBittorrent Web UI 是否开启，以及配置文件中的 URL、用户名和密码是否正确。")
-        exit()
+    if get_llm_replay_mode() == "replay":
+        print("回放模式: 不连接 qBittorrent。")
+    else:
+        try:
+            QB_CLIENT = Client(qb_config['url'])
+            QB_CLIENT.login(qb_config['username'], qb_config['password'])
+            print(f"成功连接到 qBittorrent ({qb_config['url']}).")
+            sync_qb_torrents(QB_CLIENT) # 建立本地种子 hash 镜像，之后只做增量同步
+        except Exception as e:
+            print(f"连接或登录 qBittorrent 失败: {e}")
+            print("请检查 qBittorrent Web UI 是否开启，以及配置文件中的 URL、用户名和密码是否正确。")
+            exit()
 
     # 初始化 Gemini 模型和对话会话
     try:
@@ -589,10 +692,11 @@ def main():
             model_name=gemini_config['model_name'] 
         )
 
-        CHAT_SESSION = GEMINI_MODEL.start_chat(history=[
+        # 对话经记录/回放层发送，工具的名称和说明参与记录的键
+        CHAT_SESSION = ReplayChatSession(GEMINI_MODEL, gemini_config['model_name'], tools_signature={f.__name__: f.__doc__ for f in TOOL_FUNCTIONS}, history=[
             {"role": "user", "parts": "你好，请记住我是一个用户，你是一个能够搜索各种资源并辅助我下载的智能助手。你能够理解资源类型（动漫剧集、动漫电影、动漫音乐、游戏、软件等）、动漫名称的别名（如“赛马娘”指代“ウマ娘 プリティーダービー”），并识别歌曲类型、音质、视频分辨率等。"},
             {"role": "model", "parts": "好的，我明白。我将根据您的请求智能搜索各种资源，并协助您下载。"},
-            {"role": "user", "parts": "当我询问“rss中都有哪些资源”、“你都加载了啥数据”、“有什么资源”这类宽泛问题时，请你直接调用 `get_overall_resource_summary` 工具来告诉我总数和一些随机示例，而**不要**反问我细致的条件。当我没有明确指定搜索条件时，你也可以直接执行一个默认搜索（例如，最近的或随机的）。当我问“最近有什么动漫”或“某个动漫有什么音乐”时，请你分析已有的资源数据来回答。在列出搜索结果时，请以简洁的“序号. 资源标题”格式呈现，不要包含链接，并询问我是否需要下载。如果结果数量很多，请列出前20项，并告诉我总共有多少项结果，以及如何查看更多（例如，输入'下一页'或'查看更多'）。如果我输入'download <序号>'或'download <序号1>,<序号2>'，你将直接执行下载。"},
+            {"role": "user", "parts": "当我询问“rss中都有哪些资源”、“你都加载了啥数据”、“有什么资源”这类宽泛问题时，请你直接调用 `get_overall_resource_summary` 工具来告诉我总数和一些随机示例，而**不要**反问我细致的条件。当我没有明确指定搜索条件时，你也可以直接执行一个默认搜索（例如，最近的或随机的）。当我问“最近有什么动漫”或“某个动漫有什么音乐”时，请你分析已有的资源数据来回答。在列出搜索结果时，请以简洁的“序号. 资源标题”格式呈现，不要包含链接，并询问我是否需要下载。如果结果数量很多，请列出前20项，并告诉我总共有多少项结果，以及如何查看更多（例如，输入'下一页'或'查看更多'）。翻页时请把上一次搜索返回的 next_cursor 作为 cursor 参数，其余搜索条件保持不变。如果我输入'download <序号>'或'download <序号1>,<序号2>'，你将直接执行下载。"},
             {"role": "model", "parts": "好的，我明白了。我将优化我的搜索和推荐方式，直接提供结果概要，并引导您下载。请问您想找些什么？例如，可以告诉我资源类型、动漫名称、歌手、歌曲类型、音质、分辨率等。您也可以问我“最近有什么新动漫”或“某个动漫有什么音乐”。"},
         ]) 
         print("\nAI 助手已启动，请开始提问！(输入 'exit' 退出, 'download #<num>' 下载)")
@@ -608,35 +712,43 @@ def main():
         print("错误: Gemini 元数据提取模型未初始化。请检查初始化步骤。")
         exit()
 
-    new_rss_update_times = {} 
-
     existing_unique_ids = {entry['unique_id'] for entry in ALL_AI_SEARCHABLE_ENTRIES}
+    existing_original_links = {entry.get('original_link') for entry in FULL_ENTRY_DETAILS_MAP.values()}
     
-    newly_analyzed_count = 0
+    newly_analyzed_entries = [] # 本次新分析的条目，预加载结束后增量写入条目库
+    analyzed_feed_urls = [] # 已完整分析的 Feed，待条目保存后再写入条件请求缓存和水位线
+
+    feeds_to_analyze = [] # [(feed_name, feed_url, 待分析条目)]，按配置中的顺序
 
     for feed_name, feed_url in CONFIG['rss_feeds'].items():
         print(f"  正在加载 {feed_name} ({feed_url})...")
         try:
             feed_entries_to_analyze = [] 
-            latest_entry_timestamp_from_file = RSS_LAST_UPDATE_TIMES.get(feed_name) 
             
-            feed = feedparser.parse(feed_url)
+            _, feed, fetch_error = fetch_feed(feed_name, feed_url)
+            if fetch_error:
+                print(f"  错误：加载或分析 RSS Feed '{feed_name}' 失败: {fetch_error}")
+                continue
+            if feed is None:
+                print(f"  '{feed_name}' 自上次加载后没有变化 (304 或内容相同)，跳过解析。")
+                continue
             if feed.bozo:
                 print(f"  警告: RSS Feed '{feed_name}' 解析错误: {feed.bozo_exception}")
             
-            current_feed_max_timestamp = None 
+            entries_after_watermark = []
             
-            for entry in feed.entries:
-                entry_datetime = None
-                if entry.get('published_parsed'):
-                    entry_datetime = datetime(*entry['published_parsed'][:6])
-                    if current_feed_max_timestamp is None or entry_datetime > current_feed_max_timestamp:
-                        current_feed_max_timestamp = entry_datetime
-
-                    if latest_entry_timestamp_from_file and entry_datetime <= latest_entry_timestamp_from_file:
-                        continue 
+            for entry in filter_entries_above_watermark(feed_name, feed.entries):
+                # 已分析过的条目无需再解析下载链接，不产生任何网络请求
+                if entry.get('link') in existing_original_links:
+                    continue
+
+                entries_after_watermark.append(entry)
+
+            # 通过共享连接池并发解析剩余条目的下载链接 (先查 original_link 缓存)
+            resolved_links = resolve_download_links(entries_after_watermark, CONFIG.get('dmhy_resolve_concurrency', DEFAULT_RESOLVE_CONCURRENCY))
 
-                actual_download_link = get_actual_download_link(entry)
+            for entry, resolved_link in zip(entries_after_watermark, resolved_links):
+                actual_download_link = resolved_link or entry.link
                 infohash = extract_infohash(actual_download_link)
                 
                 entry_unique_id = infohash if infohash else entry.link
@@ -654,57 +766,109 @@ def main():
                 })
 
             print(f"  '{feed_name}' 原始RSS条目加载完成，共 {len(feed_entries_to_analyze)} 条新条目待AI分析。")
+            feeds_to_analyze.append((feed_name, feed_url, feed_entries_to_analyze))
 
-            batch_size = 20 
-            for i in range(0, len(feed_entries_to_analyze), batch_size):
-                batch_entries = feed_entries_to_analyze[i:i + batch_size]
-                
-                print(f"    - '{feed_name}' 正在分析批次 {i // batch_size + 1} / {len(feed_entries_to_analyze) // batch_size + (1 if len(feed_entries_to_analyze) % batch_size else 0)} (条目 {i + 1} - {min(i + batch_size, len(feed_entries_to_analyze))})")
+        except LLMReplayMissError:
+            raise
+        except Exception as e:
+            print(f"  错误：加载或分析 RSS Feed '{feed_name}' 失败: {e}")
 
-                extracted_metadata_batch = extract_metadata_with_gemini_batch(batch_entries)
-                
-                for j, entry_data in enumerate(extracted_metadata_batch): 
-                    metadata = entry_data 
+    # 先用本地标题解析器处理，置信度不足的条目才交给 Gemini
+    local_parser_min_confidence = CONFIG.get('local_title_parser_min_confidence', DEFAULT_MIN_PARSE_CONFIDENCE) if CONFIG.get('local_title_parser_enabled', True) else None
+
+    # 所有 Feed 的批次一起提交到线程池，多个批次同时进行，速率由共享的 RPM/TPM 令牌桶控制
+    configure_gemini_quota(gemini_config.get('extraction_rpm', DEFAULT_GEMINI_RPM), gemini_config.get('extraction_tpm', DEFAULT_GEMINI_TPM))
+    extraction_concurrency = max(1, gemini_config.get('extraction_concurrency', DEFAULT_EXTRACTION_CONCURRENCY))
+    batch_token_budget = gemini_config.get('extraction_batch_token_budget', DEFAULT_METADATA_BATCH_TOKEN_BUDGET)
+    with ThreadPoolExecutor(max_workers=extraction_concurrency) as executor:
+        feed_batch_futures = []
+        for feed_name, feed_url, feed_entries_to_analyze in feeds_to_analyze:
+            feed_metadata = parse_metadata_locally(feed_entries_to_analyze, local_parser_min_confidence)
+            pending_positions = [position for position, metadata in enumerate(feed_metadata) if metadata is None]
+            if feed_entries_to_analyze:
+                print(f"  '{feed_name}' 本地解析 {len(feed_entries_to_analyze) - len(pending_positions)} 条，{len(pending_positions)} 条交给 Gemini 分析。")
+
+            batch_futures = [] # [(本批条目在 feed_entries_to_analyze 中的位置列表, 估算 token 数, future)]
+            batch_start = 0
+            for batch_entries in split_into_metadata_batches([feed_entries_to_analyze[position] for position in pending_positions], batch_token_budget):
+                batch_positions = pending_positions[batch_start:batch_start + len(batch_entries)]
+                batch_futures.append((batch_positions, estimate_metadata_batch_tokens(batch_entries), executor.submit(extract_metadata_with_gemini_batch, batch_entries)))
+                batch_start += len(batch_entries)
+            feed_batch_futures.append((feed_name, feed_url, feed_entries_to_analyze, feed_metadata, batch_futures))
+
+        # 按 Feed 和条目的原始顺序写入结果，条目加入 FULL_ENTRY_DETAILS_MAP 和索引的顺序与逐批处理时相同
+        for feed_name, feed_url, feed_entries_to_analyze, feed_metadata, batch_futures in feed_batch_futures:
+            try:
+                for batch_number, (batch_positions, batch_tokens, batch_future) in enumerate(batch_futures):
+                    for position, metadata in zip(batch_positions, batch_future.result()):
+                        feed_metadata[position] = metadata
+                    print(f"    - '{feed_name}' 批次 {batch_number + 1} / {len(batch_futures)} 分析完成 ({len(batch_positions)} 条，约 {batch_tokens} tokens)")
+
+                for j, metadata in enumerate(feed_metadata): 
                     if not metadata or not metadata.get('title'): 
-                         print(f"      警告: 批次 {i // batch_size + 1} 中条目 {j+1} 元数据提取为空或不完整。")
+                         print(f"      警告: 条目 {j+1} 元数据提取为空或不完整。")
                          metadata = {} 
                     
-                    current_entry_unique_id = feed_entries_to_analyze[i+j].get('infohash') 
+                    current_entry_unique_id = feed_entries_to_analyze[j].get('infohash') 
                     if not current_entry_unique_id:
-                        current_entry_unique_id = feed_entries_to_analyze[i+j].get('original_link')
+                        current_entry_unique_id = feed_entries_to_analyze[j].get('original_link')
 
                     if current_entry_unique_id:
-                        FULL_ENTRY_DETAILS_MAP[current_entry_unique_id] = {**feed_entries_to_analyze[i+j], "metadata": metadata}
+                        FULL_ENTRY_DETAILS_MAP[current_entry_unique_id] = {**feed_entries_to_analyze[j], "metadata": metadata}
+                        newly_analyzed_entries.append({"unique_id": current_entry_unique_id, **FULL_ENTRY_DETAILS_MAP[current_entry_unique_id]})
                         ALL_AI_SEARCHABLE_ENTRIES.append({
                             "unique_id": current_entry_unique_id,
-                            "title": feed_entries_to_analyze[i+j].get('title'),
-                            "published_parsed": feed_entries_to_analyze[i+j].get('published_parsed'),
+                            "title": feed_entries_to_analyze[j].get('title'),
+                            "published_parsed": feed_entries_to_analyze[j].get('published_parsed'),
                             "metadata": metadata
                         })
-                        newly_analyzed_count += 1 
+                        index_entry(len(ALL_AI_SEARCHABLE_ENTRIES) - 1, ALL_AI_SEARCHABLE_ENTRIES[-1])
+                        add_anime_title(metadata.get('anime_title'))
+                        add_entry_to_aggregates(len(ALL_AI_SEARCHABLE_ENTRIES) - 1, ALL_AI_SEARCHABLE_ENTRIES[-1], current_entry_unique_id in SEEN_TORRENTS)
                     else:
-                        print(f"      警告: 条目 '{feed_entries_to_analyze[i+j].get('title')}' 无法生成唯一ID，跳过AI分析后的存储。")
+                        print(f"      警告: 条目 '{feed_entries_to_analyze[j].get('title')}' 无法生成唯一ID，跳过AI分析后的存储。")
 
-            print(f"  '{feed_name}' AI分析完成，共 {len(feed_entries_to_analyze)} 条已分析。")
-            
-            if current_feed_max_timestamp:
-                new_rss_update_times[feed_name] = current_feed_max_timestamp 
+                print(f"  '{feed_name}' AI分析完成，共 {len(feed_entries_to_analyze)} 条已分析。")
+                analyzed_feed_urls.append((feed_name, feed_url))
 
-        except Exception as e:
-            print(f"  错误：加载或分析 RSS Feed '{feed_name}' 失败: {e}")
+            except LLMReplayMissError:
+                raise
+            except Exception as e:
+                print(f"  错误：分析 RSS Feed '{feed_name}' 失败: {e}")
     
-    if newly_analyzed_count > 0:
-        save_ai_analyzed_entries() 
-
-    RSS_LAST_UPDATE_TIMES.update(new_rss_update_times) 
+    if newly_analyzed_entries:
+        save_ai_analyzed_entries(newly_analyzed_entries) 
+
+    # 条目保存后才记录各 Feed 的 ETag/Last-Modified/正文哈希和水位线，避免中途退出导致新条目被跳过
+    for analyzed_feed_name, analyzed_feed_url in analyzed_feed_urls:
+        commit_feed_http_cache(analyzed_feed_url)
+        commit_feed_watermark(analyzed_feed_name)
+    save_feed_http_cache()
     save_rss_last_update_times()
 
     print(f"--- 所有 RSS Feed 预加载并分析完成，总共 {len(ALL_AI_SEARCHABLE_ENTRIES)} 个条目可供搜索。---")
+    if CONFIG.get('llm_replay', {}).get('mode', DEFAULT_LLM_REPLAY_MODE) != DEFAULT_LLM_REPLAY_MODE:
+        llm_replay_stats = get_llm_replay_stats()
+        print(f"  LLM 记录/回放: 命中 {llm_replay_stats['hits']} 次，未命中 {llm_replay_stats['misses']} 次，新记录 {llm_replay_stats['recorded']} 次。")
+
+    # 元数据缺失或不完整的条目 (包括以前运行留下的) 加入补全队列，对话空闲时在后台重新提取
+    reenrich_stop_event = threading.Event()
+    reenrich_config = CONFIG.get('reenrich', {})
+    enqueue_reenrichment(entry['unique_id'] for entry in ALL_AI_SEARCHABLE_ENTRIES if is_metadata_incomplete(entry.get('metadata')))
+    pending_reenrich_count = count_pending_reenrichment(REENRICH_MAX_ATTEMPTS)
+    if pending_reenrich_count and get_llm_replay_mode() == "replay":
+        # 补全请求何时发出取决于用户空闲时间，无法按记录重现；缺少记录时也只会在后台线程中失败
+        print(f"有 {pending_reenrich_count} 个条目的元数据不完整，回放模式下不进行后台补全。")
+    elif pending_reenrich_count and reenrich_config.get('enabled', True):
+        print(f"有 {pending_reenrich_count} 个条目的元数据不完整，将在对话空闲时于后台补全。")
+        threading.Thread(target=reenrich_entries_in_background, args=(reenrich_stop_event, reenrich_config), daemon=True).start()
 
     # --- 对话循环 ---
     while True:
         try:
             user_input = input("\n你: ")
+            LAST_USER_ACTIVITY_TIME = time.monotonic()
+            apply_reenriched_metadata()
             if user_input.lower().startswith('exit'):
                 print("AI: 再见！")
                 break
@@ -729,8 +893,9 @@ def main():
                         continue
                     
                     for idx in selected_indices:
-                        if 1 <= idx <= len(LAST_SEARCH_RESULTS):
-                            selected_search_result = LAST_SEARCH_RESULTS[idx - 1]
+                        page_position = idx - LAST_SEARCH_START_INDEX # 翻页后序号从偏移量开始编号
+                        if 1 <= page_position <= len(LAST_SEARCH_RESULTS):
+                            selected_search_result = LAST_SEARCH_RESULTS[page_position - 1]
                             selected_unique_id = selected_search_result["unique_id"] 
                             
                             full_entry_data = FULL_ENTRY_DETAILS_MAP.get(selected_unique_id)
@@ -781,8 +946,8 @@ def main():
 
                             print(f"\nAI: 准备下载 '{title}'...")
                             if add_and_verify_torrent(actual_download_link, default_path, default_tags, title, selected_unique_id): 
-                                SEEN_TORRENTS.add(selected_unique_id) 
-                                save_seen_torrents()
+                                record_seen_torrent(SEEN_TORRENTS, selected_unique_id)
+                                mark_entry_seen(selected_unique_id)
                             else:
                                 print(f"AI: 下载 '{title}' 失败。请检查日志或手动下载。")
                         else:
@@ -822,16 +987,16 @@ def main():
                         current_offset_after_search = search_results_dict.get('offset', 0)
                         current_limit_after_search = search_results_dict.get('limit', 0)
 
-                        tool_response_part = genai.protos.Part(
-                            function_response=genai.protos.FunctionResponse(
-                                name="search_rss_items",
-                                response={
-                                    "results": results_for_ai, 
-                                    "total_results": total_results,
-                                    "current_offset": current_offset_after_search,
-                                    "current_limit": current_limit_after_search
-                                }
-                            )
+                        tool_response_part = make_function_response_part(
+                            "search_rss_items",
+                            {
+                                "results": results_for_ai, 
+                                "total_results": total_results,
+                                "current_offset": current_offset_after_search,
+                                "current_limit": current_limit_after_search,
+                                "next_cursor": search_results_dict.get('next_cursor'),
+                                "matched_anime_titles": search_results_dict.get('matched_anime_titles', [])
+                            }
                         )
                         final_response_from_tool = CHAT_SESSION.send_message(tool_response_part)
                         
@@ -849,12 +1014,7 @@ def main():
                         args_dict = tool_call.args._asdict() if hasattr(tool_call.args, '_asdict') else dict(tool_call.args) 
                         results = list_recent_animes_with_music(**args_dict)
 
-                        tool_response_part = genai.protos.Part(
-                            function_response=genai.protos.FunctionResponse(
-                                name="list_recent_animes_with_music",
-                                response={"results": results}
-                            )
-                        )
+                        tool_response_part = make_function_response_part("list_recent_animes_with_music", {"results": results})
                         final_response_from_tool = CHAT_SESSION.send_message(tool_response_part)
                         
                         for final_part in final_response_from_tool.parts:
@@ -870,14 +1030,12 @@ def main():
                         args_dict = tool_call.args._asdict() if hasattr(tool_call.args, '_asdict') else dict(tool_call.args) 
                         summary_results = get_overall_resource_summary(**args_dict)
 
-                        tool_response_part = genai.protos.Part(
-                            function_response=genai.protos.FunctionResponse(
-                                name="get_overall_resource_summary",
-                                response={
-                                    "total_resources": summary_results["total_resources"], 
-                                    "example_titles": summary_results["example_titles"]
-                                }
-                            )
+                        tool_response_part = make_function_response_part(
+                            "get_overall_resource_summary",
+                            {
+                                "total_resources": summary_results["total_resources"], 
+                                "example_titles": summary_results["example_titles"]
+                            }
                         )
                         final_response_from_tool = CHAT_SESSION.send_message(tool_response_part)
                         
@@ -901,10 +1059,15 @@ def main():
         except KeyboardInterrupt:
             print("\nAI: 收到中断信号，退出对话。")
             break
+        except LLMReplayMissError:
+            raise
         except Exception as e:
             print(f"AI: 发生未知错误: {e}")
             print("AI: 请尝试重新开始对话。")
 
+    reenrich_stop_event.set()
+    save_seen_torrents()
+
     if QB_CLIENT:
         try:
             pass 
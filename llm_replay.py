@@ -0,0 +1,276 @@
+# -*- coding: utf-8 -*-
+"""
+Gemini 调用的记录/回放层 (元数据提取、下载决策和对话工具循环共用)。
+
+每次调用以 (模型名, 完整 prompt / 对话内容, 配置) 的规范化 JSON 的 sha256 为键，
+响应保存在 store_dir/<键前两位>/<键>.json，内容相同的请求只需付费一次。
+RSS Feed 和 dmhy 页面的响应也按 URL 记录在同一目录，回放时整个运行不访问网络。
+
+  - live: 直接调用 API，不读写记录 (默认)
+  - record: Gemini 已有记录时直接返回记录，否则调用 API 并写入记录；网页总是重新下载并覆盖记录。
+    开始时把状态文件 (已处理列表、水位线、各类缓存、条目库) 复制到 store_dir/state/<脚本名>/
+  - replay: 只读记录，不访问网络也不等待速率限制；没有记录时抛出 LLMReplayMissError。
+    状态文件从记录时的副本复制到临时目录后读写，每次回放的起点相同，也不修改用户的文件
+"""
+import atexit
+import base64
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+# --- 配置及文件路径 ---
+LLM_REPLAY_MODES = ("live", "record", "replay")
+DEFAULT_LLM_REPLAY_MODE = "live"
+DEFAULT_LLM_REPLAY_STORE_DIR = 'llm_replay_store'
+
+# --- 全局变量 ---
+LLM_REPLAY_MODE = DEFAULT_LLM_REPLAY_MODE
+LLM_REPLAY_STORE_DIR = DEFAULT_LLM_REPLAY_STORE_DIR
+LLM_REPLAY_STATS = {"hits": 0, "misses": 0, "recorded": 0}
+_LLM_REPLAY_STATS_LOCK = threading.Lock()
+
+
+class LLMReplayMissError(RuntimeError):
+    """回放模式下请求没有对应的记录。"""
+
+
+class ReplayedPart:
+    """与 genai 响应中的 Part 用法相同: 有 text 或 function_call (带 name 和 args)。"""
+    def __init__(self, part_data):
+        self.text = part_data.get('text', '')
+        function_call = part_data.get('function_call')
+        self.function_call = ReplayedFunctionCall(function_call['name'], function_call.get('args') or {}) if function_call else None
+
+
+class ReplayedFunctionCall:
+    def __init__(self, name, args):
+        self.name = name
+        self.args = args
+
+
+class ReplayedResponse:
+    """由记录还原的响应，提供调用方用到的 .text 和 .parts。"""
+    def __init__(self, parts_data):
+        self.parts = [ReplayedPart(part_data) for part_data in parts_data]
+        self.text = "".join(part.text for part in self.parts if part.text)
+
+
+# --- 配置 ---
+def configure_llm_replay(mode=DEFAULT_LLM_REPLAY_MODE, store_dir=DEFAULT_LLM_REPLAY_STORE_DIR):
+    global LLM_REPLAY_MODE, LLM_REPLAY_STORE_DIR
+    if mode not in LLM_REPLAY_MODES:
+        print(f"警告: 未知的 LLM 记录/回放模式 '{mode}'，使用 '{DEFAULT_LLM_REPLAY_MODE}'。可选: {', '.join(LLM_REPLAY_MODES)}")
+        mode = DEFAULT_LLM_REPLAY_MODE
+    LLM_REPLAY_MODE = mode
+    LLM_REPLAY_STORE_DIR = os.path.abspath(store_dir or DEFAULT_LLM_REPLAY_STORE_DIR) # 回放时会切换工作目录
+    with _LLM_REPLAY_STATS_LOCK:
+        LLM_REPLAY_STATS.update(hits=0, misses=0, recorded=0)
+
+def get_llm_replay_mode():
+    return LLM_REPLAY_MODE
+
+def prepare_llm_replay_state(state_name, state_files):
+    """
+    加载任何状态之前调用，state_files 为脚本以相对路径读写的状态文件。
+    record 模式: 把其中存在的文件复制到 store_dir/state/<state_name>/ (覆盖上一次的副本)。
+    replay 模式: 把该副本 (没有副本时为当前文件) 复制到新的临时目录并切换到该目录，退出时删除。
+    live 模式不做任何事。
+    """
+    snapshot_dir = os.path.join(LLM_REPLAY_STORE_DIR, 'state', state_name)
+    if LLM_REPLAY_MODE == "record":
+        shutil.rmtree(snapshot_dir, ignore_errors=True)
+        os.makedirs(snapshot_dir)
+        for state_file in state_files:
+            if os.path.exists(state_file):
+                shutil.copy2(state_file, snapshot_dir)
+        return
+    if LLM_REPLAY_MODE != "replay":
+        return
+
+    source_dir = snapshot_dir
+    if not os.path.isdir(snapshot_dir):
+        print(f"警告: 没有记录时的状态副本 '{snapshot_dir}'，回放从当前的状态文件开始。")
+        source_dir = os.getcwd()
+    original_dir = os.getcwd()
+    sandbox_dir = tempfile.mkdtemp(prefix='llm_replay_state_')
+    for state_file in state_files:
+        if os.path.exists(os.path.join(source_dir, state_file)):
+            shutil.copy2(os.path.join(source_dir, state_file), sandbox_dir)
+    os.chdir(sandbox_dir)
+
+    def remove_sandbox():
+        os.chdir(original_dir)
+        shutil.rmtree(sandbox_dir, ignore_errors=True)
+    atexit.register(remove_sandbox)
+    print(f"回放模式: 状态文件使用临时副本 ({sandbox_dir})，不会修改原文件。")
+
+def get_llm_replay_stats():
+    with _LLM_REPLAY_STATS_LOCK:
+        return dict(LLM_REPLAY_STATS)
+
+def _count(stat_name):
+    with _LLM_REPLAY_STATS_LOCK:
+        LLM_REPLAY_STATS[stat_name] += 1
+
+
+# --- 序列化 ---
+def _to_plain(value):
+    """把 proto 的 Map/Repeated 等容器转换为可 JSON 序列化的 dict/list。"""
+    if isinstance(value, (str, bytes, int, float, bool)) or value is None:
+        return value
+    if hasattr(value, 'items'):
+        return {str(k): _to_plain(v) for k, v in value.items()}
+    try:
+        return [_to_plain(v) for v in value]
+    except TypeError:
+        return str(value)
+
+def _serialize_part(part):
+    if isinstance(part, str):
+        return {"text": part}
+    if isinstance(part, dict):
+        return _to_plain(part)
+    function_call = getattr(part, 'function_call', None)
+    if function_call:
+        return {"function_call": {"name": function_call.name, "args": _to_plain(function_call.args)}}
+    return {"text": getattr(part, 'text', '') or ''}
+
+def serialize_response_parts(response):
+    """响应 (真实或回放的) -> [{"text": ...} / {"function_call": {"name", "args"}}]。"""
+    return [_serialize_part(part) for part in response.parts]
+
+def make_content(role, parts):
+    """对话历史中的一条消息: parts 可以是字符串、part dict 或它们的列表。"""
+    if not isinstance(parts, list):
+        parts = [parts]
+    return {"role": role, "parts": [_serialize_part(part) for part in parts]}
+
+def make_function_response_part(name, response):
+    """工具执行结果，作为 send_message 的参数发回模型。"""
+    return {"function_response": {"name": name, "response": _to_plain(response)}}
+
+def make_llm_replay_key(model_name, contents, config):
+    """(模型名, prompt 或对话内容, 配置) 的规范化 JSON 的 sha256。"""
+    fingerprint_source = json.dumps(
+        {"model": model_name, "contents": contents, "config": config},
+        ensure_ascii=False, sort_keys=True, separators=(',', ':'), default=str
+    )
+    return hashlib.sha256(fingerprint_source.encode('utf-8')).hexdigest()
+
+
+# --- 记录读写 ---
+def _record_path(key):
+    return os.path.join(LLM_REPLAY_STORE_DIR, key[:2], key + '.json')
+
+def _load_record(key):
+    try:
+        with open(_record_path(key), 'r', encoding='utf-8') as f:
+            return json.load(f).get('parts')
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        print(f"警告: 读取 LLM 记录 '{_record_path(key)}' 失败，视为没有记录: {e}")
+        return None
+
+def _write_record(key, record):
+    record_path = _record_path(key)
+    os.makedirs(os.path.dirname(record_path), exist_ok=True)
+    # 多个提取线程可能同时写入，临时文件名带线程编号
+    temp_file = f"{record_path}.{threading.get_ident()}.tmp"
+    with open(temp_file, 'w', encoding='utf-8') as f:
+        json.dump({**record, "recorded_at": time.time()}, f, ensure_ascii=False, indent=2, default=str)
+    os.replace(temp_file, record_path)
+
+def _save_record(key, model_name, contents, config, parts):
+    _write_record(key, {"model": model_name, "contents": contents, "config": config, "parts": parts})
+
+
+# --- 调用 ---
+def generate_content_with_replay(model, model_name, contents, generation_config=None, tools_signature=None, before_live_call=None, key_contents=None):
+    """
+    按当前模式调用 model.generate_content(contents, generation_config=...)。
+    before_live_call 只在真正访问 API 前调用 (例如等待速率限制)，回放命中时不会调用。
+    key_contents 不为 None 时代替 contents 计算记录的键 (记录中仍保存完整的 contents)。
+    """
+    config = {"generation_config": generation_config, "tools": tools_signature}
+    key = None
+    if LLM_REPLAY_MODE != "live":
+        key = make_llm_replay_key(model_name, contents if key_contents is None else key_contents, config)
+        parts = _load_record(key)
+        if parts is not None:
+            _count("hits")
+            return ReplayedResponse(parts)
+        _count("misses")
+        if LLM_REPLAY_MODE == "replay":
+            raise LLMReplayMissError(f"回放模式下没有该请求的记录 ({key[:12]}...)")
+
+    if before_live_call:
+        before_live_call()
+    if generation_config is not None:
+        response = model.generate_content(contents, generation_config=generation_config)
+    else:
+        response = model.generate_content(contents)
+
+    if LLM_REPLAY_MODE == "record":
+        _save_record(key, model_name, contents, config, serialize_response_parts(response))
+        _count("recorded")
+    return response
+
+
+def fetch_http_with_replay(url, fetch_live):
+    """
+    按当前模式获取网页 (RSS Feed、dmhy 页面)。fetch_live() 访问网络并返回
+    (状态码, 响应头 dict, 正文 bytes)，本函数返回相同的三元组。
+    record 模式总是访问网络并覆盖该 URL 的记录，回放重现最近一次记录的内容。
+    """
+    if LLM_REPLAY_MODE == "live":
+        return fetch_live()
+
+    key = make_llm_replay_key("http", url, None)
+    if LLM_REPLAY_MODE == "replay":
+        try:
+            with open(_record_path(key), 'r', encoding='utf-8') as f:
+                record = json.load(f)
+            return record['status_code'], record['headers'], base64.b64decode(record['body'])
+        except FileNotFoundError:
+            raise LLMReplayMissError(f"回放模式下没有网页 '{url}' 的记录 ({key[:12]}...)")
+
+    status_code, headers, body = fetch_live()
+    _write_record(key, {"url": url, "status_code": status_code, "headers": headers, "body": base64.b64encode(body).decode('ascii')})
+    return status_code, headers, body
+
+
+def _without_tool_results(contents):
+    """对话内容中的工具执行结果只保留工具名。"""
+    return [
+        {"role": content['role'], "parts": [
+            {"function_response": {"name": part['function_response']['name']}} if 'function_response' in part else part
+            for part in content['parts']
+        ]}
+        for content in contents
+    ]
+
+
+class ReplayChatSession:
+    """
+    CHAT_SESSION 的替代: 自己维护对话历史，每次 send_message 把完整历史 + 新消息
+    经 generate_content_with_replay 发送，因此对话也能逐轮记录和回放。
+    工具执行结果 (含随机推荐、随机示例和按当天日期筛选的结果) 不参与记录的键，
+    用户输入和模型的回复 (包括函数调用) 相同即可命中。
+    """
+    def __init__(self, model, model_name, history=None, tools_signature=None):
+        self.model = model
+        self.model_name = model_name
+        self.tools_signature = tools_signature
+        self.history = [make_content(content['role'], content['parts']) for content in history or []]
+
+    def send_message(self, message):
+        contents = self.history + [make_content("user", message)]
+        response = generate_content_with_replay(self.model, self.model_name, contents, tools_signature=self.tools_signature,
+                                                key_contents=_without_tool_results(contents))
+        self.history = contents + [{"role": "model", "parts": serialize_response_parts(response)}]
+        return response
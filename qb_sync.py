@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+import threading
+import time
+
+# --- 配置 ---
+DEFAULT_VERIFY_TIMEOUT = 10 # 等待新任务出现在 qBittorrent 中的最长秒数
+VERIFY_INITIAL_DELAY = 0.2
+VERIFY_MAX_DELAY = 2.0
+
+# --- 全局变量：qBittorrent 中种子 hash 的本地镜像 ---
+QB_SYNC_RID = 0 # /api/v2/sync/maindata 的增量响应 ID
+QB_KNOWN_HASHES = set()
+QB_MIRROR_READY = False
+_QB_SYNC_LOCK = threading.Lock()
+
+
+# --- 增量同步 ---
+def _request_main_data(qb, rid):
+    if hasattr(qb, 'sync_main_data'):
+        return qb.sync_main_data(rid=rid)
+    return qb._get('sync/maindata', params={'rid': rid})
+
+def sync_qb_torrents(qb):
+    """
+    通过 sync/maindata (基于 rid 的增量更新) 刷新本地 hash 镜像。
+    首次调用拿到完整列表，之后只传输变化部分。返回 True 表示同步成功。
+    """
+    global QB_SYNC_RID, QB_MIRROR_READY
+    with _QB_SYNC_LOCK:
+        try:
+            main_data = _request_main_data(qb, QB_SYNC_RID) or {}
+        except Exception as e:
+            print(f"  警告: 同步 qBittorrent 种子列表失败: {e}")
+            return False
+
+        if main_data.get('full_update'):
+            QB_KNOWN_HASHES.clear()
+        QB_KNOWN_HASHES.update(h.lower() for h in (main_data.get('torrents') or {}).keys())
+        QB_KNOWN_HASHES.difference_update(h.lower() for h in (main_data.get('torrents_removed') or []))
+        QB_SYNC_RID = main_data.get('rid', QB_SYNC_RID)
+        QB_MIRROR_READY = True
+        return True
+
+def _query_torrent_by_hash(qb, infohash):
+    """同步接口不可用时的后备方案：只按 hash 查询单个种子，不下载整个列表。"""
+    try:
+        return bool(qb.torrents(hashes=infohash))
+    except Exception as e:
+        print(f"  警告: 按 hash 查询 qBittorrent 失败: {e}")
+        return False
+
+
+# --- 去重与验证 ---
+def is_torrent_in_client(qb, infohash, refresh=False):
+    """判断 infohash 是否已在 qBittorrent 中 (使用本地镜像，必要时先增量同步)。没有连接 (qb 为 None，回放模式) 时返回 False。"""
+    if not infohash or qb is None:
+        return False
+    infohash = infohash.lower()
+    if refresh or not QB_MIRROR_READY:
+        if not sync_qb_torrents(qb):
+            return _query_torrent_by_hash(qb, infohash)
+    return infohash in QB_KNOWN_HASHES
+
+def wait_for_torrent(qb, infohash, timeout=DEFAULT_VERIFY_TIMEOUT):
+    """
+    添加任务后调用：以指数退避轮询增量同步，hash 一出现就返回 True，超时返回 False。
+    取代固定 sleep + 拉取完整 torrents() 列表的做法。
+    """
+    if not infohash:
+        return False
+    infohash = infohash.lower()
+    deadline = time.monotonic() + timeout
+    delay = VERIFY_INITIAL_DELAY
+    while True:
+        if sync_qb_torrents(qb):
+            if infohash in QB_KNOWN_HASHES:
+                return True
+        elif _query_torrent_by_hash(qb, infohash):
+            with _QB_SYNC_LOCK:
+                QB_KNOWN_HASHES.add(infohash)
+            return True
+
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return False
+        time.sleep(min(delay, remaining))
+        delay = min(delay * 2, VERIFY_MAX_DELAY)
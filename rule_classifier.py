@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+import re
+
+# --- 默认规则 (音乐资源筛选) ---
+# 每条规则: include 中的正则必须全部命中，exclude 中的正则一个都不能命中 (均忽略大小写)。
+# 规则按顺序匹配，第一条命中的规则给出决策；都不命中则交给 Gemini。
+DEFAULT_PRE_CLASSIFIER_RULES = [
+    {
+        "name": "fansub_episode",
+        "include": [r"\s-\s\d{1,3}(?:\.\d)?(?:v\d)?\s*(?:\[|【|\(|（|$)", r"1080p|720p|2160p|\b4K\b|WebRip|WEB-DL|HEVC|AVC|x26[45]"],
+        "exclude": [],
+        "action": "skip"
+    },
+    {
+        "name": "video_release",
+        "include": [r"\b(?:BDRip|WebRip|WEB-DL|BDMV|HEVC|x26[45])\b|\b(?:1080|720|2160)p\b"],
+        "exclude": [r"\bOST\b|原声|サウンドトラック|Soundtrack"],
+        "action": "skip"
+    },
+    {
+        "name": "hi_res_flac",
+        "include": [r"\[Hi-Res\]", r"\d{2,3}(?:\.\d)?kHz[/／]\d{2}bit", r"\[FLAC\]"],
+        "exclude": [r"1080p|720p|2160p|WebRip|BDRip"],
+        "action": "download",
+        "path": "/downloads/Music/FLAC",
+        "tags": ["音乐", "无损", "Hi-Res"]
+    },
+    {
+        "name": "flac",
+        "include": [r"\[FLAC\]"],
+        "exclude": [r"1080p|720p|2160p|WebRip|BDRip"],
+        "action": "download",
+        "path": "/downloads/Music/FLAC",
+        "tags": ["音乐", "无损"]
+    }
+]
+
+# --- 全局变量 ---
+COMPILED_PRE_CLASSIFIER_RULES = []
+PRE_CLASSIFIER_RULE_HITS = {} # {规则名: 命中次数}
+PRE_CLASSIFIER_MISSES = 0 # 没有规则命中的次数 (之后先查决策缓存，未命中才发给 Gemini)
+
+
+# --- 编译规则 ---
+def load_pre_classifier_rules(rules=None):
+    """编译规则列表 (为 None 时使用默认规则)，无效的规则会被跳过并打印警告。"""
+    global COMPILED_PRE_CLASSIFIER_RULES, PRE_CLASSIFIER_RULE_HITS, PRE_CLASSIFIER_MISSES
+    COMPILED_PRE_CLASSIFIER_RULES = []
+    PRE_CLASSIFIER_RULE_HITS = {}
+    PRE_CLASSIFIER_MISSES = 0
+
+    for i, rule in enumerate(DEFAULT_PRE_CLASSIFIER_RULES if rules is None else rules):
+        rule_name = rule.get('name') or f"rule_{i+1}"
+        action = rule.get('action')
+        if action not in ('download', 'skip'):
+            print(f"警告: 预分类规则 '{rule_name}' 的 action 无效 ({action})，已忽略。")
+            continue
+        if action == 'download' and not rule.get('path'):
+            print(f"警告: 预分类规则 '{rule_name}' 缺少 path，已忽略。")
+            continue
+        try:
+            include_patterns = [re.compile(p, re.IGNORECASE) for p in rule.get('include', [])]
+            exclude_patterns = [re.compile(p, re.IGNORECASE) for p in rule.get('exclude', [])]
+        except re.error as e:
+            print(f"警告: 预分类规则 '{rule_name}' 正则表达式无效: {e}，已忽略。")
+            continue
+        if not include_patterns:
+            print(f"警告: 预分类规则 '{rule_name}' 没有 include 条件，已忽略。")
+            continue
+
+        decision = {"action": action}
+        if action == 'download':
+            decision['path'] = rule['path']
+            decision['tags'] = list(rule.get('tags', []))
+        COMPILED_PRE_CLASSIFIER_RULES.append((rule_name, include_patterns, exclude_patterns, decision))
+        PRE_CLASSIFIER_RULE_HITS[rule_name] = 0
+
+# --- 分类 ---
+def classify_title(title):
+    """
+    用本地规则判断标题。命中时返回决策 (附带 'rule' 字段)，否则返回 None 表示需要交给 Gemini。
+    """
+    global PRE_CLASSIFIER_MISSES
+    if title:
+        for rule_name, include_patterns, exclude_patterns, decision in COMPILED_PRE_CLASSIFIER_RULES:
+            if all(p.search(title) for p in include_patterns) and not any(p.search(title) for p in exclude_patterns):
+                PRE_CLASSIFIER_RULE_HITS[rule_name] += 1
+                matched_decision = dict(decision, rule=rule_name)
+                if 'tags' in decision:
+                    matched_decision['tags'] = list(decision['tags'])
+                return matched_decision
+
+    PRE_CLASSIFIER_MISSES += 1
+    return None
+
+def get_pre_classifier_stats():
+    return {
+        "rule_hits": dict(PRE_CLASSIFIER_RULE_HITS),
+        "settled_locally": sum(PRE_CLASSIFIER_RULE_HITS.values()),
+        "not_settled_locally": PRE_CLASSIFIER_MISSES
+    }
@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from json.decoder import JSONDecodeError
+
+try:
+    import fcntl
+except ImportError: # Windows 上使用 msvcrt 加锁
+    fcntl = None
+    import msvcrt
+
+# --- 配置及文件路径 ---
+SEEN_TORRENTS_FILE = 'seen_torrents.json' # 快照 (JSON 列表，格式与旧版相同)
+SEEN_TORRENTS_JOURNAL_FILE = 'seen_torrents.journal' # 追加写日志，每行一条 JSON 记录
+SEEN_TORRENTS_LOCK_FILE = 'seen_torrents.lock' # 多个脚本同时运行时，读写快照和日志前先锁住这个文件
+SEEN_JOURNAL_COMPACT_THRESHOLD = 500 # 日志累计这么多条后合并回快照
+
+# --- 全局变量 ---
+_JOURNAL_RECORD_COUNT = 0
+_JOURNAL_LOCK = threading.Lock()
+
+
+# --- 跨进程文件锁 ---
+# auto_torrent_downloader.py (包括常驻模式) 和两个交互脚本共用快照和日志，
+# 追加、读取和合并都要在 seen_torrents.lock 的排他锁内进行，否则合并时会清掉其他进程刚追加的记录
+@contextmanager
+def _seen_files_lock():
+    with _JOURNAL_LOCK:
+        with open(SEEN_TORRENTS_LOCK_FILE, 'a+b') as lock_file:
+            if fcntl:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+            else:
+                lock_file.seek(0)
+                while True:
+                    try:
+                        msvcrt.locking(lock_file.fileno(), msvcrt.LK_LOCK, 1) # 约 10 秒后仍拿不到锁会抛出 OSError
+                        break
+                    except OSError:
+                        continue
+            try:
+                yield
+            finally:
+                if fcntl:
+                    fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+                else:
+                    lock_file.seek(0)
+                    msvcrt.locking(lock_file.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+# --- 加载：快照 + 回放日志 ---
+def _read_seen_files():
+    """读取快照和日志中的全部 ID，返回 (ID 集合, 日志记录数, 日志中是否有不完整的行)。调用方需持有文件锁。"""
+    seen_torrents = set()
+
+    if os.path.exists(SEEN_TORRENTS_FILE) and os.path.getsize(SEEN_TORRENTS_FILE) > 0:
+        try:
+            with open(SEEN_TORRENTS_FILE, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+                if isinstance(data, list):
+                    seen_torrents.update(data)
+        except JSONDecodeError:
+            print(f"警告: 无法解析文件 '{SEEN_TORRENTS_FILE}' (文件为空或JSON格式错误)。将只回放日志。")
+        except Exception as e:
+            print(f"警告: 读取文件 '{SEEN_TORRENTS_FILE}' 发生错误: {e}。将只回放日志。")
+
+    record_count = 0
+    found_broken_record = False
+    if os.path.exists(SEEN_TORRENTS_JOURNAL_FILE):
+        try:
+            with open(SEEN_TORRENTS_JOURNAL_FILE, 'r', encoding='utf-8') as f:
+                for line in f:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    try:
+                        record = json.loads(line)
+                    except JSONDecodeError:
+                        print(f"警告: 跳过 '{SEEN_TORRENTS_JOURNAL_FILE}' 中不完整的记录。")
+                        found_broken_record = True
+                        continue
+                    if isinstance(record, dict) and record.get('id'):
+                        seen_torrents.add(record['id'])
+                        record_count += 1
+        except Exception as e:
+            print(f"警告: 读取文件 '{SEEN_TORRENTS_JOURNAL_FILE}' 发生错误: {e}。")
+
+    return seen_torrents, record_count, found_broken_record
+
+def load_seen_torrent_set():
+    """
+    加载已处理的种子 ID 集合：先读 seen_torrents.json 快照，再按顺序回放 seen_torrents.journal。
+    快照损坏时仍会回放日志；日志末尾写了一半的行会被忽略。
+    """
+    global _JOURNAL_RECORD_COUNT
+    with _seen_files_lock():
+        seen_torrents, record_count, found_broken_record = _read_seen_files()
+        _JOURNAL_RECORD_COUNT = record_count
+        if found_broken_record:
+            # 立即合并，避免后续追加的记录和写了一半的行拼在同一行里
+            _compact_locked(seen_torrents)
+    return seen_torrents
+
+# --- 记录：每次决策只追加一行 ---
+def record_seen_torrent(seen_torrents, unique_id):
+    """把 unique_id 加入集合并追加到日志 (O(1) 写入)。日志过长时自动合并。"""
+    global _JOURNAL_RECORD_COUNT
+    if not unique_id:
+        return
+    with _seen_files_lock():
+        seen_torrents.add(unique_id)
+        with open(SEEN_TORRENTS_JOURNAL_FILE, 'a', encoding='utf-8') as f:
+            f.write(json.dumps({"id": unique_id, "ts": int(time.time())}, ensure_ascii=False) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+        _JOURNAL_RECORD_COUNT += 1
+        if _JOURNAL_RECORD_COUNT >= SEEN_JOURNAL_COMPACT_THRESHOLD:
+            _compact_locked(seen_torrents)
+
+# --- 合并：原子地重写快照并清空日志 ---
+def _compact_locked(seen_torrents):
+    global _JOURNAL_RECORD_COUNT
+    # 先并入其他进程在本进程加载之后写入快照或日志的 ID，再重写快照，清空日志时不会丢掉它们
+    seen_torrents.update(_read_seen_files()[0])
+
+    temp_file = SEEN_TORRENTS_FILE + '.tmp'
+    with open(temp_file, 'w', encoding='utf-8') as f:
+        json.dump(sorted(seen_torrents), f, ensure_ascii=False, indent=4)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temp_file, SEEN_TORRENTS_FILE)
+
+    with open(SEEN_TORRENTS_JOURNAL_FILE, 'w', encoding='utf-8'):
+        pass
+    _JOURNAL_RECORD_COUNT = 0
+
+def compact_seen_torrents(seen_torrents):
+    """
+    在文件锁内重新读取快照和日志并入当前集合，原子地写入 seen_torrents.json (先写临时文件再替换)，然后清空日志。
+    替换后、清空前崩溃只会留下重复记录，不会丢失数据。
+    """
+    with _seen_files_lock():
+        _compact_locked(seen_torrents)
@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+"""
+决策缓存键、全文索引和 Gemini 提取结果按标题对应共用的文本规范化，三处的规则始终一致。
+"""
+import html
+import re
+import unicodedata
+
+_HTML_TAG_PATTERN = re.compile(r'<[^>]*>')
+_WHITESPACE_PATTERN = re.compile(r'\s+')
+
+
+def normalize_text(text):
+    """去掉 HTML 标签和实体，NFKC 规范化 (全角 -> 半角) 并 casefold，连续空白合并为一个空格。"""
+    if not text:
+        return ''
+    text = html.unescape(_HTML_TAG_PATTERN.sub(' ', text))
+    text = unicodedata.normalize('NFKC', text).casefold()
+    return _WHITESPACE_PATTERN.sub(' ', text).strip()
@@ -0,0 +1,244 @@
+# -*- coding: utf-8 -*-
+"""
+发布标题的本地解析器，按资源站的命名惯例提取与 extract_metadata_with_gemini_batch 相同的字段
+(media_type / anime_title / song_type / quality / artists / resolution)，并给出置信度。
+置信度达到阈值的条目直接使用解析结果，其余仍交给 Gemini。
+
+作品名按 Gemini 提取时的约定处理: 去掉季数 / 篇章 / 原声集等修饰只保留系列名，能通过别名词典
+(anime_alias) 对应到中文标准名时使用标准名；仍是日文 (含假名或日文汉字) 的作品名需要 Gemini 翻译，置信度封顶在阈值以下。
+没有动画标记的原声集可能是动画也可能是游戏，同样交给 Gemini。
+
+支持的两类标题:
+  - 音乐: [Hi-Res][YYMMDD][中文名]TVアニメ『作品』OP主題歌「曲名」／歌手[96kHz/24bit][FLAC]
+  - 剧集: [字幕组] 作品名 / 别名 - 09 [WebRip 1080p HEVC-10bit AAC][简繁内封字幕]
+"""
+import re
+
+from anime_alias import canonical_anime_title, is_untranslated_title
+
+# --- 配置 ---
+DEFAULT_MIN_PARSE_CONFIDENCE = 0.7
+UNTRANSLATED_TITLE_MAX_CONFIDENCE = 0.5 # 作品名含假名或日文汉字 (没有中文名) 时的置信度上限
+AMBIGUOUS_SOUNDTRACK_MAX_CONFIDENCE = 0.5 # 没有动画/游戏标记的原声集的置信度上限
+
+# --- 正则 ---
+_LEADING_TAG_PATTERN = re.compile(r'^\[([^\[\]]*)\]\s*')
+_BROKEN_LEADING_TAG_PATTERN = re.compile(r'^([^\[\]]{1,10})\]\s*')
+_DATE_TAG_PATTERN = re.compile(r'^\d{6}$')
+_HI_RES_PATTERN = re.compile(r'Hi-Res|\d{2,3}(?:\.\d)?kHz\s*[/／]\s*\d{2}bit', re.IGNORECASE)
+_FLAC_PATTERN = re.compile(r'\bFLAC\b', re.IGNORECASE)
+_320K_PATTERN = re.compile(r'\b320K\b', re.IGNORECASE)
+_RESOLUTION_PATTERN = re.compile(r'\b(2160|1080|720|480)[pP]\b|\b(4K)\b')
+_EPISODE_PATTERN = re.compile(r'^(?P<name>.+?)\s+-\s+(?P<episode>\d{1,3}(?:\.\d)?)(?:v\d)?(?:\s*(?:END|完))?\s*(?:\[|【|\(|（|$)', re.IGNORECASE)
+_VIDEO_MARKER_PATTERN = re.compile(r'WebRip|WEB-DL|BDRip|BDMV|HEVC|AVC|x26[45]|\b(?:2160|1080|720)p\b', re.IGNORECASE)
+_MOVIE_MARKER_PATTERN = re.compile(r'剧场版|劇場版|Movie|映画', re.IGNORECASE)
+_WORK_TITLE_PATTERN = re.compile(r'『([^』]+)』')
+_SONG_TITLE_PATTERN = re.compile(r'「([^」]+)」')
+_ANIME_MARKER_PATTERN = re.compile(r'TVアニメ|アニメ|劇場版|剧场版|劇場編集版|映画|OVA|动画|番剧|特撮|ドラマ|Netflix Series|Original Series')
+_GAME_MARKER_PATTERN = re.compile(r'ゲーム|\bGame\b|游戏|手游|\bRPG\b', re.IGNORECASE)
+# 这些系列只出现在游戏原声中，不需要其他标记
+_GAME_FRANCHISE_PATTERN = re.compile(r'拳皇|KING OF FIGHTERS|三国无双|三國無双|英雄传说|英雄伝説|Falcom|FROMSOFTWARE|艾尔登法环|Elden Ring|DEATH STRANDING|死亡搁浅|Fate/Grand Order|\bFGO\b', re.IGNORECASE)
+_SOUNDTRACK_PATTERN = re.compile(r'Soundtrack|サウンドトラック|サントラ|(?<![A-Za-z])OST(?![A-Za-z])|原声', re.IGNORECASE)
+_CV_PATTERN = re.compile(r'[(（]CV[.．:：]\s*([^)）]+)[)）]')
+_ARTIST_SEPARATOR_PATTERN = re.compile(r'\s*(?:、|,|，|&|＆|×| x |/|／)\s*')
+_WORK_TITLE_SUFFIX_PATTERN = re.compile(
+    r'\s*(?:主题歌&原声集|OST原声集|原声集|OST|Vol\.?\s*\d+|season\s*\d+|第\s*[\d一二三四五六七八九十]+\s*[季期部]|\d+\s*期'
+    r'|\d+(?:st|nd|rd|th)\s*season|交响乐|歌曲集|\d*周年纪念专辑|纪念专辑|剧中歌专辑|角色歌专辑|春节曲|重制版'
+    r'|(?<=[一-鿿])\d+)$', re.IGNORECASE)
+_WORK_TITLE_PREFIX_PATTERN = re.compile(r'^(?:劇場版総集編|劇場版|剧场版|劇場編集版)\s*')
+_WORK_TITLE_SEGMENT_SEPARATOR_PATTERN = re.compile(r'\s+|[：:／/]')
+_LATIN_LETTER_PATTERN = re.compile(r'[A-Za-z]')
+_CJK_PATTERN = re.compile(r'[一-鿿]')
+_KANA_PATTERN = re.compile(r'[぀-ヿ]')
+
+# 歌曲类型关键词，按顺序匹配，第一个命中的为准
+_SONG_TYPE_PATTERNS = [
+    ("OP", re.compile(r'(?<![A-Za-z])OP(?![A-Za-z])|オープニング')),
+    ("ED", re.compile(r'(?<![A-Za-z])ED(?![A-Za-z])|エンディング')),
+    ("插入歌", re.compile(r'挿入歌|插入歌|插曲')),
+    ("OST", re.compile(r'サウンドトラック|Soundtrack|(?<![A-Za-z])OST(?![A-Za-z])|原声|劇伴', re.IGNORECASE)),
+    ("专辑", re.compile(r'Album|アルバム|专辑|ミニアルバム', re.IGNORECASE)),
+    ("单曲", re.compile(r'Single|シングル|单曲', re.IGNORECASE)),
+]
+
+
+# --- 辅助函数 ---
+def _split_leading_tags(title):
+    """拆出标题开头的 [..] 标签 (也容忍第一个标签缺少 '[' 的情况)，返回 (标签列表, 剩余部分)。"""
+    tags = []
+    rest = title.strip()
+    broken_tag_match = _BROKEN_LEADING_TAG_PATTERN.match(rest)
+    if broken_tag_match:
+        tags.append(broken_tag_match.group(1).strip())
+        rest = rest[broken_tag_match.end():]
+    while True:
+        match = _LEADING_TAG_PATTERN.match(rest)
+        if not match:
+            return tags, rest
+        tags.append(match.group(1).strip())
+        rest = rest[match.end():]
+
+def _detect_quality(title):
+    if _HI_RES_PATTERN.search(title):
+        return "Hi-Res"
+    if _FLAC_PATTERN.search(title):
+        return "FLAC"
+    if _320K_PATTERN.search(title):
+        return "320K"
+    return None
+
+def _detect_song_type(text):
+    for song_type, pattern in _SONG_TYPE_PATTERNS:
+        if pattern.search(text):
+            return song_type
+    return None
+
+def _split_artists(text):
+    text = re.sub(r'^(?:音楽|音乐|Music|作曲)\s*[:：]\s*', '', text.strip(), flags=re.IGNORECASE)
+    text = re.split(r'[\[【]', text)[0]
+    artists = [artist.strip(' 　-') for artist in _ARTIST_SEPARATOR_PATTERN.split(text)]
+    return [artist for artist in artists if artist]
+
+def _strip_work_title_suffixes(name):
+    while True:
+        cleaned = _WORK_TITLE_SUFFIX_PATTERN.sub('', name).strip(' -~～')
+        if cleaned == name or not cleaned:
+            return name
+        name = cleaned
+
+def _clean_work_title(name):
+    """
+    得到系列名: 标签中带『』时取其中的名称，去掉 剧场版 / 季数 / OST原声集 / 交响乐 等修饰，
+    中文名后面跟着的篇章名、副标题或其他语言的名称 (以空格、冒号或斜杠分隔) 也去掉。
+    """
+    work_match = _WORK_TITLE_PATTERN.search(name)
+    if work_match:
+        name = work_match.group(1)
+    name = _strip_work_title_suffixes(_WORK_TITLE_PREFIX_PATTERN.sub('', name.strip()))
+    segments = [segment for segment in _WORK_TITLE_SEGMENT_SEPARATOR_PATTERN.split(name) if segment]
+    first_segment = segments[0] if segments else ''
+    if (len(segments) > 1 and len(first_segment) >= 2 and _CJK_PATTERN.search(first_segment)
+            and not _KANA_PATTERN.search(first_segment) and not _LATIN_LETTER_PATTERN.search(first_segment)):
+        name = _strip_work_title_suffixes(first_segment)
+    return name
+
+def _finalize_anime_title(anime_title, confidence):
+    """能对应到别名词典的名称换成中文标准名；仍是日文的名称需要 Gemini 翻译，置信度封顶。"""
+    if not anime_title:
+        return anime_title, confidence
+    anime_title = canonical_anime_title(anime_title) or anime_title
+    if is_untranslated_title(anime_title):
+        confidence = min(confidence, UNTRANSLATED_TITLE_MAX_CONFIDENCE)
+    return anime_title, confidence
+
+def _is_chinese_name(tag):
+    """中文作品名标签 (例如 [赛马娘])：含汉字、不含假名，且不是日期/音质标签。"""
+    return bool(_CJK_PATTERN.search(tag)) and not _KANA_PATTERN.search(tag) and not _DATE_TAG_PATTERN.match(tag)
+
+
+# --- 解析 ---
+def _parse_episode_title(title, tags, rest):
+    match = _EPISODE_PATTERN.match(rest)
+    if not match or not _VIDEO_MARKER_PATTERN.search(title):
+        return None
+    names = [_clean_work_title(name) for name in re.split(r'\s+/\s+', match.group('name'))]
+    resolution_match = _RESOLUTION_PATTERN.search(title)
+    resolution = (resolution_match.group(1) + 'p' if resolution_match.group(1) else '4K') if resolution_match else None
+    metadata = {
+        "title": title,
+        "media_type": "动漫电影" if _MOVIE_MARKER_PATTERN.search(match.group('name')) else "动漫剧集",
+        "anime_title": names[0] or None,
+        "song_type": None,
+        "quality": None,
+        "artists": None,
+        "resolution": resolution
+    }
+    confidence = 0.5 + (0.2 if tags else 0) + (0.2 if resolution else 0) + (0.1 if names[0] else 0)
+    metadata['anime_title'], confidence = _finalize_anime_title(metadata['anime_title'], confidence)
+    return metadata, confidence
+
+def _parse_music_title(title, tags, rest):
+    quality = _detect_quality(title)
+    work_match = _WORK_TITLE_PATTERN.search(rest)
+    song_match = _SONG_TITLE_PATTERN.search(rest)
+    song_type = _detect_song_type(rest)
+    if not (quality or song_type or song_match):
+        return None
+
+    chinese_names = [tag for tag in tags if _is_chinese_name(tag)]
+    has_anime_marker = bool(_ANIME_MARKER_PATTERN.search(rest) or chinese_names)
+    is_game = bool(_GAME_FRANCHISE_PATTERN.search(title)) or (
+        bool(_GAME_MARKER_PATTERN.search(title)) and not _ANIME_MARKER_PATTERN.search(rest))
+    # 原声集只有中文名标签、没有动画标记时，可能是动画也可能是游戏
+    is_ambiguous_soundtrack = (not is_game and bool(_SOUNDTRACK_PATTERN.search(rest))
+                               and not _ANIME_MARKER_PATTERN.search(rest))
+
+    # 作品名: 优先使用中文名标签 (与 Gemini 提取时优先中文名的约定一致)，否则取『』中的名称
+    anime_title = None
+    if not is_game:
+        if chinese_names:
+            anime_title = _clean_work_title(chinese_names[0])
+        elif work_match:
+            anime_title = _clean_work_title(work_match.group(1))
+
+    # 艺术家: 「曲名」之后的 ／ 部分，其次是 (CV.声优)，再次是「」之前不属于作品名的部分
+    artists = []
+    tail = rest[song_match.end():] if song_match else rest
+    slash_match = re.search(r'[／/]\s*([^\[【]+)', tail)
+    if slash_match:
+        artists = _split_artists(slash_match.group(1))
+    if not artists:
+        artists = [name.strip() for name in _CV_PATTERN.findall(rest)]
+    if not artists and song_match:
+        head = rest[:song_match.start()]
+        if work_match and work_match.start() < song_match.start():
+            head = rest[work_match.end():song_match.start()]
+        head = re.sub(r'TVアニメ|アニメ|\d+(?:st|nd|rd|th)\s*(?:Single|Album)|Best Album|Album|Single|シングル|アルバム|OP|ED|主題歌|主题歌|テーマ|挿入歌', ' ', head, flags=re.IGNORECASE)
+        artists = _split_artists(head)
+
+    if is_game:
+        media_type = "游戏"
+    elif anime_title and has_anime_marker:
+        media_type = "动漫音乐"
+    elif anime_title:
+        media_type = "动漫音乐" # 『作品』通常是动画/游戏作品名
+    else:
+        media_type = "其他"
+
+    metadata = {
+        "title": title,
+        "media_type": media_type,
+        "anime_title": anime_title,
+        "song_type": song_type or ("其他" if anime_title and song_match else None),
+        "quality": quality,
+        "artists": artists or None,
+        "resolution": None
+    }
+
+    confidence = 0.0
+    if anime_title and has_anime_marker:
+        confidence += 0.5
+    elif anime_title or is_game:
+        confidence += 0.3
+    if quality:
+        confidence += 0.2
+    if song_type:
+        confidence += 0.15
+    if artists:
+        confidence += 0.15
+    confidence = min(confidence, 1.0)
+    if is_ambiguous_soundtrack:
+        confidence = min(confidence, AMBIGUOUS_SOUNDTRACK_MAX_CONFIDENCE)
+    metadata['anime_title'], confidence = _finalize_anime_title(anime_title, confidence)
+    return metadata, confidence
+
+def parse_release_title(title):
+    """
+    解析发布标题，返回 (metadata, confidence)。metadata 包含提取 prompt 要求的全部字段，
+    confidence 在 0 到 1 之间；无法识别的标题返回 ({}, 0.0)。
+    """
+    if not title:
+        return {}, 0.0
+    tags, rest = _split_leading_tags(title)
+    parsed = _parse_episode_title(title, tags, rest) or _parse_music_title(title, tags, rest)
+    return parsed if parsed else ({}, 0.0)